@@ -0,0 +1,216 @@
+import asyncio
+import time
+from device import batch_length
+from line_protocol import batch_to_line_protocol
+from latency import LatencyHistogram
+from pipeline import reset_peak_rss, peak_rss_mb
+from sensors import (
+    INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET,
+    DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME,
+    columnar_batch_to_copy_binary
+)
+
+# Dipendenze opzionali: il client asincrono di InfluxDB (influxdb-client[async], basato su aiohttp)
+# e asyncpg per TimescaleDB. Senza di esse il motore asincrono non è disponibile.
+try:
+    from influxdb_client import WritePrecision
+    from influxdb_client.client.influxdb_client_async import InfluxDBClientAsync
+except ImportError:
+    InfluxDBClientAsync = None
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+
+"""  CONNESSIONI ASINCRONE  """
+
+async def connect_to_influx_async(in_flight):
+    """
+    Crea il client asincrono di InfluxDB con un pool di almeno `in_flight` connessioni HTTP
+    e ne verifica lo stato. Ritorna il client oppure None in caso di fallimento.
+    """
+    if InfluxDBClientAsync is None:
+        print("Client asincrono InfluxDB non disponibile: installare influxdb-client[async].")
+        return None
+
+    client = None
+    try:
+        client = InfluxDBClientAsync(
+            url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG,
+            connection_pool_maxsize=max(in_flight, 1)
+        )
+        if not await client.ping():
+            raise ConnectionError("ping fallito")
+        print("Connessione asincrona a InfluxDB riuscita.")
+        return client
+    except Exception as e:
+        print(f"Errore durante la connessione asincrona a InfluxDB: {e}")
+        if client:
+            await client.close()
+        return None
+
+
+async def connect_to_timescale_async(in_flight):
+    """
+    Crea un pool asyncpg di `in_flight` connessioni a TimescaleDB.
+    PostgreSQL esegue un solo comando alla volta per connessione, quindi la
+    profondità in volo si ottiene con altrettante connessioni del pool.
+    Ritorna il pool oppure None in caso di fallimento.
+    """
+    if asyncpg is None:
+        print("Driver asyncpg non disponibile: installare asyncpg.")
+        return None
+
+    try:
+        pool = await asyncpg.create_pool(
+            user=DB_USER, password=DB_PASSWORD, host=DB_HOST,
+            port=DB_PORT, database=DB_NAME,
+            min_size=in_flight, max_size=in_flight
+        )
+        print("Connessione asincrona a TimescaleDB riuscita.")
+        return pool
+    except Exception as e:
+        print(f"Errore durante la connessione asincrona a TimescaleDB: {e}")
+        return None
+
+
+"""  MOTORE DI INSERIMENTO  """
+
+async def pump_batches(batches, serialize, send, in_flight, histogram=None):
+    """
+    Invia lo stream di batch mantenendo al massimo `in_flight` invii contemporanei.
+    Ogni batch viene serializzato mentre i precedenti sono ancora in volo, così
+    la serializzazione si sovrappone ai round-trip di rete.
+
+    Parametri:
+        - batches: iterabile di batch colonnari
+        - serialize: funzione batch --> payload
+        - send: coroutine payload --> None, solleva un'eccezione in caso di errore
+        - in_flight: numero massimo di batch in volo
+        - histogram: LatencyHistogram opzionale in cui registrare la durata di ogni invio
+
+    Ritorna:
+        - Tupla (record confermati, record falliti)
+    """
+    semaphore = asyncio.Semaphore(in_flight)
+    pending = set()
+    counters = {"acknowledged": 0, "failed": 0}
+
+    async def send_one(payload, num_records):
+        try:
+            send_start = time.perf_counter()
+            await send(payload)
+            if histogram is not None:
+                histogram.record(time.perf_counter() - send_start)
+            counters["acknowledged"] += num_records
+        except Exception as e:
+            print(f"Errore durante l'invio asincrono di un batch: {e}")
+            counters["failed"] += num_records
+        finally:
+            semaphore.release()
+
+    for batch in batches:
+        await semaphore.acquire()
+        payload = serialize(batch)
+        task = asyncio.create_task(send_one(payload, batch_length(batch)))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.gather(*pending)
+
+    return counters["acknowledged"], counters["failed"]
+
+
+async def ingest_influx_async(batches, in_flight, histogram=None):
+    """
+    Inserisce lo stream in InfluxDB con il client asincrono (payload line protocol).
+    Ritorna (record confermati, record falliti, durata) oppure None se la connessione fallisce.
+    """
+    client = await connect_to_influx_async(in_flight)
+    if not client:
+        return None
+
+    try:
+        write_api = client.write_api()
+
+        async def send(payload):
+            if not await write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=payload,
+                                         write_precision=WritePrecision.NS):
+                raise RuntimeError("scrittura non confermata da InfluxDB")
+
+        start_time = time.perf_counter()
+        acknowledged, failed = await pump_batches(batches, batch_to_line_protocol, send, in_flight, histogram)
+        return acknowledged, failed, time.perf_counter() - start_time
+    finally:
+        await client.close()
+
+
+async def ingest_timescale_async(batches, in_flight, histogram=None):
+    """
+    Inserisce lo stream in TimescaleDB con asyncpg tramite COPY binario
+    (stesso formato di columnar_batch_to_copy_binary).
+    Ritorna (record confermati, record falliti, durata) oppure None se la connessione fallisce.
+    """
+    pool = await connect_to_timescale_async(in_flight)
+    if not pool:
+        return None
+
+    try:
+        async def send(payload):
+            async with pool.acquire() as conn:
+                await conn.copy_to_table(
+                    "sensors", source=payload, format="binary",
+                    columns=["time", "device", "temperature", "humidity"]
+                )
+
+        start_time = time.perf_counter()
+        acknowledged, failed = await pump_batches(batches, columnar_batch_to_copy_binary, send, in_flight, histogram)
+        return acknowledged, failed, time.perf_counter() - start_time
+    finally:
+        await pool.close()
+
+
+def run_async_test(database_name, num_records_generated, batches, in_flight):
+    """
+    Esegue il test di inserimento asincrono per 'InfluxDB' o 'TimescaleDB' con
+    `in_flight` batch in volo. Ritorna il dizionario delle metriche (stesso formato
+    di run_influx_test/run_timescale_test) oppure None se il test non è andato a buon fine.
+    """
+    ingest = ingest_influx_async if database_name == 'InfluxDB' else ingest_timescale_async
+
+    print(f"\n Avvio inserimento asincrono in {database_name} ({in_flight} batch in volo) per {num_records_generated} record...")
+
+    reset_peak_rss()
+    latency_histogram = LatencyHistogram()
+
+    try:
+        outcome = asyncio.run(ingest(batches, in_flight, latency_histogram))
+    except Exception as e:
+        print(f"Errore durante l'inserimento asincrono in {database_name}: {e}")
+        return None
+
+    if outcome is None:
+        print(f"Connessione asincrona a {database_name} fallita, test saltato")
+        return None
+
+    acknowledged, failed, duration = outcome
+    throughput = acknowledged / duration if duration > 0 else 0
+    peak_rss = peak_rss_mb()
+    print(f" {database_name} (async x{in_flight}) --> Completato. Tempo: {duration:.2f} s, Throughput: {throughput:.2f} r/s, Picco RSS: {peak_rss:.1f} MB")
+
+    return {
+        'database': database_name,
+        'ingest_mode': 'async',
+        'serializer': 'line_protocol' if database_name == 'InfluxDB' else None,
+        'duration': duration,
+        'throughput': throughput,
+        'records_sent': acknowledged,
+        'records_failed': failed,
+        'peak_rss_mb': peak_rss,
+        'in_flight': in_flight,
+        **latency_histogram.summary(),
+        'latency_histogram': latency_histogram
+    }
@@ -0,0 +1,262 @@
+"""
+Benchmark di cardinalità delle serie: throughput di inserimento, memoria del client e del
+server e latenza delle query al crescere del numero di serie distinte.
+
+La cardinalità varia su una sola dimensione, il numero di device: lo schema dei dati ha un
+unico tag (device nel measurement sensor_data di InfluxDB, colonna device della tabella sensors
+di TimescaleDB), quindi il numero di serie coincide con il numero di device (per campo).
+Combinazioni di più tag (es. regione o modello) non sono misurate: richiederebbero colonne
+aggiuntive nello schema di sensors e nella serializzazione di entrambi i backend.
+"""
+import math
+import os
+import time
+from datetime import datetime, timezone
+import requests
+from device import create_device_ids, datetime_to_ns, ns_to_rfc3339
+from graphs_datapoints import analyze_and_plot_cardinality
+from latency import LatencyHistogram
+from pipeline import generate_stream, batch_stream
+from query_load import SESSION_FACTORIES
+from results_store import get_results_store, module_config
+from sensors import INFLUX_URL, INFLUX_TOKEN
+from ingest_runner import run_backend_test, scalar_metrics, BATCH_SIZE
+from null_sink import NULL_SINK_MODE
+
+
+# Parametri del benchmark di cardinalità
+
+# Numero di device (serie) distinti per ogni livello. I livelli vanno eseguiti in ordine
+# crescente su bucket e tabella vuoti: gli id sono annidati (sensor_1 ... sensor_N), quindi
+# dopo ogni livello il numero totale di serie nel database coincide con la cardinalità corrente.
+CARDINALITIES = [10, 1_000, 100_000, 1_000_000]
+
+# Record inseriti per livello: almeno uno per serie, e mai meno di MIN_RECORDS_PER_LEVEL
+# così che il throughput dei livelli bassi sia misurato su un volume confrontabile
+MIN_RECORDS_PER_LEVEL = 1_000_000
+RECORDS_PER_SERIES = 1
+
+SEED = 42
+INTERVAL_MS = 1
+
+# Modalità di inserimento: sincrona per InfluxDB, così i dati sono interrogabili appena l'invio termina
+INFLUX_WRITE_MODE = "synchronous"
+TIMESCALE_INGEST_MODE = "copy_binary"
+
+# Esecuzioni di ogni query dopo l'inserimento di un livello
+QUERY_REPEATS = 5
+
+
+# Query sensibili alla cardinalità, limitate all'intervallo temporale del livello
+CARDINALITY_QUERIES_FLUX = {
+    "last_point_per_device": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r._measurement == "sensor_data" and r._field == "temperature")
+          |> last()
+    ''',
+    "mean_per_device": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r._measurement == "sensor_data" and r._field == "temperature")
+          |> mean()
+    ''',
+    "distinct_devices": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r._measurement == "sensor_data" and r._field == "temperature")
+          |> keep(columns: ["device"])
+          |> group()
+          |> distinct(column: "device")
+          |> count()
+    ''',
+}
+
+CARDINALITY_QUERIES_TS = {
+    "last_point_per_device": '''
+        SELECT DISTINCT ON (device) device, time, temperature
+        FROM sensors
+        WHERE time >= '{start}' AND time < '{stop}'
+        ORDER BY device, time DESC;
+    ''',
+    "mean_per_device": '''
+        SELECT device, AVG(temperature)
+        FROM sensors
+        WHERE time >= '{start}' AND time < '{stop}'
+        GROUP BY device;
+    ''',
+    "distinct_devices": '''
+        SELECT COUNT(DISTINCT device)
+        FROM sensors
+        WHERE time >= '{start}' AND time < '{stop}';
+    ''',
+}
+
+
+def records_for_cardinality(cardinality):
+    """
+    Numero di record da inserire per il livello di cardinalità indicato.
+    """
+    return max(MIN_RECORDS_PER_LEVEL, cardinality * RECORDS_PER_SERIES)
+
+
+"""  MEMORIA LATO SERVER  """
+
+def influx_heap_bytes():
+    """
+    Legge dall'endpoint /metrics di InfluxDB la memoria heap in uso dal server
+    (go_memstats_heap_inuse_bytes). Ritorna None se non disponibile.
+    """
+    try:
+        response = requests.get(f"{INFLUX_URL}/metrics", headers={"Authorization": f"Token {INFLUX_TOKEN}"}, timeout=10)
+        response.raise_for_status()
+        for line in response.text.splitlines():
+            if line.startswith("go_memstats_heap_inuse_bytes "):
+                return float(line.split()[1])
+    except Exception as e:
+        print(f"Impossibile leggere le metriche di InfluxDB: {e}")
+    return None
+
+
+def timescale_storage_bytes():
+    """
+    Ritorna (dimensione totale, dimensione degli indici) in byte della hypertable sensors,
+    oppure (None, None) se non disponibile.
+    """
+    try:
+        execute, close = SESSION_FACTORIES['TimescaleDB']()
+        try:
+            rows = execute("SELECT total_bytes, index_bytes FROM hypertable_detailed_size('sensors');")
+        finally:
+            close()
+        return rows[0] if rows else (None, None)
+    except Exception as e:
+        print(f"Impossibile leggere la dimensione della hypertable: {e}")
+        return None, None
+
+
+def server_memory_metrics(database_name):
+    """
+    Metriche di memoria e spazio lato server dopo l'inserimento di un livello.
+    """
+    if database_name == 'InfluxDB':
+        return {'server_heap_bytes': influx_heap_bytes()}
+    total_bytes, index_bytes = timescale_storage_bytes()
+    return {'server_total_bytes': total_bytes, 'server_index_bytes': index_bytes}
+
+
+"""  QUERY PER LIVELLO  """
+
+def run_cardinality_queries(database_name, start_ns, stop_ns):
+    """
+    Esegue QUERY_REPEATS volte ogni query di cardinalità sull'intervallo [start_ns, stop_ns)
+    con una sessione dedicata. Ritorna il dizionario delle metriche di latenza
+    con chiavi '<query>_p50_ms' ecc.
+    """
+    bucket = os.getenv("INFLUX_BUCKET")
+    templates = CARDINALITY_QUERIES_FLUX if database_name == 'InfluxDB' else CARDINALITY_QUERIES_TS
+    start, stop = ns_to_rfc3339(start_ns), ns_to_rfc3339(stop_ns)
+
+    try:
+        execute, close = SESSION_FACTORIES[database_name]()
+    except Exception as e:
+        print(f"Errore di connessione per le query di cardinalità ({database_name}): {e}")
+        return {}
+
+    metrics = {}
+    try:
+        for name, template in templates.items():
+            query = template.format(bucket=bucket, start=start, stop=stop)
+            histogram = LatencyHistogram()
+            for _ in range(QUERY_REPEATS):
+                query_start = time.perf_counter()
+                try:
+                    execute(query)
+                except Exception as e:
+                    print(f"Errore durante la query '{name}' ({database_name}): {e}")
+                    continue
+                histogram.record(time.perf_counter() - query_start)
+            metrics.update(histogram.summary(name))
+            print(f"  '{name}': p50 {metrics[f'{name}_p50_ms'] or 0:.1f} ms")
+    finally:
+        close()
+
+    return metrics
+
+
+"""  SWEEP DI CARDINALITÀ  """
+
+def run_cardinality_level(database_name, cardinality, start_ns, null_sink=None):
+    """
+    Inserisce il livello di cardinalità indicato (device assegnati a rotazione, così
+    ogni serie compare) e misura throughput, memoria del client, memoria lato server
+    e latenza delle query sul solo intervallo temporale del livello.
+    Ritorna il dizionario delle metriche oppure None se l'inserimento fallisce.
+    """
+    num_records = records_for_cardinality(cardinality)
+    mode = INFLUX_WRITE_MODE if database_name == 'InfluxDB' else TIMESCALE_INGEST_MODE
+    print(f"\n------ Cardinalità {cardinality} su {database_name}: {num_records} record ------")
+
+    chunks = generate_stream(
+        num_records, start_ns, SEED, cardinality, interval_ms=INTERVAL_MS,
+        devices=create_device_ids(cardinality), cycle_devices=True
+    )
+    metrics = run_backend_test(database_name, num_records, batch_stream(chunks, BATCH_SIZE), mode, null_sink=null_sink)
+    if not metrics:
+        return None
+
+    # Stessi nomi di colonna della tabella 'performance'
+    metrics = scalar_metrics(metrics)
+    metrics['duration_seconds'] = metrics.pop('duration')
+    metrics['throughput_records_per_second'] = metrics.pop('throughput')
+    metrics['cardinality'] = cardinality
+    metrics['num_records'] = num_records
+
+    if not null_sink:
+        stop_ns = start_ns + num_records * INTERVAL_MS * 1_000_000
+        metrics.update(server_memory_metrics(database_name))
+        metrics.update(run_cardinality_queries(database_name, start_ns, stop_ns))
+
+    return metrics
+
+
+def run_cardinality_sweep(database_name, null_sink=None):
+    """
+    Esegue i livelli di CARDINALITIES in ordine crescente su un backend.
+    Ogni livello occupa un intervallo temporale distinto, così le query di un livello
+    leggono solo i suoi dati. Ritorna la lista delle metriche per livello.
+    """
+    level_span_ns = max(records_for_cardinality(c) for c in CARDINALITIES) * INTERVAL_MS * 1_000_000
+    # Intervallo tra l'inizio di due livelli arrotondato all'ora successiva
+    level_spacing_ns = math.ceil(level_span_ns / 3_600_000_000_000 + 1) * 3_600_000_000_000
+    sweep_start_ns = datetime_to_ns(datetime.now(timezone.utc)) - len(CARDINALITIES) * level_spacing_ns
+
+    results = []
+    for index, cardinality in enumerate(sorted(CARDINALITIES)):
+        metrics = run_cardinality_level(
+            database_name, cardinality, sweep_start_ns + index * level_spacing_ns, null_sink
+        )
+        if metrics:
+            results.append(metrics)
+    return results
+
+
+def main():
+    """
+    Esegue lo sweep di cardinalità su entrambi i database e salva i risultati
+    nella tabella 'cardinality' dell'archivio dei risultati.
+    """
+    results_store = get_results_store()
+    results_store.begin_run('cardinality', module_config(globals()))
+
+    for database_name in ('InfluxDB', 'TimescaleDB'):
+        for metrics in run_cardinality_sweep(database_name, NULL_SINK_MODE):
+            results_store.add('cardinality', metrics)
+
+    results_store.flush()
+    print("\n Benchmark di cardinalità completato.")
+
+
+if __name__ == "__main__":
+    main()
+    analyze_and_plot_cardinality()
@@ -0,0 +1,192 @@
+import json
+import os
+import shutil
+import zlib
+import numpy as np
+import pipeline
+from pipeline import NS_PER_DAY, PARTITION_STRATEGIES, generate_stream, generate_timespan_stream
+
+
+# Cartella dei dataset pre-generati: una sottocartella per chiave (seed, volume, cardinalità,
+# generatore) con un file .npy per colonna e i metadati in meta.json
+DATASET_CACHE_DIR = "dataset_cache"
+
+DATASET_COLUMNS = ("timestamp", "device", "temperature", "humidity")
+
+
+def generator_parameters(time_span_days=None):
+    """
+    Parametri del generatore (pipeline.py) che determinano i dati prodotti, oltre a seed,
+    volume e cardinalità: la dimensione dei blocchi generati e, per l'intervallo storico,
+    dispersione e jitter del campionamento e periodi offline.
+    """
+    parameters = {'generation_chunk_size': pipeline.GENERATION_CHUNK_SIZE}
+    if time_span_days:
+        parameters.update({
+            'sampling_interval_spread': pipeline.SAMPLING_INTERVAL_SPREAD,
+            'sampling_jitter': pipeline.SAMPLING_JITTER,
+            'gap_probability': pipeline.GAP_PROBABILITY,
+            'gap_slot_seconds': pipeline.GAP_SLOT_SECONDS,
+        })
+    return parameters
+
+
+def dataset_key(num_records, seed, num_devices, time_span_days=None):
+    """
+    Chiave (e nome della cartella) del dataset: seed, volume, cardinalità e generatore,
+    più un hash dei parametri del generatore (vedi generator_parameters), così un dataset
+    generato con parametri diversi non viene riutilizzato.
+    """
+    generator = f"span{time_span_days}d" if time_span_days else "interval1ms"
+    parameters = json.dumps(generator_parameters(time_span_days), sort_keys=True)
+    return f"seed{seed}-n{num_records}-d{num_devices}-{generator}-{zlib.crc32(parameters.encode('utf-8')):08x}"
+
+
+def dataset_path(num_records, seed, num_devices, time_span_days=None, cache_dir=DATASET_CACHE_DIR):
+    return os.path.join(cache_dir, dataset_key(num_records, seed, num_devices, time_span_days))
+
+
+"""  COSTRUZIONE  """
+
+def build_dataset(num_records, seed, num_devices, time_span_days=None, cache_dir=DATASET_CACHE_DIR):
+    """
+    Genera il workload una sola volta e lo scrive su disco, colonna per colonna, in file .npy
+    riempiti a blocchi tramite memmap (il volume non viene mai materializzato in RAM).
+
+    I timestamp sono salvati come offset in nanosecondi dall'inizio del dataset, così lo stesso
+    file può essere riprodotto a partire da qualsiasi istante (vedi dataset_batches).
+    Il device è salvato come stringa a larghezza fissa, così ogni batch resta una vista del file.
+    La cartella viene scritta con un nome temporaneo e rinominata solo a costruzione completata.
+
+    Ritorna il percorso della cartella del dataset.
+    """
+    path = dataset_path(num_records, seed, num_devices, time_span_days, cache_dir)
+    building_path = f"{path}.building"
+    if os.path.exists(building_path):
+        shutil.rmtree(building_path)
+    os.makedirs(building_path)
+
+    if time_span_days:
+        span_ns = time_span_days * NS_PER_DAY
+        chunks = generate_timespan_stream(num_records, span_ns, span_ns, seed, num_devices)
+        device_width = len(f"sensor_{num_devices}")
+    else:
+        chunks = generate_stream(num_records, 0, seed, num_devices)
+        device_width = len("sensor_10")
+
+    dtypes = {
+        "timestamp": np.dtype(np.int64),
+        "device": np.dtype(f"<U{device_width}"),
+        "temperature": np.dtype(np.float64),
+        "humidity": np.dtype(np.float64),
+    }
+    columns = {
+        name: np.lib.format.open_memmap(os.path.join(building_path, f"{name}.npy"), mode="w+",
+                                        dtype=dtype, shape=(num_records,))
+        for name, dtype in dtypes.items()
+    }
+
+    print(f" Costruzione del dataset {os.path.basename(path)}...")
+    written = 0
+    for chunk in chunks:
+        chunk_length = len(chunk["timestamp"])
+        for name in DATASET_COLUMNS:
+            columns[name][written:written + chunk_length] = chunk[name]
+        written += chunk_length
+
+    for column in columns.values():
+        column.flush()
+    del columns
+
+    with open(os.path.join(building_path, "meta.json"), "w") as f:
+        json.dump({
+            "num_records": written,
+            "seed": seed,
+            "num_devices": num_devices,
+            "time_span_days": time_span_days,
+            "generator": generator_parameters(time_span_days),
+        }, f, indent=2)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(building_path, path)
+    print(f" Dataset salvato in '{path}' ({written} record).")
+    return path
+
+
+"""  LETTURA  """
+
+def open_dataset(path):
+    """
+    Apre un dataset in sola lettura con le colonne mappate in memoria (np.load con mmap_mode).
+    Ritorna il dizionario colonnare, limitato ai record effettivamente scritti.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        num_records = json.load(f)["num_records"]
+
+    return {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")[:num_records]
+        for name in DATASET_COLUMNS
+    }
+
+
+def load_or_build_dataset(num_records, seed, num_devices, time_span_days=None, cache_dir=DATASET_CACHE_DIR):
+    """
+    Apre il dataset con la chiave indicata, costruendolo se non esiste ancora o se i parametri
+    del generatore salvati nei metadati non coincidono con quelli attuali.
+    """
+    path = dataset_path(num_records, seed, num_devices, time_span_days, cache_dir)
+    meta_path = os.path.join(path, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f).get("generator") != generator_parameters(time_span_days):
+                print(f" Parametri del generatore cambiati: il dataset {os.path.basename(path)} viene ricostruito.")
+                os.remove(meta_path)
+    if not os.path.exists(meta_path):
+        build_dataset(num_records, seed, num_devices, time_span_days, cache_dir)
+    return open_dataset(path)
+
+
+def dataset_batches(dataset, batch_size, start_ns=None, indexes=None):
+    """
+    Stream di batch colonnari di `batch_size` record letti dal dataset mappato in memoria.
+    Ogni colonna del batch è una vista del file, senza copie; solo i timestamp vengono
+    copiati quando start_ns è indicato, per spostarli sull'istante di partenza del run.
+    Con `indexes` (array di posizioni crescenti) si leggono solo quei record (con copia).
+    """
+    total = len(dataset["timestamp"]) if indexes is None else len(indexes)
+
+    for start in range(0, total, batch_size):
+        stop = min(start + batch_size, total)
+        if indexes is None:
+            batch = {name: column[start:stop] for name, column in dataset.items()}
+        else:
+            batch = {name: column[indexes[start:stop]] for name, column in dataset.items()}
+
+        if start_ns is not None:
+            batch["timestamp"] = batch["timestamp"] + start_ns
+        yield batch
+
+
+def partition_dataset(dataset, num_workers, worker_id, partition="time"):
+    """
+    Porzione del dataset assegnata al worker `worker_id` su `num_workers`:
+    con "time" un intervallo contiguo di record (viste, nessuna copia),
+    con "device" i record di un sottoinsieme disgiunto di device.
+    Ritorna (dataset, posizioni) da passare a dataset_batches; le posizioni sono None per "time".
+    """
+    if partition not in PARTITION_STRATEGIES:
+        raise ValueError(f"Strategia di partizionamento sconosciuta: '{partition}'")
+
+    num_records = len(dataset["timestamp"])
+    if partition == "time":
+        first = num_records * worker_id // num_workers
+        last = num_records * (worker_id + 1) // num_workers
+        return {name: column[first:last] for name, column in dataset.items()}, None
+
+    device_ids = np.unique(dataset["device"])
+    if num_workers > len(device_ids):
+        raise ValueError(f"Impossibile dividere {len(device_ids)} device distinti tra {num_workers} worker")
+
+    worker_devices = device_ids[worker_id::num_workers]
+    return dataset, np.flatnonzero(np.isin(dataset["device"], worker_devices))
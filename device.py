@@ -1,11 +1,11 @@
 from datetime import datetime, timezone
 import random
-import os
-import pandas as pd
+import numpy as np
+from results_store import get_results_store
 
 class Device:
-    def __init__(self):
-        self.device_id = f"sensor_{random.randint(1, 10)}"
+    def __init__(self, device_id=None):
+        self.device_id = device_id if device_id else f"sensor_{random.randint(1, 10)}"
 
     def generate_data(self, timestamp=None):
         if not timestamp:
@@ -17,27 +17,163 @@ class Device:
             "timestamp": timestamp
         }
 
-def save_query_result(database_name, query_name, duration):
+
+"""  GENERAZIONE COLONNARE DEI DATI  """
+
+def create_rng(seed=None):
+    """
+    Ritorna un generatore NumPy inizializzato con il seed indicato,
+    così che la stessa sequenza di dati possa essere rigenerata tra un run e l'altro.
+    """
+    return np.random.default_rng(seed)
+
+
+def create_devices(num_devices, rng):
+    """
+    Crea la lista dei Device usando il generatore `rng` per scegliere gli id
+    (stesso schema sensor_1 ... sensor_10 di Device(), ma riproducibile).
+    """
+    ids = rng.integers(1, 11, size=num_devices)
+    return [Device(device_id=f"sensor_{i}") for i in ids]
+
+
+def create_device_ids(cardinality):
+    """
+    Ritorna l'array NumPy degli id di `cardinality` device distinti (sensor_1 ... sensor_N).
+    A differenza di create_devices gli id sono tutti diversi, così il numero di serie
+    generate è esattamente `cardinality`; gli insiemi sono annidati al crescere di N.
+    """
+    return np.char.add("sensor_", np.arange(1, cardinality + 1).astype(str))
+
+
+def datetime_to_ns(timestamp):
+    """
+    Converte un datetime (UTC) in nanosecondi interi dall'epoch.
+    """
+    return int(timestamp.timestamp()) * 1_000_000_000 + timestamp.microsecond * 1_000
+
+
+def ns_to_rfc3339(timestamp_ns):
+    """
+    Converte un timestamp in nanosecondi (UTC) in una stringa RFC 3339 al microsecondo,
+    valida sia per Flux che per SQL.
+    """
+    return str(np.datetime_as_string(np.datetime64(timestamp_ns, "ns"), unit="us", timezone="UTC"))
+
+
+def generate_columnar_batch(devices, num_records, start_ns, rng, interval_ms=1, device_offset=None):
+    """
+    Genera un intero batch di dati in forma colonnare, una colonna NumPy per campo,
+    al posto di un dizionario per record come fa Device.generate_data.
+
+    Parametri:
+        - devices: lista di Device tra cui scegliere casualmente, oppure array di id (create_device_ids)
+        - num_records: numero di record da generare
+        - start_ns: timestamp del primo record in nanosecondi dall'epoch (UTC)
+        - rng: generatore NumPy (vedi create_rng) usato per tutte le estrazioni
+        - interval_ms: distanza in millisecondi tra due record consecutivi
+        - device_offset: se indicato i device vengono assegnati a rotazione partendo da
+          questa posizione invece che a caso, così ogni device compare almeno una volta
+          appena i record sono almeno quanti i device
+
+    Ritorna:
+        - Dizionario di array con chiavi "timestamp" (int64, ns), "device",
+          "temperature" e "humidity" (float64 arrotondati a 2 decimali)
+    """
+    if isinstance(devices, np.ndarray):
+        device_ids = devices
+    else:
+        device_ids = np.array([device.device_id for device in devices])
+    step_ns = int(interval_ms * 1_000_000)
+
+    if device_offset is None:
+        device_indexes = rng.integers(0, len(device_ids), size=num_records)
+    else:
+        device_indexes = (device_offset + np.arange(num_records, dtype=np.int64)) % len(device_ids)
+
+    return {
+        "timestamp": start_ns + np.arange(num_records, dtype=np.int64) * step_ns,
+        "device": device_ids[device_indexes],
+        "temperature": np.round(rng.uniform(20, 30, size=num_records), 2),
+        "humidity": np.round(rng.uniform(30, 60, size=num_records), 2),
+    }
+
+
+def records_to_columnar_batch(records):
+    """
+    Converte una lista di dizionari (Device.generate_data) nel formato colonnare.
+    """
+    return {
+        "timestamp": np.array([datetime_to_ns(r["timestamp"]) for r in records], dtype=np.int64),
+        "device": np.array([r["device"] for r in records]),
+        "temperature": np.array([r["temperature"] for r in records], dtype=np.float64),
+        "humidity": np.array([r["humidity"] for r in records], dtype=np.float64),
+    }
+
+
+def is_columnar_batch(data_batch):
+    """
+    Ritorna True se il batch è nel formato colonnare di generate_columnar_batch.
+    """
+    return isinstance(data_batch, dict)
+
+
+def batch_length(data_batch):
+    """
+    Numero di record contenuti in un batch, colonnare o lista di dizionari.
+    """
+    if is_columnar_batch(data_batch):
+        return len(data_batch["timestamp"])
+    return len(data_batch)
+
+
+def slice_columnar_batch(data_batch, start, stop):
+    """
+    Ritorna la porzione [start, stop) di un batch colonnare (viste NumPy, senza copie).
+    """
+    return {column: values[start:stop] for column, values in data_batch.items()}
+
+
+def concat_columnar_batches(*data_batches):
+    """
+    Concatena più batch colonnari in un unico batch (con copia dei dati).
     """
-    Salva i risultati del test di query in query_results.csv.
+    return {
+        column: np.concatenate([batch[column] for batch in data_batches])
+        for column in data_batches[0]
+    }
+
+def save_query_result(database_name, query_name, duration, **extra_metrics):
+    """
+    Salva i risultati del test di query nella tabella 'queries' dell'archivio dei risultati.
+    Eventuali metriche aggiuntive (es. connect_duration_seconds) vengono
+    salvate come colonne aggiuntive.
     """
     results_query = {
         'database': database_name,
         'query': query_name,
-        'duration_seconds': duration
+        'duration_seconds': duration,
+        **extra_metrics
     }
-    file_exists = os.path.isfile('query_results.csv')
-    df = pd.DataFrame([results_query])
-    df.to_csv('query_results.csv', mode='a', header=not file_exists, index=False)
+    get_results_store().add('queries', results_query)
     print(f"Risultati query '{query_name}' salvati per {database_name}.")
 
-def save_performance_result(database_name, num_records, duration, throughput):
+def save_query_load_result(metrics):
+    """
+    Salva nella tabella 'query_load' le metriche di un test di carico sulle query
+    (una riga per database e query, vedi query_load.run_query_load).
+    """
+    get_results_store().add('query_load', metrics)
+    print(f"Risultati del test di carico salvati per {metrics['database']} ('{metrics['query']}').")
+
+def save_performance_result(database_name, num_records, duration, throughput, **extra_metrics):
     """
-    Genera un file csv con all'interno
+    Salva nella tabella 'performance' dell'archivio dei risultati
     i risultati del test appena concluso, in particolare:
     - nome del database, 
     - numero dei record totali che sono stati inseriti in quel test
     - la durata in secondi dell'invio e in throughput.
+    - eventuali metriche aggiuntive (es. peak_rss_mb) passate come argomenti con nome.
     
     """
 
@@ -45,9 +181,8 @@ def save_performance_result(database_name, num_records, duration, throughput):
         'database': database_name,
         'num_records': num_records,
         'duration_seconds': duration,
-        'throughput_records_per_second': throughput
+        'throughput_records_per_second': throughput,
+        **extra_metrics
     }
-    df_results = pd.DataFrame([results])
-    file_exists = os.path.isfile('performance_results.csv')
-    df_results.to_csv('performance_results.csv', mode='a', header=not file_exists, index=False)
+    get_results_store().add('performance', results)
     print(f"Risultati salvati per {database_name} ({num_records} record).")
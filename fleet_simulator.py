@@ -0,0 +1,404 @@
+import queue
+import threading
+import time
+import numpy as np
+from device import Device, create_rng, datetime_to_ns
+from graphs_datapoints import analyze_and_plot_fleet
+from latency import LatencyHistogram
+from results_store import get_results_store, module_config
+from ingest_runner import run_backend_test, scalar_metrics, BATCH_SIZE
+from null_sink import NULL_SINK_MODE
+from datetime import datetime, timezone
+
+
+# Parametri del simulatore di flotta a frequenza fissa
+
+# Dispositivi simulati: ognuno emette alla propria frequenza, estratta da una lognormale con
+# deviazione standard (del logaritmo) DEVICE_RATE_SPREAD e normalizzata così che la somma
+# coincida con la frequenza obiettivo complessiva
+NUM_SIMULATED_DEVICES = 1000
+SEED = 42
+DEVICE_RATE_SPREAD = 0.5
+
+# Modalità di scrittura: in acknowledged il throughput di InfluxDB conta solo i punti confermati
+INFLUX_WRITE_MODE = "acknowledged"
+TIMESCALE_INGEST_MODE = "copy_binary"
+
+# Ricerca della frequenza massima sostenibile: si raddoppia (RATE_GROWTH) a partire da
+# RATE_SEARCH_START finché una prova non è sostenibile, poi BISECTION_STEPS bisezioni geometriche
+# tra l'ultima frequenza sostenibile e la prima non sostenibile
+RATE_SEARCH_START = 10_000
+RATE_SEARCH_MAX = 2_000_000
+RATE_GROWTH = 2
+BISECTION_STEPS = 3
+RATE_TEST_SECONDS = 60
+
+# Conferma alla frequenza trovata per un periodo lungo (es. 3600 per un'ora); 0 per saltarla
+SUSTAINED_RUN_SECONDS = 0
+
+# Criteri di sostenibilità: throughput ottenuto almeno SUSTAINABLE_RATE_FRACTION dell'obiettivo,
+# ritardo rispetto alla pianificazione (p99) entro MAX_SEND_LAG_P99_MS e coda che non cresce:
+# oltre MAX_BACKLOG_SECONDS di punti in coda la pianificazione si interrompe (prova non sostenibile).
+# Per InfluxDB in acknowledged/synchronous anche la latenza di conferma dei batch (p99, dall'invio
+# alla conferma del server) deve restare entro MAX_ACK_LATENCY_P99_MS: il ritardo di invio non
+# comprende l'attesa nel buffer della write API
+SUSTAINABLE_RATE_FRACTION = 0.98
+MAX_SEND_LAG_P99_MS = 1000
+MAX_ACK_LATENCY_P99_MS = 1000
+MAX_BACKLOG_SECONDS = 5
+
+# Passo dello scheduler e granularità della timeline salvata
+SCHEDULER_TICK_SECONDS = 0.05
+TIMELINE_WINDOW_SECONDS = 1.0
+
+
+"""  FLOTTA DI DISPOSITIVI  """
+
+class FleetSimulator:
+    """
+    Flotta di `num_devices` dispositivi (device.Device) che emettono ciascuno alla propria
+    frequenza, con una fase iniziale casuale: il punto k del dispositivo i è pianificato
+    all'istante fase_i + k / frequenza_i (secondi dall'avvio).
+
+    Uno scheduler in background accoda ogni SCHEDULER_TICK_SECONDS i punti diventati dovuti
+    (generati in forma colonnare, con il timestamp pianificato); batches() li consegna al sender
+    in batch di al più batch_size punti, senza attendere di riempirli, come farebbe un gateway.
+    Se lo scheduler è in ritardo i punti arretrati vengono accodati tutti insieme, con il loro
+    istante pianificato, quindi il ritardo viene comunque misurato.
+
+    Misure: ritardo di invio rispetto alla pianificazione (dal punto più vecchio di ogni batch
+    alla fine del suo invio, istogramma send_lag), profondità della coda (punti pianificati non
+    ancora consegnati al sender) e timeline per finestre di TIMELINE_WINDOW_SECONDS.
+    Con la write API di InfluxDB in background l'invio termina quando il batch è accodato nel
+    buffer del client: ritardo e coda non comprendono l'attesa nel buffer né la scrittura sul
+    server, misurate dalla latenza di conferma (ack_latency) della prova.
+    """
+
+    def __init__(self, num_devices, target_rate, duration_seconds, seed, batch_size=BATCH_SIZE,
+                 rate_spread=DEVICE_RATE_SPREAD, tick_seconds=SCHEDULER_TICK_SECONDS,
+                 max_backlog_seconds=MAX_BACKLOG_SECONDS):
+        self.rng = create_rng(seed)
+        self.devices = [Device(device_id=f"sensor_{i}") for i in range(1, num_devices + 1)]
+        self.device_ids = np.array([device.device_id for device in self.devices])
+
+        weights = self.rng.lognormal(0.0, rate_spread, size=num_devices)
+        self.rates = target_rate * weights / weights.sum()  # Hz per dispositivo
+        self.phases = self.rng.uniform(0.0, 1.0, size=num_devices) / self.rates
+
+        self.target_rate = target_rate
+        self.duration_seconds = duration_seconds
+        self.batch_size = batch_size
+        self.tick_seconds = tick_seconds
+        self.max_backlog_points = max_backlog_seconds * target_rate
+        self.planned_points = int(self.emitted_until(duration_seconds).sum())
+
+        self.scheduled = 0
+        self.delivered = 0
+        self.max_queue_depth = 0
+        self.aborted = False
+        self.send_lag = LatencyHistogram()
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._start_time = None
+        self._start_ns = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def emitted_until(self, t_seconds):
+        """
+        Numero di punti di ogni dispositivo pianificati prima dell'istante t_seconds.
+        """
+        return np.maximum(0, np.ceil((t_seconds - self.phases) * self.rates)).astype(np.int64)
+
+    def emissions(self, t_from, t_to):
+        """
+        Batch colonnare (ordinato per istante) dei punti pianificati in [t_from, t_to),
+        più l'array degli istanti pianificati in secondi dall'avvio.
+        """
+        first = self.emitted_until(t_from)
+        counts = self.emitted_until(t_to) - first
+        total = int(counts.sum())
+        indexes = np.repeat(np.arange(len(self.rates)), counts)
+        k = np.repeat(first, counts) + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        scheduled = self.phases[indexes] + k / self.rates[indexes]
+
+        order = np.argsort(scheduled, kind="stable")
+        indexes, scheduled = indexes[order], scheduled[order]
+        batch = {
+            "timestamp": self._start_ns + (scheduled * 1e9).astype(np.int64),
+            "device": self.device_ids[indexes],
+            "temperature": np.round(self.rng.uniform(20, 30, size=total), 2),
+            "humidity": np.round(self.rng.uniform(30, 60, size=total), 2),
+        }
+        return batch, scheduled
+
+    def _window(self, t_seconds):
+        index = int(t_seconds // TIMELINE_WINDOW_SECONDS)
+        if index not in self._windows:
+            self._windows[index] = {'scheduled': 0, 'sent': 0, 'queue_depth': 0,
+                                    'lag_count': 0, 'lag_total': 0.0, 'lag_max': 0.0}
+        return self._windows[index]
+
+    def _schedule(self):
+        t_from = 0.0
+        while t_from < self.duration_seconds and not self._stop.is_set():
+            delay = self._start_time + t_from + self.tick_seconds - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            t_to = min(time.perf_counter() - self._start_time, self.duration_seconds)
+
+            batch, scheduled = self.emissions(t_from, t_to)
+            if len(scheduled):
+                self._queue.put((batch, scheduled))
+            with self._lock:
+                self.scheduled += len(scheduled)
+                depth = self.scheduled - self.delivered
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+                window = self._window(t_to)
+                window['scheduled'] += len(scheduled)
+                window['queue_depth'] = max(window['queue_depth'], depth)
+            t_from = t_to
+
+            if depth > self.max_backlog_points:
+                print(f" Coda oltre {self.max_backlog_points:.0f} punti: pianificazione interrotta (frequenza non sostenibile).")
+                self.aborted = True
+                break
+
+        self._queue.put(None)
+
+    def start(self):
+        self._start_ns = datetime_to_ns(datetime.now(timezone.utc))
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._schedule, name="fleet-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _record_sent(self, num_points, oldest_scheduled):
+        now = time.perf_counter() - self._start_time
+        lag = max(0.0, now - oldest_scheduled)
+        self.send_lag.record(lag)
+        with self._lock:
+            window = self._window(now)
+            window['sent'] += num_points
+            window['queue_depth'] = max(window['queue_depth'], self.scheduled - self.delivered)
+            window['lag_count'] += 1
+            window['lag_total'] += lag
+            window['lag_max'] = max(window['lag_max'], lag)
+
+    def batches(self):
+        """
+        Stream dei batch da inviare (per run_backend_test): avvia lo scheduler e consegna i punti
+        dovuti appena il sender è libero. L'invio di un batch è concluso quando il sender chiede
+        il successivo, quindi il ritardo viene registrato alla ripresa del generatore (per InfluxDB
+        in background, appena il batch è accodato nel buffer del client).
+        """
+        self.start()
+        buffer, buffer_scheduled = None, None
+        finished = False
+        try:
+            while True:
+                if not finished:
+                    item = self._queue.get() if buffer is None else self._get_nowait()
+                    if item is None:
+                        finished = True  # pianificazione conclusa: si svuota il buffer
+                    elif item is not False:
+                        batch, scheduled = item
+                        if buffer is None:
+                            buffer, buffer_scheduled = batch, scheduled
+                        else:
+                            buffer = {column: np.concatenate([buffer[column], batch[column]]) for column in buffer}
+                            buffer_scheduled = np.concatenate([buffer_scheduled, scheduled])
+                        if len(buffer_scheduled) < self.batch_size:
+                            continue  # altri punti già in coda possono completare il batch
+                if buffer is None:
+                    return
+
+                # Coda vuota (o batch pieno): si consegna quello che c'è, al più batch_size punti
+                size = min(self.batch_size, len(buffer_scheduled))
+                out = {column: values[:size] for column, values in buffer.items()}
+                oldest = float(buffer_scheduled[0])
+                if size < len(buffer_scheduled):
+                    buffer = {column: values[size:] for column, values in buffer.items()}
+                    buffer_scheduled = buffer_scheduled[size:]
+                else:
+                    buffer, buffer_scheduled = None, None
+                with self._lock:
+                    self.delivered += size
+
+                yield out
+                self._record_sent(size, oldest)
+        finally:
+            self.stop()
+
+    def _get_nowait(self):
+        """
+        Elemento successivo della coda senza attendere: False se la coda è vuota.
+        """
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return False
+
+    def timeline(self):
+        """
+        Righe della timeline per finestra: punti pianificati e inviati al secondo, profondità
+        massima della coda e ritardo medio e massimo rispetto alla pianificazione.
+        """
+        rows = []
+        with self._lock:
+            for index in sorted(self._windows):
+                window = self._windows[index]
+                rows.append({
+                    'time_seconds': index * TIMELINE_WINDOW_SECONDS,
+                    'scheduled_points_per_second': window['scheduled'] / TIMELINE_WINDOW_SECONDS,
+                    'sent_points_per_second': window['sent'] / TIMELINE_WINDOW_SECONDS,
+                    'queue_depth_points': window['queue_depth'],
+                    'send_lag_mean_ms': window['lag_total'] / window['lag_count'] * 1000 if window['lag_count'] else None,
+                    'send_lag_max_ms': window['lag_max'] * 1000 if window['lag_count'] else None,
+                })
+        return rows
+
+
+"""  PROVE A FREQUENZA FISSA  """
+
+def run_rate_trial(database_name, mode, target_rate, duration_seconds, stage, null_sink=None):
+    """
+    Esegue una prova a frequenza fissa con run_backend_test e ne valuta la sostenibilità
+    (vedi SUSTAINABLE_RATE_FRACTION, MAX_SEND_LAG_P99_MS, MAX_ACK_LATENCY_P99_MS, MAX_BACKLOG_SECONDS).
+    Ritorna (riga della prova, righe della timeline).
+    """
+    print(f"\n------ Flotta {database_name} ({mode}), fase {stage}: {target_rate} punti/s "
+          f"per {duration_seconds} s ------")
+
+    simulator = FleetSimulator(NUM_SIMULATED_DEVICES, target_rate, duration_seconds, SEED)
+    metrics = run_backend_test(
+        database_name, simulator.planned_points, simulator.batches(), mode, null_sink=null_sink
+    ) or {}
+    simulator.stop()
+
+    succeeded = bool(metrics)
+    metrics = scalar_metrics(metrics)
+    duration = metrics.pop('duration', None)
+    throughput = metrics.pop('throughput', 0)
+    lag_summary = simulator.send_lag.summary('send_lag')
+    # Presente solo per InfluxDB con conferme (acknowledged, synchronous)
+    ack_latency_p99 = metrics.get('ack_latency_p99_ms')
+
+    trial = {
+        'database': database_name,
+        'ingest_mode': mode,
+        'sink': null_sink,
+        **metrics,
+        'stage': stage,
+        'num_devices': NUM_SIMULATED_DEVICES,
+        'target_points_per_second': target_rate,
+        'duration_seconds': duration,
+        'achieved_points_per_second': throughput,
+        'achieved_fraction': throughput / target_rate if target_rate else None,
+        'planned_points': simulator.planned_points,
+        'scheduled_points': simulator.scheduled,
+        'max_queue_depth_points': simulator.max_queue_depth,
+        'aborted': simulator.aborted,
+        **lag_summary,
+    }
+    trial['sustainable'] = bool(
+        succeeded
+        and not simulator.aborted
+        and not metrics.get('records_failed')
+        and throughput >= SUSTAINABLE_RATE_FRACTION * target_rate
+        and lag_summary['send_lag_p99_ms'] is not None
+        and lag_summary['send_lag_p99_ms'] <= MAX_SEND_LAG_P99_MS
+        and ('ack_latency_p99_ms' not in metrics
+             or (ack_latency_p99 is not None and ack_latency_p99 <= MAX_ACK_LATENCY_P99_MS))
+    )
+    ack_report = f", conferma p99 {ack_latency_p99 or float('nan'):.1f} ms" if 'ack_latency_p99_ms' in metrics else ""
+    print(f" --> ottenuti {throughput:.0f} punti/s ({trial['achieved_fraction'] or 0:.1%}), ritardo p99 "
+          f"{lag_summary['send_lag_p99_ms'] or float('nan'):.1f} ms{ack_report}, coda massima {simulator.max_queue_depth} punti "
+          f"({'sostenibile' if trial['sustainable'] else 'non sostenibile'})")
+
+    labels = {'database': database_name, 'ingest_mode': mode, 'stage': stage, 'target_points_per_second': target_rate}
+    timeline = [{**labels, **row} for row in simulator.timeline()]
+    return trial, timeline
+
+
+def find_max_sustainable_rate(database_name, mode, null_sink=None):
+    """
+    Cerca la frequenza massima sostenibile per un backend: crescita geometrica fino alla prima
+    prova non sostenibile, poi bisezione geometrica; se SUSTAINED_RUN_SECONDS > 0 la frequenza
+    trovata viene confermata con una prova lunga.
+    Ritorna (frequenza massima sostenibile o None, lista delle prove, righe della timeline).
+    """
+    trials, timeline = [], []
+
+    def attempt(rate, stage, duration_seconds=RATE_TEST_SECONDS):
+        trial, rows = run_rate_trial(database_name, mode, rate, duration_seconds, stage, null_sink)
+        trials.append(trial)
+        timeline.extend(rows)
+        return trial['sustainable']
+
+    best, failed = None, None
+    rate = RATE_SEARCH_START
+    while rate <= RATE_SEARCH_MAX:
+        if not attempt(rate, 'ramp'):
+            failed = rate
+            break
+        best = rate
+        rate = int(rate * RATE_GROWTH)
+
+    if best is not None and failed is not None:
+        for _ in range(BISECTION_STEPS):
+            rate = int(round(np.sqrt(best * failed)))
+            if rate in (best, failed):
+                break
+            if attempt(rate, 'bisection'):
+                best = rate
+            else:
+                failed = rate
+
+    if best is not None and SUSTAINED_RUN_SECONDS > 0:
+        if not attempt(best, 'sustained', SUSTAINED_RUN_SECONDS):
+            print(f" Attenzione: {best} punti/s non sostenuti per {SUSTAINED_RUN_SECONDS} s.")
+
+    return best, trials, timeline
+
+
+def main():
+    """
+    Cerca la frequenza massima sostenibile su entrambi i database e salva le prove
+    (tabella 'fleet_trials'), le timeline (tabella 'fleet_timeline') e il risultato
+    per backend (tabella 'fleet_max_rate').
+    """
+    results_store = get_results_store()
+    results_store.begin_run('fleet', module_config(globals()))
+
+    results = []
+    for database_name, mode in (('InfluxDB', INFLUX_WRITE_MODE), ('TimescaleDB', TIMESCALE_INGEST_MODE)):
+        best, trials, timeline = find_max_sustainable_rate(database_name, mode, NULL_SINK_MODE)
+        for trial in trials:
+            results_store.add('fleet_trials', trial)
+        for row in timeline:
+            results_store.add('fleet_timeline', row)
+        results_store.add('fleet_max_rate', {
+            'database': database_name,
+            'ingest_mode': mode,
+            'sink': NULL_SINK_MODE,
+            'num_devices': NUM_SIMULATED_DEVICES,
+            'max_sustainable_points_per_second': best,
+        })
+        results.append((database_name, mode, best))
+
+    results_store.flush()
+
+    print("\n Frequenza massima sostenibile:")
+    for database_name, mode, best in results:
+        print(f"  {database_name} ({mode}): {best if best is not None else f'< {RATE_SEARCH_START}'} punti/s")
+
+
+if __name__ == "__main__":
+    main()
+    analyze_and_plot_fleet()
@@ -0,0 +1,367 @@
+import multiprocessing
+import os
+import queue
+import time
+from datetime import datetime, timezone
+import numpy as np
+from influxdb_client import InfluxDBClient
+from device import datetime_to_ns, concat_columnar_batches
+from graphs_query import analyze_and_plot_freshness
+from ingest_runner import BATCH_SIZE, NUM_DEVICES, SEED
+from latency import LatencyHistogram
+from pipeline import workload_batches
+from query_load import SESSION_FACTORIES
+from results_store import get_results_store, module_config
+from sensors import (
+    connect_to_influx, connect_to_timescale, send_batch_to_influxdb, send_batch_to_timescaledb,
+    InfluxWriteTracker, INFLUX_FLUSH_INTERVAL_MS
+)
+
+
+# Parametri del benchmark di freschezza (tempo dalla scrittura alla visibilità nelle query)
+
+MAX_INGEST_RECORDS = 1_000_000_000  # limite superiore: l'inserimento si ferma dopo l'ultimo marker
+
+# Modalità di scrittura provate: in batching i batch restano nel buffer della write API finché
+# non ne contiene INFLUX_BUFFER_BATCHES o per al più INFLUX_FLUSH_INTERVAL ms (il ritardo misurato
+# dipende quindi dal carico di sottofondo), in synchronous la write ritorna a scrittura avvenuta.
+# Con INFLUX_BUFFER_BATCHES = 1 ogni batch verrebbe inviato appena accodato, senza attesa nel buffer.
+INFLUX_WRITE_MODES_TO_TEST = ["batching", "synchronous"]
+INFLUX_SERIALIZER = "line_protocol"
+INFLUX_FLUSH_INTERVAL = INFLUX_FLUSH_INTERVAL_MS
+INFLUX_BUFFER_BATCHES = 10
+TIMESCALE_INGEST_MODES_TO_TEST = ["execute_values"]
+
+# Carichi di inserimento di sottofondo (record al secondo, 0 = solo i marker): il processo di
+# inserimento invia un batch ogni BATCH_SIZE / carico secondi, o appena può se non riesce a tenere il ritmo
+INGEST_LOADS_RPS = [0, 10_000, 50_000]
+
+# Marker: un record del device MARKER_DEVICE aggiunto al batch di sottofondo ogni
+# MARKER_INTERVAL_SECONDS, con timestamp unico (al microsecondo) che il poller cerca nel database
+MARKERS_PER_LOAD = 50
+MARKER_INTERVAL_SECONDS = 0.5
+MARKER_DEVICE = "freshness_marker"
+
+# Poller: intervallo tra due query di controllo e attesa massima prima di considerare perso un marker
+POLL_INTERVAL_SECONDS = 0.005
+VISIBILITY_TIMEOUT_SECONDS = 30
+
+# Al termine i marker vengono cancellati, così non compaiono come device nelle query di benchmark
+DELETE_MARKERS = True
+
+
+"""  TEMPI  """
+
+def datetime_to_us(timestamp):
+    return datetime_to_ns(timestamp) // 1_000
+
+
+def us_to_rfc3339(timestamp_us):
+    seconds, microseconds = divmod(timestamp_us, 1_000_000)
+    return f"{datetime.fromtimestamp(seconds, timezone.utc):%Y-%m-%dT%H:%M:%S}.{microseconds:06d}Z"
+
+
+def marker_batch(marker_us):
+    """
+    Batch colonnare con il solo record marker (timestamp in ns, multiplo del microsecondo
+    così da essere confrontabile con la precisione di PostgreSQL e dei datetime Python).
+    """
+    return {
+        "timestamp": np.array([marker_us * 1_000], dtype=np.int64),
+        "device": np.array([MARKER_DEVICE]),
+        "temperature": np.array([0.0]),
+        "humidity": np.array([0.0]),
+    }
+
+
+"""  INSERIMENTO CON MARKER (processo separato)  """
+
+def open_writer(database_name, mode):
+    """
+    Apre la connessione di scrittura tramite sensors.py e ritorna (invia_batch, chiudi),
+    oppure None se la connessione fallisce. chiudi svuota il buffer della write API.
+    """
+    if database_name == 'InfluxDB':
+        tracker = InfluxWriteTracker(synchronous=(mode == "synchronous"))
+        client, write_api = connect_to_influx(BATCH_SIZE, mode, tracker, INFLUX_SERIALIZER, INFLUX_FLUSH_INTERVAL,
+                                              INFLUX_BUFFER_BATCHES)
+        if not client:
+            return None
+        bucket, org = os.getenv("INFLUX_BUCKET"), os.getenv("INFLUX_ORG")
+
+        def send(batch):
+            send_batch_to_influxdb(batch, write_api, bucket, org, tracker, INFLUX_SERIALIZER)
+
+        def close():
+            write_api.close()
+            client.close()
+
+        return send, close
+
+    conn = connect_to_timescale()
+    if not conn:
+        return None
+
+    def send(batch):
+        # Un'unica istruzione anche per il batch con il marker in più
+        send_batch_to_timescaledb(batch, conn, len(batch["timestamp"]), mode)
+
+    return send, conn.close
+
+
+def ingest_with_markers(database_name, mode, load_rps, start_ns, seed, marker_queue):
+    """
+    Inserisce il carico di sottofondo al ritmo load_rps aggiungendo un marker al batch in
+    partenza ogni MARKER_INTERVAL_SECONDS, finché non sono stati inviati MARKERS_PER_LOAD marker.
+    Il marker segue quindi lo stesso percorso (buffer, batch, commit) dei dati di sottofondo.
+
+    Invia a marker_queue ('marker', timestamp del marker in µs, time.time() prima della write,
+    time.time() al ritorno della write) per ogni marker e ('done', record inviati, secondi) alla
+    fine, oppure None se la connessione fallisce. Gira in un processo separato, come in
+    mixed_workload.py, per non competere con il poller per il GIL.
+    """
+    writer = open_writer(database_name, mode)
+    if writer is None:
+        marker_queue.put(None)
+        return
+    send, close = writer
+
+    batches = workload_batches(MAX_INGEST_RECORDS, BATCH_SIZE, start_ns, seed, NUM_DEVICES) if load_rps else None
+    tick_seconds = BATCH_SIZE / load_rps if load_rps else MARKER_INTERVAL_SECONDS
+
+    sent_records = 0
+    markers = 0
+    start_time = time.perf_counter()
+    next_marker_time = start_time + MARKER_INTERVAL_SECONDS
+    tick = 0
+
+    try:
+        while markers < MARKERS_PER_LOAD:
+            delay = start_time + tick * tick_seconds - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            tick += 1
+
+            batch = next(batches) if batches else None
+            marker_us = None
+            if time.perf_counter() >= next_marker_time:
+                marker_us = time.time_ns() // 1_000
+                batch = concat_columnar_batches(batch, marker_batch(marker_us)) if batch else marker_batch(marker_us)
+                next_marker_time += MARKER_INTERVAL_SECONDS
+                markers += 1
+            if batch is None:
+                continue
+
+            write_start = time.time()
+            send(batch)
+            write_return = time.time()
+            sent_records += len(batch["timestamp"])
+
+            if marker_us is not None:
+                marker_queue.put(('marker', marker_us, write_start, write_return))
+    finally:
+        close()
+        marker_queue.put(('done', sent_records, time.perf_counter() - start_time))
+
+
+"""  POLLING  """
+
+def visible_markers(database_name, execute, low_us, high_us):
+    """
+    Query di controllo: ritorna l'insieme dei timestamp (µs) dei marker già visibili tra
+    low_us e high_us. Il filtro sul device (tag di InfluxDB) e sul breve intervallo temporale
+    la mantiene economica anche sotto carico.
+    """
+    if database_name == 'InfluxDB':
+        tables = execute(f'''
+            from(bucket: "{os.getenv("INFLUX_BUCKET")}")
+              |> range(start: {us_to_rfc3339(low_us)}, stop: {us_to_rfc3339(high_us + 1)})
+              |> filter(fn: (r) => r._measurement == "sensor_data" and r.device == "{MARKER_DEVICE}" and r._field == "temperature")
+              |> keep(columns: ["_time"])
+        ''')
+        return {datetime_to_us(record.get_time()) for table in tables for record in table.records}
+
+    rows = execute(f'''
+        SELECT time FROM sensors
+        WHERE device = '{MARKER_DEVICE}'
+          AND time >= '{us_to_rfc3339(low_us)}' AND time <= '{us_to_rfc3339(high_us)}';
+    ''')
+    return {datetime_to_us(row[0]) for row in rows or ()}
+
+
+def delete_markers(database_name, execute, start_us, stop_us):
+    """
+    Cancella i marker scritti tra start_us e stop_us.
+    """
+    try:
+        if database_name == 'InfluxDB':
+            with InfluxDBClient(url=os.getenv("INFLUX_URL"), token=os.getenv("INFLUX_TOKEN"),
+                                org=os.getenv("INFLUX_ORG")) as client:
+                client.delete_api().delete(
+                    us_to_rfc3339(start_us), us_to_rfc3339(stop_us + 1), f'device="{MARKER_DEVICE}"',
+                    bucket=os.getenv("INFLUX_BUCKET"), org=os.getenv("INFLUX_ORG")
+                )
+        else:
+            execute(f"DELETE FROM sensors WHERE device = '{MARKER_DEVICE}' "
+                    f"AND time >= '{us_to_rfc3339(start_us)}' AND time <= '{us_to_rfc3339(stop_us)}';")
+    except Exception as e:
+        print(f"Impossibile cancellare i marker da {database_name}: {e}")
+
+
+def run_freshness_test(database_name, mode, load_rps, seed=SEED):
+    """
+    Misura la freschezza su un backend con un carico di sottofondo: il processo di inserimento
+    scrive i marker (ingest_with_markers) mentre questo processo interroga il database ogni
+    POLL_INTERVAL_SECONDS finché ogni marker non è visibile o scade.
+
+    Per ogni marker il ritardo scrittura-visibilità va dall'inizio della write alla fine della
+    query di controllo che lo trova (limite superiore: l'errore è al più l'intervallo tra due
+    controlli più la durata della query, salvato come visibility_uncertainty_ms); il ritardo
+    conferma-visibilità parte invece dal ritorno della write (in batching la write accoda soltanto).
+
+    Ritorna (righe dei marker, riga di riepilogo) oppure None se il test non è andato a buon fine.
+    """
+    print(f"\n------ Freschezza {database_name} ({mode}), carico {load_rps} record/s ------")
+
+    try:
+        execute, close = SESSION_FACTORIES[database_name]()
+    except Exception as e:
+        print(f"Errore di connessione del poller {database_name}: {e}")
+        return None
+
+    context = multiprocessing.get_context("spawn")
+    marker_queue = context.Queue()
+    start_ns = datetime_to_ns(datetime.now(timezone.utc))
+    ingest_process = context.Process(
+        target=ingest_with_markers, args=(database_name, mode, load_rps, start_ns, seed, marker_queue)
+    )
+    ingest_process.start()
+
+    pending = {}  # timestamp del marker (µs) --> (indice, inizio write, ritorno write)
+    samples = []
+    histogram = LatencyHistogram()
+    ack_histogram = LatencyHistogram()
+    markers_written = 0
+    markers_lost = 0
+    poll_errors = 0
+    polls = 0
+    ingest_stats = None
+    first_marker_us = last_marker_us = None
+    previous_poll_start = time.time()
+
+    try:
+        while True:
+            while True:
+                try:
+                    message = marker_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    print(f"Test di freschezza {database_name} annullato: connessione di scrittura fallita.")
+                    ingest_process.join()
+                    return None
+                if message[0] == 'marker':
+                    _, marker_us, write_start, write_return = message
+                    pending[marker_us] = (markers_written, write_start, write_return)
+                    markers_written += 1
+                    first_marker_us = marker_us if first_marker_us is None else first_marker_us
+                    last_marker_us = marker_us
+                else:
+                    ingest_stats = message[1:]
+
+            if ingest_stats is not None and not pending:
+                break
+            if ingest_stats is None and not ingest_process.is_alive() and marker_queue.empty():
+                print(f"Il processo di inserimento {database_name} è terminato in modo inatteso.")
+                break
+            if not pending:
+                time.sleep(POLL_INTERVAL_SECONDS)
+                continue
+
+            poll_start = time.time()
+            try:
+                visible = visible_markers(database_name, execute, min(pending), max(pending))
+            except Exception as e:
+                print(f"Errore durante la query di controllo ({database_name}): {e}")
+                poll_errors += 1
+                visible = set()
+            poll_end = time.time()
+            polls += 1
+
+            for marker_us in sorted(pending):
+                index, write_start, write_return = pending[marker_us]
+                if marker_us in visible:
+                    histogram.record(poll_end - write_start)
+                    ack_histogram.record(max(0.0, poll_end - write_return))
+                    samples.append({
+                        'database': database_name,
+                        'ingest_mode': mode,
+                        'load_records_per_second': load_rps,
+                        'marker': index,
+                        'write_to_visible_ms': (poll_end - write_start) * 1000,
+                        'ack_to_visible_ms': (poll_end - write_return) * 1000,
+                        'write_call_ms': (write_return - write_start) * 1000,
+                        'visibility_uncertainty_ms': (poll_end - max(previous_poll_start, write_start)) * 1000,
+                    })
+                    del pending[marker_us]
+                elif poll_end - write_start > VISIBILITY_TIMEOUT_SECONDS:
+                    markers_lost += 1
+                    del pending[marker_us]
+
+            previous_poll_start = poll_start
+            time.sleep(POLL_INTERVAL_SECONDS)
+    finally:
+        ingest_process.join()
+        if DELETE_MARKERS and first_marker_us is not None:
+            delete_markers(database_name, execute, first_marker_us, last_marker_us)
+        close()
+
+    sent_records, ingest_seconds = ingest_stats or (0, 0.0)
+    summary = {
+        'database': database_name,
+        'ingest_mode': mode,
+        'load_records_per_second': load_rps,
+        'achieved_records_per_second': sent_records / ingest_seconds if ingest_seconds else 0,
+        'markers_written': markers_written,
+        'markers_visible': histogram.count,
+        'markers_lost': markers_lost,
+        'polls': polls,
+        'poll_errors': poll_errors,
+        'freshness_mean_ms': histogram.total_seconds / histogram.count * 1000 if histogram.count else None,
+        **histogram.summary('freshness'),
+        **ack_histogram.summary('ack_to_visible'),
+    }
+    print(f" {database_name} ({mode}, {load_rps} r/s): {histogram.count}/{markers_written} marker visibili, "
+          f"p50 {summary['freshness_p50_ms'] or float('nan'):.1f} ms, p99 {summary['freshness_p99_ms'] or float('nan'):.1f} ms, "
+          f"persi {markers_lost}")
+    return samples, summary
+
+
+def main():
+    """
+    Esegue il benchmark di freschezza per ogni backend, modalità di scrittura e carico e salva
+    i ritardi dei singoli marker (tabella 'freshness_samples') e il riepilogo (tabella 'freshness').
+    """
+    results_store = get_results_store()
+    results_store.begin_run('freshness', module_config(globals()))
+
+    tests = [('InfluxDB', mode) for mode in INFLUX_WRITE_MODES_TO_TEST]
+    tests += [('TimescaleDB', mode) for mode in TIMESCALE_INGEST_MODES_TO_TEST]
+
+    for database_name, mode in tests:
+        for load_rps in INGEST_LOADS_RPS:
+            outcome = run_freshness_test(database_name, mode, load_rps)
+            if outcome is None:
+                continue
+            samples, summary = outcome
+            for sample in samples:
+                results_store.add('freshness_samples', sample)
+            results_store.add('freshness', summary)
+
+    results_store.flush()
+    print("\n Benchmark di freschezza completato.")
+
+
+if __name__ == "__main__":
+    main()
+    analyze_and_plot_freshness()
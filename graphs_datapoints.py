@@ -1,12 +1,14 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+from results_store import get_results_store
 
-def analyze_and_plot_results(file_path='performance_results.csv'):
+def analyze_and_plot_results(run_id=None):
     """
-    Gestisce la lettura del file .csv eseguendone la media per ciascun
-    test eseguito e dopodichè genera i grafici per entrambi.
+    Gestisce la lettura dei risultati dall'archivio (tabella 'performance',
+    di default l'ultima esecuzione) eseguendone media e mediana per ciascun
+    test eseguito e dopodichè genera i grafici per entrambi (mediana delle
+    ripetizioni con intervallo di confidenza bootstrap).
 
     """
 
@@ -42,27 +44,56 @@ def analyze_and_plot_results(file_path='performance_results.csv'):
         print("Solo uno dei file dei grafici precedenti è stato rimosso. Controlla i messaggi di attenzione per dettagli.")
 
 
-    if not os.path.exists(file_path):
-        print(f" Errore: Il file '{file_path}' non è stato trovato. Assicurati di aver eseguito prima i test.")
-        return
-
-    print(f" Analizzando i risultati dal file: {file_path}...")
-
-    
     try:
-        df = pd.read_csv(file_path)
-        print("Dati letti con successo:")
-        print(df.head())
+        df = get_results_store().read('performance', run_id)
     except Exception as e:
-        print(f"Errore durante la lettura del file CSV: {e}")
+        print(f"Errore durante la lettura dei risultati: {e}")
         return
 
+    if df.empty:
+        print(" Errore: Nessun risultato di inserimento trovato. Assicurati di aver eseguito prima i test.")
+        return
+
+    print(f" Analizzando i risultati dell'esecuzione {df['run_id'].iloc[0]}...")
+    print(df.head())
+
+    # Le righe dei singoli worker dei test paralleli non entrano nelle medie: si usa la riga aggregata
+    if 'scope' in df.columns:
+        df = df[df['scope'] != 'worker'].copy()
+
+    # Se sono state confrontate più modalità di inserimento (es. COPY vs execute_values)
+    # ogni modalità compare come serie separata nei grafici
+    if 'ingest_mode' in df.columns:
+        has_mode = df['ingest_mode'].notna()
+        df.loc[has_mode, 'database'] = df.loc[has_mode, 'database'] + ' (' + df.loc[has_mode, 'ingest_mode'] + ')'
+
+    # Le esecuzioni sul backend nullo (null_sink.py) restano distinte da quelle sui database reali
+    if 'sink' in df.columns:
+        has_sink = df['sink'].notna()
+        df.loc[has_sink, 'database'] = df.loc[has_sink, 'database'] + ' [' + df.loc[has_sink, 'sink'] + ']'
+
+    # Con più numeri di worker ogni configurazione compare come serie separata,
+    # e viene generato anche il grafico di scalabilità
+    multiple_worker_counts = 'workers' in df.columns and df['workers'].nunique() > 1
+    if multiple_worker_counts:
+        plot_scaling_results(df, 'workers', 'throughput_scaling_plot.png', 'Numero di Worker')
+        df['database'] = df['database'] + ' x' + df['workers'].astype(int).astype(str)
+
+    # Motore asincrono: una serie per profondità in volo e grafico di scalabilità dedicato
+    if 'in_flight' in df.columns and df['in_flight'].notna().any():
+        df_async = df[df['in_flight'].notna()]
+        plot_scaling_results(df_async, 'in_flight', 'throughput_in_flight_plot.png', 'Batch in Volo')
+        has_depth = df['in_flight'].notna()
+        df.loc[has_depth, 'database'] = df.loc[has_depth, 'database'] + ' /' + df.loc[has_depth, 'in_flight'].astype(int).astype(str)
+
     # Raggruppa i dati per database e numero di record,
-    # poi calcola la media della durata e del throughput per ogni gruppo:
+    # poi calcola media e mediana della durata e del throughput per ogni gruppo:
 
     df_grouped = df.groupby(['database', 'num_records']).agg(
+        repeats=('throughput_records_per_second', 'size'),
         average_duration=('duration_seconds', 'mean'), 
-        average_throughput=('throughput_records_per_second', 'mean') 
+        average_throughput=('throughput_records_per_second', 'mean'),
+        median_throughput=('throughput_records_per_second', 'median')
     ).reset_index() 
 
     print("\nMedie calcolate:")
@@ -76,10 +107,12 @@ def analyze_and_plot_results(file_path='performance_results.csv'):
 
     # Grafico 1: Durata media (Tempo di Esecuzione)
     plt.figure(figsize=(12, 7)) 
-    sns.barplot(x='num_records', y='average_duration', hue='database', data=df_grouped, palette='viridis')
-    plt.title('Durata Media di Inserimento Dati per Database e Volume di Record', fontsize=16)
+    # Barre: mediana delle ripetizioni; barre d'errore: intervallo di confidenza bootstrap al 95%
+    sns.barplot(x='num_records', y='duration_seconds', hue='database', data=df, palette='viridis',
+                estimator='median', errorbar=('ci', 95))
+    plt.title('Durata Mediana di Inserimento Dati per Database e Volume di Record (IC 95%)', fontsize=16)
     plt.xlabel('Numero di Record', fontsize=12)
-    plt.ylabel('Durata Media (secondi)', fontsize=12)
+    plt.ylabel('Durata Mediana (secondi)', fontsize=12)
     plt.legend(title='Database')
     plt.xticks(rotation=45, ha='right')  
     plt.tight_layout() 
@@ -89,10 +122,11 @@ def analyze_and_plot_results(file_path='performance_results.csv'):
 
     # Grafico 2: Throughput medio (Record al Secondo)
     plt.figure(figsize=(12, 7))
-    sns.barplot(x='num_records', y='average_throughput', hue='database', data=df_grouped, palette='magma') 
-    plt.title('Throughput Medio di Inserimento Dati per Database e Volume di Record', fontsize=16)
+    sns.barplot(x='num_records', y='throughput_records_per_second', hue='database', data=df, palette='magma',
+                estimator='median', errorbar=('ci', 95))
+    plt.title('Throughput Mediano di Inserimento Dati per Database e Volume di Record (IC 95%)', fontsize=16)
     plt.xlabel('Numero di Record', fontsize=12)
-    plt.ylabel('Throughput Medio (record/secondo)', fontsize=12)
+    plt.ylabel('Throughput Mediano (record/secondo)', fontsize=12)
     plt.legend(title='Database')
     plt.xticks(rotation=45, ha='right')
     plt.tight_layout()
@@ -100,7 +134,414 @@ def analyze_and_plot_results(file_path='performance_results.csv'):
     print(f" Grafico '{plot_throughput_file}' generato.")
     # plt.show()
 
+    # Grafico 3: Percentili della latenza per batch (se registrati)
+    if 'batch_latency_p50_ms' in df.columns:
+        plot_latency_percentiles(df)
+
+    # Grafico 4: Ripartizione del tempo per fase (se registrata)
+    if 'phase_send_seconds' in df.columns:
+        plot_phase_breakdown(df)
+
+    # Grafico 5: Risorse del client durante i test (se campionate)
+    plot_client_resources(df['run_id'].iloc[0])
+
     print("\n Analisi e generazione grafici completate.")
 
+def plot_latency_percentiles(df):
+    """
+    Genera il grafico dei percentili della latenza per batch (p50, p90, p99, p99.9, max),
+    mediati sulle ripetizioni, per database e volume di record (scala logaritmica).
+    """
+    plot_latency_file = 'batch_latency_percentiles_plot.png'
+
+    percentile_columns = {
+        'batch_latency_p50_ms': 'p50',
+        'batch_latency_p90_ms': 'p90',
+        'batch_latency_p99_ms': 'p99',
+        'batch_latency_p999_ms': 'p99.9',
+        'batch_latency_max_ms': 'max'
+    }
+
+    df_latency = df.groupby(['database', 'num_records'])[list(percentile_columns)].mean().reset_index()
+    df_latency = df_latency.melt(
+        id_vars=['database', 'num_records'], var_name='percentile', value_name='latency_ms'
+    ).dropna(subset=['latency_ms'])
+    df_latency['percentile'] = df_latency['percentile'].map(percentile_columns)
+
+    print("\nPercentili della latenza per batch (ms):")
+    print(df_latency)
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    grid = sns.catplot(
+        x='percentile', y='latency_ms', hue='database', col='num_records', data=df_latency,
+        kind='bar', palette='rocket', order=list(percentile_columns.values()), height=6, aspect=1.2
+    )
+    grid.set(yscale='log')
+    grid.set_axis_labels('Percentile', 'Latenza per Batch (ms)')
+    grid.set_titles('{col_name} record')
+    grid.fig.suptitle('Percentili della Latenza di Invio per Batch', fontsize=16)
+    grid.tight_layout()
+    grid.savefig(plot_latency_file)
+    print(f" Grafico '{plot_latency_file}' generato.")
+
+
+def plot_phase_breakdown(df):
+    """
+    Genera il grafico della ripartizione della durata di inserimento per fase
+    (generate, serialize, send, commit, flush e tempo non attribuito), come quota della
+    somma delle fasi mediata sulle ripetizioni, una barra per database e volume di record.
+    """
+    plot_phase_file = 'phase_breakdown_plot.png'
+
+    phase_columns = [column for column in df.columns if column.startswith('phase_') and column.endswith('_seconds')]
+    df_phases = df.dropna(subset=['phase_send_seconds']).groupby(['database', 'num_records'])[phase_columns].mean()
+    df_phases.columns = [column[len('phase_'):-len('_seconds')] for column in df_phases.columns]
+    df_phases = df_phases.loc[:, df_phases.sum() > 0]
+    df_shares = df_phases.div(df_phases.sum(axis=1), axis=0)
+
+    print("\nRipartizione per fase (secondi):")
+    print(df_phases)
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    ax = df_shares.plot(kind='barh', stacked=True, figsize=(12, 1 + 0.6 * len(df_shares)), colormap='tab10')
+    ax.set_yticklabels([f'{database} - {num_records} record' for database, num_records in df_shares.index])
+    ax.set_xlabel('Quota della Durata')
+    ax.set_ylabel('')
+    ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda value, _: f'{value:.0%}'))
+    ax.legend(title='Fase', bbox_to_anchor=(1.01, 1), loc='upper left')
+    ax.set_title('Ripartizione del Tempo di Inserimento per Fase', fontsize=16)
+    plt.tight_layout()
+    plt.savefig(plot_phase_file)
+    print(f" Grafico '{plot_phase_file}' generato.")
+
+
+def resource_series_label(df):
+    """
+    Etichetta di ogni serie delle risorse del client: database, modalità, sink e worker.
+    """
+    label = df['database'].astype(str)
+    if 'ingest_mode' in df.columns:
+        has_mode = df['ingest_mode'].notna()
+        label[has_mode] = label[has_mode] + ' (' + df.loc[has_mode, 'ingest_mode'] + ')'
+    if 'sink' in df.columns:
+        has_sink = df['sink'].notna()
+        label[has_sink] = label[has_sink] + ' [' + df.loc[has_sink, 'sink'] + ']'
+    if 'worker_id' in df.columns:
+        has_worker = df['worker_id'].notna()
+        label[has_worker] = label[has_worker] + ' w' + df.loc[has_worker, 'worker_id'].astype(int).astype(str)
+    return label
+
+
+def plot_client_resources(run_id):
+    """
+    Genera il grafico delle risorse del client campionate durante i test di inserimento
+    (tabelle 'resource_samples', 'resource_thread_samples' e 'gc_pauses' dell'esecuzione):
+    CPU del processo e RSS nel tempo, CPU media dei thread più carichi e pause del GC.
+    Per leggibilità viene mostrata solo la prima ripetizione di ogni test.
+    """
+    plot_resources_file = 'client_resources_plot.png'
+
+    store = get_results_store()
+    tables = {table: store.read(table, run_id) for table in ('resource_samples', 'resource_thread_samples', 'gc_pauses')}
+    if tables['resource_samples'].empty:
+        return
+
+    for table, df in tables.items():
+        if df.empty:
+            continue
+        if 'repeat' in df.columns:
+            df = df[df['repeat'] == df['repeat'].min()].copy()
+        df['series'] = resource_series_label(df)
+        tables[table] = df
+    df_samples, df_threads, df_gc = tables['resource_samples'], tables['resource_thread_samples'], tables['gc_pauses']
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    fig, axes = plt.subplots(2, 2, figsize=(18, 12))
+
+    sns.lineplot(x='t_seconds', y='cpu_percent', hue='series', data=df_samples, ax=axes[0][0], palette='tab10', marker='o')
+    axes[0][0].axhline(100, color='black', linestyle='--', linewidth=1)
+    axes[0][0].set_title('CPU del Processo Client (100% = un core)')
+    axes[0][0].set_xlabel('Tempo dall\'avvio del test (s)')
+    axes[0][0].set_ylabel('CPU (%)')
+
+    sns.lineplot(x='t_seconds', y='rss_mb', hue='series', data=df_samples, ax=axes[0][1], palette='tab10',
+                 marker='o', legend=False)
+    axes[0][1].set_title('Memoria Residente (RSS) del Client')
+    axes[0][1].set_xlabel('Tempo dall\'avvio del test (s)')
+    axes[0][1].set_ylabel('RSS (MB)')
+
+    if not df_threads.empty:
+        # Media pesata sulla durata degli intervalli (vedi ResourceSampler.top_threads)
+        df_thread_cpu = df_threads.groupby(['series', 'thread'])[['cpu_seconds', 'interval_seconds']].sum().reset_index()
+        df_thread_cpu['cpu_percent'] = df_thread_cpu['cpu_seconds'] / df_thread_cpu['interval_seconds'] * 100
+        sns.barplot(x='cpu_percent', y='thread', hue='series', data=df_thread_cpu, ax=axes[1][0], palette='tab10', legend=False)
+    axes[1][0].set_title('CPU Media per Thread')
+    axes[1][0].set_xlabel('CPU (%)')
+    axes[1][0].set_ylabel('')
+
+    if not df_gc.empty:
+        sns.scatterplot(x='t_seconds', y='pause_ms', hue='series', style='generation', data=df_gc,
+                        ax=axes[1][1], palette='tab10', legend=False)
+        axes[1][1].set_yscale('log')
+    axes[1][1].set_title('Pause del Garbage Collector')
+    axes[1][1].set_xlabel('Tempo dall\'avvio del test (s)')
+    axes[1][1].set_ylabel('Pausa (ms)')
+
+    fig.suptitle('Risorse del Client durante i Test di Inserimento', fontsize=16)
+    fig.tight_layout()
+    fig.savefig(plot_resources_file)
+    print(f" Grafico '{plot_resources_file}' generato.")
+
+
+def plot_scaling_results(df, scaling_column, plot_file, scaling_label):
+    """
+    Genera un grafico di scalabilità: throughput medio al variare di `scaling_column`
+    (numero di worker del test parallelo o batch in volo del motore asincrono),
+    una linea per database/modalità e volume.
+    """
+    df_scaling = df.groupby(['database', 'num_records', scaling_column]).agg(
+        average_throughput=('throughput_records_per_second', 'mean')
+    ).reset_index()
+
+    print(f"\nScalabilità per {scaling_label.lower()}:")
+    print(df_scaling)
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    plt.figure(figsize=(12, 7))
+    sns.lineplot(x=scaling_column, y='average_throughput', hue='database', style='num_records',
+                 data=df_scaling, marker='o', palette='viridis')
+    plt.title(f'Throughput per {scaling_label}', fontsize=16)
+    plt.xlabel(scaling_label, fontsize=12)
+    plt.ylabel('Throughput Medio (record/secondo)', fontsize=12)
+    plt.xticks(sorted(df_scaling[scaling_column].unique()))
+    plt.legend(title='Database')
+    plt.tight_layout()
+    plt.savefig(plot_file)
+    print(f" Grafico '{plot_file}' generato.")
+
+
+def analyze_and_plot_cardinality(run_id=None):
+    """
+    Legge i risultati del benchmark di cardinalità (tabella 'cardinality', di default
+    l'ultima esecuzione) e genera il grafico di scalabilità: throughput, picco di memoria
+    del client e latenza mediana delle query al variare del numero di serie (scala logaritmica).
+    """
+    plot_cardinality_file = 'cardinality_scaling_plot.png'
+
+    try:
+        df = get_results_store().read('cardinality', run_id)
+    except Exception as e:
+        print(f"Errore durante la lettura dei risultati: {e}")
+        return
+
+    if df.empty:
+        print(" Errore: Nessun risultato di cardinalità trovato. Assicurati di aver eseguito prima il benchmark.")
+        return
+
+    if 'ingest_mode' in df.columns:
+        df['database'] = df['database'] + ' (' + df['ingest_mode'] + ')'
+
+    query_columns = [column for column in df.columns
+                     if column.endswith('_p50_ms') and not column.startswith('batch_latency')]
+    df_queries = df.melt(id_vars=['database', 'cardinality'], value_vars=query_columns,
+                         var_name='query', value_name='latency_ms').dropna(subset=['latency_ms'])
+    df_queries['query'] = df_queries['query'].str.replace('_p50_ms', '', regex=False)
+
+    print("\nScalabilità per cardinalità:")
+    print(df[['database', 'cardinality', 'throughput_records_per_second', 'peak_rss_mb']])
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    panels = 3 if not df_queries.empty else 2
+    fig, axes = plt.subplots(1, panels, figsize=(7 * panels, 6))
+
+    sns.lineplot(x='cardinality', y='throughput_records_per_second', hue='database', data=df,
+                 marker='o', palette='viridis', ax=axes[0])
+    axes[0].set_title('Throughput di Inserimento')
+    axes[0].set_ylabel('Throughput Medio (record/secondo)')
+
+    sns.lineplot(x='cardinality', y='peak_rss_mb', hue='database', data=df,
+                 marker='o', palette='viridis', ax=axes[1])
+    axes[1].set_title('Picco di Memoria del Client')
+    axes[1].set_ylabel('Picco RSS (MB)')
+
+    if panels == 3:
+        sns.lineplot(x='cardinality', y='latency_ms', hue='database', style='query', data=df_queries,
+                     marker='o', palette='viridis', ax=axes[2])
+        axes[2].set_title('Latenza Mediana delle Query')
+        axes[2].set_ylabel('Latenza p50 (ms)')
+        axes[2].set_yscale('log')
+
+    for ax in axes:
+        ax.set_xscale('log')
+        ax.set_xlabel('Numero di Serie (device distinti)')
+
+    fig.suptitle('Scalabilità per Cardinalità delle Serie', fontsize=16)
+    fig.tight_layout()
+    fig.savefig(plot_cardinality_file)
+    print(f" Grafico '{plot_cardinality_file}' generato.")
+
+
+def analyze_and_plot_tuning(run_id=None):
+    """
+    Legge le prove del tuning automatico (tabella 'tuning_trials', di default l'ultima
+    esecuzione) e genera la curva di risposta di ogni backend: throughput e latenza
+    rispetto al budget al variare della dimensione del batch, e throughput al variare
+    del secondo parametro (flush interval o page size). Le prove fuori budget sono segnate con una x.
+    """
+    plot_tuning_file = 'tuning_response_curve.png'
+
+    try:
+        df = get_results_store().read('tuning_trials', run_id)
+    except Exception as e:
+        print(f"Errore durante la lettura dei risultati: {e}")
+        return
+
+    if df.empty:
+        print(" Errore: Nessuna prova di tuning trovata. Assicurati di aver eseguito prima il tuning.")
+        return
+
+    df['within_budget'] = df['within_budget'].astype(bool)
+    databases = list(df['database'].unique())
+
+    print("\nCurva di risposta del tuning:")
+    print(df[['database', 'stage', 'batch_size', 'flush_interval_ms', 'page_size',
+              'throughput_records_per_second', 'budget_latency_ms', 'within_budget']])
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    fig, axes = plt.subplots(len(databases), 3, figsize=(21, 6 * len(databases)), squeeze=False)
+
+    def plot_curve(ax, data, x, y):
+        data = data.sort_values(x)
+        ax.plot(data[x], data[y], color='grey', alpha=0.5)
+        within, outside = data[data['within_budget']], data[~data['within_budget']]
+        ax.scatter(within[x], within[y], marker='o', color='tab:green', label='entro il budget')
+        ax.scatter(outside[x], outside[y], marker='x', color='tab:red', label='fuori budget')
+        ax.set_xscale('log')
+
+    for row, database in enumerate(databases):
+        df_database = df[df['database'] == database]
+        df_batch = df_database[df_database['stage'] == 'batch_size']
+        df_second = df_database[df_database['stage'] != 'batch_size']
+        mode = df_database['ingest_mode'].iloc[0]
+
+        plot_curve(axes[row][0], df_batch, 'batch_size', 'throughput_records_per_second')
+        axes[row][0].set_title(f'{database} ({mode}): Throughput')
+        axes[row][0].set_xlabel('Dimensione del Batch (record)')
+        axes[row][0].set_ylabel('Throughput (record/secondo)')
+        axes[row][0].legend()
+
+        plot_curve(axes[row][1], df_batch, 'batch_size', 'budget_latency_ms')
+        axes[row][1].axhline(df_database['latency_budget_ms'].iloc[0], color='black', linestyle='--', label='budget')
+        axes[row][1].set_title(f'{database} ({mode}): Latenza per Batch')
+        axes[row][1].set_xlabel('Dimensione del Batch (record)')
+        axes[row][1].set_ylabel('Latenza (ms)')
+        axes[row][1].set_yscale('log')
+        axes[row][1].legend()
+
+        if df_second.empty:
+            axes[row][2].set_visible(False)
+            continue
+        parameter = 'flush_interval_ms' if df_second['stage'].iloc[0] == 'flush_interval' else 'page_size'
+        plot_curve(axes[row][2], df_second, parameter, 'throughput_records_per_second')
+        axes[row][2].set_title(f'{database}: Throughput con batch {int(df_second["batch_size"].iloc[0])}')
+        axes[row][2].set_xlabel('Flush Interval (ms)' if parameter == 'flush_interval_ms' else 'Page Size (righe per INSERT)')
+        axes[row][2].set_ylabel('Throughput (record/secondo)')
+        axes[row][2].legend()
+
+    fig.suptitle('Tuning di Batch Size, Flush Interval e Page Size', fontsize=16)
+    fig.tight_layout()
+    fig.savefig(plot_tuning_file)
+    print(f" Grafico '{plot_tuning_file}' generato.")
+
+
+def analyze_and_plot_fleet(run_id=None):
+    """
+    Legge le prove del simulatore di flotta (tabelle 'fleet_trials' e 'fleet_timeline', di default
+    l'ultima esecuzione) e genera per ogni backend: frequenza ottenuta rispetto a quella pianificata
+    (le prove non sostenibili sono segnate con una x), profondità della coda e ritardo massimo
+    rispetto alla pianificazione nel tempo, una curva per frequenza provata.
+    """
+    plot_fleet_file = 'fleet_sustained_rate.png'
+
+    try:
+        df = get_results_store().read('fleet_trials', run_id)
+        df_timeline = get_results_store().read('fleet_timeline', run_id)
+    except Exception as e:
+        print(f"Errore durante la lettura dei risultati: {e}")
+        return
+
+    if df.empty:
+        print(" Errore: Nessuna prova della flotta trovata. Assicurati di aver eseguito prima il simulatore.")
+        return
+
+    df['sustainable'] = df['sustainable'].astype(bool)
+    databases = list(df['database'].unique())
+
+    print("\nFrequenze provate dal simulatore di flotta:")
+    print(df[['database', 'stage', 'target_points_per_second', 'achieved_points_per_second',
+              'send_lag_p99_ms', 'max_queue_depth_points', 'sustainable']])
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    fig, axes = plt.subplots(len(databases), 3, figsize=(21, 6 * len(databases)), squeeze=False)
+
+    for row, database in enumerate(databases):
+        df_database = df[df['database'] == database].sort_values('target_points_per_second')
+        mode = df_database['ingest_mode'].iloc[0]
+
+        ax = axes[row][0]
+        sustainable, unsustainable = df_database[df_database['sustainable']], df_database[~df_database['sustainable']]
+        limits = [df_database['target_points_per_second'].min(), df_database['target_points_per_second'].max()]
+        ax.plot(limits, limits, color='black', linestyle='--', label='obiettivo')
+        ax.scatter(sustainable['target_points_per_second'], sustainable['achieved_points_per_second'],
+                   marker='o', color='tab:green', label='sostenibile')
+        ax.scatter(unsustainable['target_points_per_second'], unsustainable['achieved_points_per_second'],
+                   marker='x', color='tab:red', label='non sostenibile')
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_title(f'{database} ({mode}): Frequenza Ottenuta')
+        ax.set_xlabel('Frequenza Pianificata (punti/secondo)')
+        ax.set_ylabel('Frequenza Ottenuta (punti/secondo)')
+        ax.legend()
+
+        if df_timeline.empty:
+            axes[row][1].set_visible(False)
+            axes[row][2].set_visible(False)
+            continue
+        df_series = df_timeline[df_timeline['database'] == database].copy()
+        df_series['trial'] = df_series['target_points_per_second'].astype(int).astype(str) + ' (' + df_series['stage'] + ')'
+
+        sns.lineplot(x='time_seconds', y='queue_depth_points', hue='trial', data=df_series,
+                     palette='viridis', ax=axes[row][1])
+        axes[row][1].set_title(f'{database}: Profondità della Coda')
+        axes[row][1].set_xlabel('Tempo (s)')
+        axes[row][1].set_ylabel('Punti in coda (massimo per finestra)')
+
+        sns.lineplot(x='time_seconds', y='send_lag_max_ms', hue='trial', data=df_series,
+                     palette='viridis', ax=axes[row][2])
+        axes[row][2].set_title(f'{database}: Ritardo rispetto alla Pianificazione')
+        axes[row][2].set_xlabel('Tempo (s)')
+        axes[row][2].set_ylabel('Ritardo massimo (ms)')
+        axes[row][2].set_yscale('log')
+
+    fig.suptitle('Frequenza Sostenibile della Flotta di Dispositivi', fontsize=16)
+    fig.tight_layout()
+    fig.savefig(plot_fleet_file)
+    print(f" Grafico '{plot_fleet_file}' generato.")
+
+
 if __name__ == "__main__":
     analyze_and_plot_results()
\ No newline at end of file
@@ -1,11 +1,15 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import os
+from results_store import get_results_store
 
 
-def analyze_and_plot_results_query(file_path='query_results.csv'):
-    
+def analyze_and_plot_results_query(run_id=None):
+    """
+    Legge i tempi delle query dall'archivio dei risultati (tabella 'queries',
+    di default l'ultima esecuzione) e genera il grafico del tempo mediano per query,
+    con l'intervallo di confidenza bootstrap delle ripetizioni.
+    """
 
     plot_query_time_file = 'average_time_for_query.png'
 
@@ -24,26 +28,32 @@ def analyze_and_plot_results_query(file_path='query_results.csv'):
     elif removed_plot_duration_file == False:
         print(f"il File '{plot_query_time_file}' non è stato rimosso " )
     
-    if not os.path.exists(file_path):
-        print(f" Errore: Il file '{file_path}' non è stato trovato. Assicurati di aver eseguito prima i test.")
+    try:
+        df = get_results_store().read('queries', run_id, columns=[
+            'run_id', 'database', 'query', 'duration_seconds', 'result_mode', 'time_to_first_row_seconds'
+        ])
+    except Exception as e:
+        print(f"Errore nella lettura dei risultati: {e}")
         return
-    
-    
-    print(f" Analizzando i risultati dal file: {file_path}...")
 
+    if df.empty:
+        print(" Errore: Nessun risultato delle query trovato. Assicurati di aver eseguito prima i test.")
+        return
 
-    try:
-        df = pd.read_csv(file_path)
-        print(f"Dati presenti in {plot_query_time_file} letti con successo")
-        print(df.head())
+    print(f" Analizzando i risultati dell'esecuzione {df['run_id'].iloc[0]}...")
+    print(df.head())
 
-    except Exception as e:
-        print(f"Errore nella lettura del file CSV: {e}")
-        return
+    # Con più modalità di lettura dei risultati ogni modalità compare come serie separata
+    if 'result_mode' in df.columns and df['result_mode'].nunique() > 1:
+        df['database'] = df['database'] + ' (' + df['result_mode'] + ')'
+        plot_time_to_first_row(df)
     
     df_grouped = df.groupby(['database', 'query']).agg(
-        average_duration = ('duration_seconds', 'mean')
+        repeats = ('duration_seconds', 'size'),
+        average_duration = ('duration_seconds', 'mean'),
+        median_duration = ('duration_seconds', 'median')
     ).reset_index()
+    print(df_grouped)
 
     #  Genera i grafici
 
@@ -57,19 +67,22 @@ def analyze_and_plot_results_query(file_path='query_results.csv'):
 
     plt.figure(figsize=(12, 7)) 
 
+    # Barre: mediana delle ripetizioni; barre d'errore: intervallo di confidenza bootstrap al 95%
     sns.barplot(
         x='query',
-        y='average_duration',
+        y='duration_seconds',
         hue='database',
-        data=df_grouped,
-        palette='Set2'  
+        data=df,
+        palette='Set2',
+        estimator='median',
+        errorbar=('ci', 95)
     )
 
-    plt.title('Durata Media di esecuzione query per database', fontsize=16)
+    plt.title('Durata Mediana di esecuzione query per database (IC 95%)', fontsize=16)
 
     plt.xlabel('nome Query', fontsize=15)
 
-    plt.ylabel('Durata Media (secondi)', fontsize=12)
+    plt.ylabel('Durata Mediana (secondi)', fontsize=12)
 
     plt.legend(title='Database')
 
@@ -81,6 +94,182 @@ def analyze_and_plot_results_query(file_path='query_results.csv'):
 
     print("\n✅ Analisi e grafico completate.")
 
+
+def plot_time_to_first_row(df):
+    """
+    Scompone la durata media di ogni query in tempo al primo record (esecuzione sul server
+    e trasferimento) e tempo restante (lettura e decodifica lato client), per modalità di lettura.
+    """
+    plot_first_row_file = 'query_time_to_first_row.png'
+
+    df_split = df.dropna(subset=['time_to_first_row_seconds']).groupby(['database', 'query']).agg(
+        first_row=('time_to_first_row_seconds', 'mean'),
+        total=('duration_seconds', 'mean')
+    ).reset_index()
+    if df_split.empty:
+        print(" Nessun tempo al primo record misurato (solo modalità con cursori lato client o materialize).")
+        return
+    df_split['client_decoding'] = df_split['total'] - df_split['first_row']
+
+    queries = list(df_split['query'].unique())
+    fig, axes = plt.subplots(1, len(queries), figsize=(7 * len(queries), 6), squeeze=False)
+
+    for ax, query_name in zip(axes[0], queries):
+        df_query = df_split[df_split['query'] == query_name]
+        ax.barh(df_query['database'], df_query['first_row'], label='Tempo al primo record')
+        ax.barh(df_query['database'], df_query['client_decoding'], left=df_query['first_row'],
+                label='Lettura e decodifica')
+        ax.set_title(query_name)
+        ax.set_xlabel('Durata Media (secondi)')
+
+    axes[0][0].legend()
+    fig.suptitle('Tempo al primo record e decodifica per modalità di lettura', fontsize=16)
+    fig.tight_layout()
+    fig.savefig(plot_first_row_file)
+    print(f" Grafico '{plot_first_row_file}' generato.")
+
+def analyze_and_plot_query_load(run_id=None):
+    """
+    Legge i risultati del test di carico dall'archivio (tabella 'query_load', di default
+    l'ultima esecuzione) e genera il grafico dei percentili della latenza di risposta
+    per query e database.
+    """
+    plot_query_load_file = 'query_load_latency.png'
+
+    try:
+        df = get_results_store().read('query_load', run_id)
+    except Exception as e:
+        print(f"Errore nella lettura dei risultati: {e}")
+        return
+
+    if df.empty:
+        print(" Errore: Nessun risultato del test di carico trovato. Assicurati di aver eseguito prima il test di carico.")
+        return
+
+    percentile_columns = {
+        'latency_p50_ms': 'p50',
+        'latency_p90_ms': 'p90',
+        'latency_p99_ms': 'p99',
+        'latency_p999_ms': 'p99.9',
+    }
+
+    df_latency = df.melt(
+        id_vars=['database', 'query'], value_vars=list(percentile_columns),
+        var_name='percentile', value_name='latency_ms'
+    ).dropna(subset=['latency_ms'])
+    df_latency['percentile'] = df_latency['percentile'].map(percentile_columns)
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    grid = sns.catplot(
+        x='query', y='latency_ms', hue='percentile', col='database', data=df_latency,
+        kind='bar', palette='Set2', hue_order=list(percentile_columns.values()), height=6, aspect=1.2
+    )
+    grid.set(yscale='log')
+    grid.set_axis_labels('nome Query', 'Latenza di risposta (ms)')
+    grid.set_xticklabels(rotation=45, ha='right')
+    grid.fig.suptitle('Latenza delle query sotto carico concorrente', fontsize=16)
+    grid.tight_layout()
+    grid.savefig(plot_query_load_file)
+    print(f" Grafico '{plot_query_load_file}' generato.")
+
+
+def analyze_and_plot_mixed_workload(run_id=None):
+    """
+    Genera il grafico della timeline dello scenario misto (tabella 'mixed_workload_timeline',
+    di default l'ultima esecuzione): per ogni database
+    il throughput di inserimento e la latenza delle query (p50 e p99) sullo stesso asse temporale.
+    """
+    plot_mixed_file = 'mixed_workload_timeline.png'
+
+    try:
+        df = get_results_store().read('mixed_workload_timeline', run_id)
+    except Exception as e:
+        print(f"Errore nella lettura dei risultati: {e}")
+        return
+
+    if df.empty:
+        print(" Errore: Nessun risultato dello scenario misto trovato. Assicurati di aver eseguito prima lo scenario misto.")
+        return
+
+    databases = list(df['database'].unique())
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    fig, axes = plt.subplots(2, len(databases), figsize=(8 * len(databases), 9), sharex='col', squeeze=False)
+
+    for column, database_name in enumerate(databases):
+        df_db = df[df['database'] == database_name]
+
+        ax_ingest = axes[0][column]
+        ax_ingest.plot(df_db['time_seconds'], df_db['ingest_records_per_second'], color='tab:blue')
+        ax_ingest.set_title(database_name, fontsize=14)
+        ax_ingest.set_ylabel('Inserimento (record/secondo)', fontsize=12)
+
+        ax_query = axes[1][column]
+        ax_query.plot(df_db['time_seconds'], df_db['query_latency_p50_ms'], label='p50', color='tab:green')
+        ax_query.plot(df_db['time_seconds'], df_db['query_latency_p99_ms'], label='p99', color='tab:red')
+        ax_query.set_yscale('log')
+        ax_query.set_xlabel('Tempo (secondi)', fontsize=12)
+        ax_query.set_ylabel('Latenza query (ms)', fontsize=12)
+        ax_query.legend(title='Percentile')
+
+        # Linea verticale all'inizio della fase con inserimento concorrente
+        contention = df_db[df_db['phase'] == 'contention']
+        if not contention.empty:
+            for ax in (ax_ingest, ax_query):
+                ax.axvline(contention['time_seconds'].min(), color='gray', linestyle='--')
+
+    fig.suptitle('Latenza delle query durante l\'inserimento sostenuto', fontsize=16)
+    fig.tight_layout()
+    fig.savefig(plot_mixed_file)
+    print(f" Grafico '{plot_mixed_file}' generato.")
+
+
+def analyze_and_plot_freshness(run_id=None):
+    """
+    Genera il grafico del benchmark di freschezza (tabella 'freshness_samples', di default
+    l'ultima esecuzione): a sinistra la distribuzione del ritardo scrittura-visibilità per
+    carico di inserimento, a destra la distribuzione cumulativa per database e modalità.
+    """
+    plot_freshness_file = 'freshness_latency.png'
+
+    try:
+        df = get_results_store().read('freshness_samples', run_id)
+    except Exception as e:
+        print(f"Errore nella lettura dei risultati: {e}")
+        return
+
+    if df.empty:
+        print(" Errore: Nessun risultato di freschezza trovato. Assicurati di aver eseguito prima il benchmark di freschezza.")
+        return
+
+    df['series'] = df['database'] + ' (' + df['ingest_mode'] + ')'
+
+    sns.set_theme(style="whitegrid")
+    plt.style.use('ggplot')
+
+    fig, (ax_box, ax_ecdf) = plt.subplots(1, 2, figsize=(16, 7))
+
+    sns.boxplot(x='load_records_per_second', y='write_to_visible_ms', hue='series', data=df,
+                ax=ax_box, palette='Set2')
+    ax_box.set_yscale('log')
+    ax_box.set_xlabel('Carico di inserimento (record/secondo)', fontsize=12)
+    ax_box.set_ylabel('Ritardo scrittura-visibilità (ms)', fontsize=12)
+    ax_box.legend(title='Database')
+
+    sns.ecdfplot(x='write_to_visible_ms', hue='series', data=df, ax=ax_ecdf, palette='Set2', log_scale=True)
+    ax_ecdf.set_xlabel('Ritardo scrittura-visibilità (ms)', fontsize=12)
+    ax_ecdf.set_ylabel('Frazione dei marker', fontsize=12)
+
+    fig.suptitle('Freschezza: tempo dalla scrittura alla visibilità nelle query', fontsize=16)
+    fig.tight_layout()
+    fig.savefig(plot_freshness_file)
+    print(f" Grafico '{plot_freshness_file}' generato.")
+
+
 if __name__ == "__main__":
     analyze_and_plot_results_query()
 
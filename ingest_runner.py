@@ -0,0 +1,266 @@
+import time
+import os
+from pipeline import send_stream, reset_peak_rss, peak_rss_mb
+from latency import LatencyHistogram
+from profiling import PhaseTimer, profile_run
+from resource_sampler import ResourceSampler
+from null_sink import connect_to_null_influx, connect_to_null_timescale
+from sensors import (
+    connect_to_influx, connect_to_timescale, send_batch_to_influxdb, send_batch_to_timescaledb,
+    INFLUX_FLUSH_INTERVAL_MS, INFLUX_BUFFER_BATCHES, InfluxWriteTracker
+)
+
+
+# Parametri dei test di inserimento su un singolo backend, condivisi da main.py e dagli
+# altri benchmark (tuning_sweep.py, cardinality_benchmark.py, fleet_simulator.py,
+# mixed_workload.py, freshness_benchmark.py)
+
+# Dimensione di default dei batch dello stream (deve coincidere con quella dei batch inviati)
+BATCH_SIZE = 1000
+
+# Device distinti e seed del generatore dei dati: stesso seed --> stessa sequenza di dati
+NUM_DEVICES = 10
+SEED = 42
+
+# Attesa massima (s) delle conferme InfluxDB dopo il flush (modalità acknowledged e synchronous)
+INFLUX_ACK_TIMEOUT = 300
+
+# Serializzazione dei batch InfluxDB: "line_protocol" (un payload per batch) o "point" (un Point per record)
+INFLUX_SERIALIZER = "line_protocol"
+
+# Profilazione (profiling.py): None, "cprofile" o "sampling". Ogni test di inserimento (per backend
+# e modalità, e per ogni worker nei test paralleli) scrive un file di profilo in profiling.PROFILE_DIR.
+# I tempi cumulativi per fase (generate, serialize, send, commit, flush) sono sempre salvati.
+PROFILER = None
+
+
+def run_influx_test(num_records_generated, batches, write_mode, barrier=None, null_sink=None,
+                    batch_size=BATCH_SIZE, flush_interval=INFLUX_FLUSH_INTERVAL_MS,
+                    buffer_batches=INFLUX_BUFFER_BATCHES):
+    """
+    Esegue l'inserimento dello stream `batches` in InfluxDB con la modalità di
+    scrittura `write_mode` (batching, acknowledged o synchronous).
+    Se viene passata una barrier (test parallelo) si attende che tutti i worker
+    siano connessi prima di avviare il timer.
+    Con null_sink ("discard" o "loopback") i batch vanno al sink nullo invece che al server.
+    batch_size deve coincidere con la dimensione dei batch dello stream; flush_interval (ms)
+    e buffer_batches (batch per richiesta) regolano il buffer della write API (vedi connect_to_influx).
+
+    In batching il tempo si ferma appena i punti sono stati accodati (misura ottimistica).
+    In acknowledged e synchronous il tempo si ferma solo quando il server ha confermato
+    tutti i punti e il throughput è calcolato sui record confermati.
+
+    Ritorna il dizionario delle metriche oppure None se il test non è andato a buon fine.
+    """
+    metrics = None
+
+    print(f" Tentativo di connessione al client InfluxDB per --> {os.getenv('INFLUX_URL')}...")
+
+    tracker = InfluxWriteTracker(synchronous=(write_mode == "synchronous"))
+    if null_sink:
+        influx_client, influx_write_api = connect_to_null_influx(
+            batch_size, write_mode, tracker, INFLUX_SERIALIZER, null_sink, flush_interval, buffer_batches
+        )
+    else:
+        influx_client, influx_write_api = connect_to_influx(
+            batch_size, write_mode, tracker, INFLUX_SERIALIZER, flush_interval, buffer_batches
+        )
+
+    if influx_client and influx_write_api:
+        try:
+            if barrier:
+                barrier.wait()
+
+            print(f"\n Avvio inserimento dati in InfluxDB ({write_mode}) per {num_records_generated} record...")
+
+            reset_peak_rss()
+            latency_histogram = LatencyHistogram()
+            phase_timer = PhaseTimer()
+            bucket, org = os.getenv("INFLUX_BUCKET"), os.getenv("INFLUX_ORG")
+
+            start_time_influx = time.perf_counter() # INIZIO DEL COUNTER TEMPORALE
+
+            records_influx = send_stream(
+                batches,
+                lambda batch: send_batch_to_influxdb(
+                    batch, influx_write_api, bucket, org, tracker, INFLUX_SERIALIZER, phase_timer
+                ),
+                latency_histogram,
+                phase_timer
+            )
+
+            if write_mode == "batching":
+                end_time_influx = time.perf_counter() 
+            else:
+                # close() svuota il buffer e attende la fine delle scritture in background
+                with phase_timer.phase("flush"):
+                    influx_write_api.close()
+                    if not tracker.wait_until_complete(timeout=INFLUX_ACK_TIMEOUT):
+                        print(f" Attenzione: {tracker.submitted - tracker.acknowledged - tracker.failed} punti InfluxDB senza conferma.")
+                end_time_influx = tracker.last_ack_time or time.perf_counter()
+                records_influx = tracker.acknowledged
+
+            # Calcola le metriche
+            duration_influx = (end_time_influx - start_time_influx)
+            throughput_influx = (records_influx / duration_influx) if duration_influx > 0 else 0
+            peak_rss_influx = peak_rss_mb()
+            print(f" InfluxDB ({write_mode}) --> Completato. Tempo: {duration_influx:.2f} s, Throughput: {throughput_influx:.2f} r/s, Picco RSS: {peak_rss_influx:.1f} MB")
+            print(f" Ripartizione per fase: {phase_timer.report(duration_influx)}")
+
+            metrics = {
+                'database': 'InfluxDB',
+                'ingest_mode': write_mode,
+                'serializer': INFLUX_SERIALIZER,
+                'sink': null_sink,
+                'batch_size': batch_size,
+                'flush_interval_ms': flush_interval if write_mode != "synchronous" else None,
+                'buffer_batches': buffer_batches if write_mode != "synchronous" else None,
+                'duration': duration_influx,
+                'throughput': throughput_influx,
+                'records_sent': records_influx,
+                'peak_rss_mb': peak_rss_influx,
+                'records_acknowledged': tracker.acknowledged if write_mode != "batching" else None,
+                'records_failed': tracker.failed,
+                **latency_histogram.summary(),
+                # Latenza dall'invio alla conferma di ogni batch (non misurabile in batching)
+                **(tracker.ack_latency.summary('ack_latency') if write_mode != "batching" else {}),
+                **phase_timer.summary(duration_influx),
+                'latency_histogram': latency_histogram,
+                'phase_timer': phase_timer
+            }
+
+        except Exception as e:
+            
+            print(f"Errore durante l'inserimento in InfluxDB: {e}")
+        finally:
+            
+            if influx_write_api: 
+                print("Chiusura di influx_write_api e svuotamento del buffer")
+                influx_write_api.close()
+            if influx_client: 
+                print("Chiusura della connessione influx_client")
+                influx_client.close()
+
+    else:
+        print("Connessione InfluxDB fallita, test saltato")
+        if barrier:
+            barrier.abort()
+
+    return metrics
+
+
+def run_timescale_test(num_records_generated, batches, ingest_mode, barrier=None, null_sink=None,
+                       batch_size=BATCH_SIZE, page_size=None):
+    """
+    Esegue l'inserimento dello stream `batches` in TimescaleDB con la modalità
+    `ingest_mode` (execute_values, copy_text o copy_binary).
+    Se viene passata una barrier (test parallelo) si attende che tutti i worker
+    siano connessi prima di avviare il timer.
+    Con null_sink ("discard" o "loopback") i batch vanno al sink nullo invece che al server.
+    batch_size deve coincidere con la dimensione dei batch dello stream; page_size è il numero
+    di righe per INSERT con execute_values (di default batch_size).
+    Ritorna il dizionario delle metriche oppure None se il test non è andato a buon fine.
+    """
+    metrics = None
+
+    print(f"\nTentativo di connessione a TimescaleDB...")
+    ts_conn = connect_to_null_timescale(null_sink) if null_sink else connect_to_timescale()
+
+    if ts_conn:
+        try:
+            if barrier:
+                barrier.wait()
+
+            print(f"\n Avvio dell'inserimento dati in TimescaleDB ({ingest_mode}) per {num_records_generated} record....")
+
+            reset_peak_rss()
+            latency_histogram = LatencyHistogram()
+            phase_timer = PhaseTimer()
+
+            # INIZIO DEL COUNTER
+            start_time_ts = time.perf_counter()
+
+            records_ts = send_stream(
+                batches,
+                lambda batch: send_batch_to_timescaledb(batch, ts_conn, batch_size, ingest_mode, page_size, phase_timer),
+                latency_histogram,
+                phase_timer
+            )
+
+            end_time_ts = time.perf_counter()
+
+            
+            duration_ts = (end_time_ts - start_time_ts)
+            throughput_ts = (records_ts / duration_ts) if duration_ts > 0 else 0
+            peak_rss_ts = peak_rss_mb()
+            print(f" TimescaleDB ({ingest_mode}) --> Completato. Tempo: {duration_ts:.2f} s, Throughput: {throughput_ts:.2f} r/s, Picco RSS: {peak_rss_ts:.1f} MB")
+            print(f" Ripartizione per fase: {phase_timer.report(duration_ts)}")
+
+            metrics = {
+                'database': 'TimescaleDB',
+                'ingest_mode': ingest_mode,
+                'sink': null_sink,
+                'batch_size': batch_size,
+                'page_size': (page_size or batch_size) if ingest_mode == "execute_values" else None,
+                'duration': duration_ts,
+                'throughput': throughput_ts,
+                'records_sent': records_ts,
+                'peak_rss_mb': peak_rss_ts,
+                **latency_histogram.summary(),
+                **phase_timer.summary(duration_ts),
+                'latency_histogram': latency_histogram,
+                'phase_timer': phase_timer
+            }
+
+        except Exception as e:
+            
+            print(f" Errore durante l'inserimento in TimescaleDB: {e}")
+        finally:
+            
+            if ts_conn:
+                print("Chiusura della connessione TimescaleDB.")
+                ts_conn.close()
+    else:
+        print("Connessione TimescaleDB fallita, test salatato.")
+        if barrier:
+            barrier.abort()
+
+    return metrics
+
+
+def run_backend_test(database_name, num_records_generated, batches, mode, barrier=None, null_sink=None,
+                     batch_size=BATCH_SIZE, flush_interval=INFLUX_FLUSH_INTERVAL_MS, page_size=None,
+                     buffer_batches=INFLUX_BUFFER_BATCHES):
+    """
+    Esegue il test di inserimento per il database indicato ('InfluxDB' o 'TimescaleDB')
+    con la modalità `mode` (modalità di scrittura InfluxDB o di inserimento TimescaleDB).
+    flush_interval e buffer_batches si applicano solo a InfluxDB, page_size solo a TimescaleDB.
+    Con PROFILER impostato il test viene profilato (vedi profiling.profile_run).
+
+    Per tutto il test (connessione compresa) le risorse del client sono campionate in background
+    (resource_sampler.py): il riepilogo viene aggiunto alle metriche ('client_...') e le serie
+    temporali restano in 'resource_series', da salvare con save_resource_series.
+    """
+    with profile_run(PROFILER, f"{database_name}-{mode}-{num_records_generated}"), ResourceSampler() as sampler:
+        if database_name == 'InfluxDB':
+            metrics = run_influx_test(
+                num_records_generated, batches, mode, barrier, null_sink, batch_size, flush_interval, buffer_batches
+            )
+        else:
+            metrics = run_timescale_test(num_records_generated, batches, mode, barrier, null_sink, batch_size, page_size)
+
+    if metrics:
+        metrics.update(sampler.summary())
+        metrics['resource_series'] = sampler.series()
+    return metrics
+
+
+# Metriche non scalari (istogrammi, timer, serie temporali) da non salvare come colonne
+NON_SCALAR_METRICS = ('latency_histogram', 'phase_timer', 'resource_series')
+
+
+def scalar_metrics(metrics):
+    """
+    Ritorna le metriche senza quelle non scalari (vedi NON_SCALAR_METRICS).
+    """
+    return {key: value for key, value in metrics.items() if key not in NON_SCALAR_METRICS}
@@ -0,0 +1,90 @@
+import math
+import numpy as np
+
+
+# Percentili salvati nei risultati per ogni istogramma (nome colonna --> percentile)
+LATENCY_PERCENTILES = {
+    'p50': 50.0,
+    'p90': 90.0,
+    'p99': 99.0,
+    'p999': 99.9,
+}
+
+
+class LatencyHistogram:
+    """
+    Istogramma di latenze a bucket logaritmici: ogni bucket copre un intervallo
+    largo `precision` (relativo) del suo limite inferiore, quindi l'errore sui
+    percentili resta entro quella precisione a qualsiasi scala, con memoria fissa.
+    Minimo e massimo vengono registrati in modo esatto.
+    Più istogrammi con la stessa configurazione possono essere uniti con merge().
+    """
+
+    def __init__(self, lowest_seconds=1e-6, highest_seconds=3600.0, precision=0.01):
+        self.lowest_seconds = lowest_seconds
+        self.highest_seconds = highest_seconds
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        num_buckets = int(math.ceil(math.log(highest_seconds / lowest_seconds) / self._log_base)) + 1
+        self.counts = np.zeros(num_buckets, dtype=np.int64)
+        self.count = 0
+        self.total_seconds = 0.0
+        self.min_seconds = None
+        self.max_seconds = None
+
+    def _bucket(self, seconds):
+        if seconds <= self.lowest_seconds:
+            return 0
+        index = int(math.log(seconds / self.lowest_seconds) / self._log_base)
+        return min(index, len(self.counts) - 1)
+
+    def _bucket_upper_bound(self, index):
+        return self.lowest_seconds * (1 + self.precision) ** (index + 1)
+
+    def record(self, seconds):
+        """
+        Registra una latenza espressa in secondi.
+        """
+        self.counts[self._bucket(seconds)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        self.min_seconds = seconds if self.min_seconds is None else min(self.min_seconds, seconds)
+        self.max_seconds = seconds if self.max_seconds is None else max(self.max_seconds, seconds)
+
+    def merge(self, other):
+        """
+        Somma nell'istogramma corrente i campioni di `other` (stessa configurazione).
+        """
+        if len(other.counts) != len(self.counts) or other.precision != self.precision:
+            raise ValueError("Impossibile unire istogrammi con configurazioni diverse")
+        self.counts += other.counts
+        self.count += other.count
+        self.total_seconds += other.total_seconds
+        for value in (other.min_seconds, other.max_seconds):
+            if value is not None:
+                self.min_seconds = value if self.min_seconds is None else min(self.min_seconds, value)
+                self.max_seconds = value if self.max_seconds is None else max(self.max_seconds, value)
+        return self
+
+    def percentile(self, percentile):
+        """
+        Ritorna la latenza (secondi) al percentile indicato (0-100), oppure None se vuoto.
+        Il valore è il limite superiore del bucket, limitato al massimo osservato.
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(math.ceil(percentile / 100.0 * self.count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self._bucket_upper_bound(index), self.max_seconds)
+
+    def summary(self, prefix='batch_latency'):
+        """
+        Ritorna i percentili di LATENCY_PERCENTILES e il massimo in millisecondi,
+        con chiavi del tipo '<prefix>_p99_ms', pronte per i risultati.
+        """
+        summary = {}
+        for name, percentile in LATENCY_PERCENTILES.items():
+            value = self.percentile(percentile)
+            summary[f'{prefix}_{name}_ms'] = value * 1000 if value is not None else None
+        summary[f'{prefix}_max_ms'] = self.max_seconds * 1000 if self.max_seconds is not None else None
+        return summary
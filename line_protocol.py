@@ -0,0 +1,65 @@
+import numpy as np
+from device import is_columnar_batch, records_to_columnar_batch
+
+
+# Nome della measurement usata da tutte le scritture su InfluxDB
+MEASUREMENT = "sensor_data"
+
+
+"""  ESCAPE (stesse regole di influxdb_client.Point)  """
+
+ESCAPE_MEASUREMENT = str.maketrans({",": "\\,", " ": "\\ ", "\n": "\\n", "\t": "\\t", "\r": "\\r"})
+ESCAPE_TAG = str.maketrans({",": "\\,", "=": "\\=", " ": "\\ ", "\n": "\\n", "\t": "\\t", "\r": "\\r"})
+
+
+def escape_measurement(value):
+    """
+    Escape del nome di una measurement: virgole, spazi e caratteri di controllo.
+    """
+    return value.translate(ESCAPE_MEASUREMENT)
+
+
+def escape_tag(value):
+    """
+    Escape di chiavi e valori dei tag: virgole, uguali, spazi e caratteri di controllo.
+    """
+    return value.translate(ESCAPE_TAG)
+
+
+"""  SERIALIZZAZIONE  """
+
+def batch_to_line_protocol(data_batch, measurement=MEASUREMENT):
+    """
+    Serializza un intero batch in line protocol in un'unica passata, senza creare oggetti Point.
+
+    Il prefisso "measurement,device=..." viene calcolato una sola volta per ogni device distinto,
+    i valori numerici vengono estratti dagli array con tolist() e i timestamp restano interi
+    in nanosecondi (precisione NS). I field sono in ordine alfabetico come in Point.
+
+    Parametri:
+        - data_batch: batch colonnare (generate_columnar_batch) oppure lista di dizionari
+        - measurement: nome della measurement
+
+    Ritorna:
+        - bytes UTF-8 con una riga per record separate da "\n"
+    """
+    if not is_columnar_batch(data_batch):
+        data_batch = records_to_columnar_batch(data_batch)
+
+    escaped_measurement = escape_measurement(measurement)
+    prefixes = {
+        device: f"{escaped_measurement},device={escape_tag(device)} humidity="
+        for device in np.unique(data_batch["device"]).tolist()
+    }
+
+    lines = [
+        f"{prefixes[device]}{humidity!r},temperature={temperature!r} {timestamp}"
+        for timestamp, device, temperature, humidity in zip(
+            data_batch["timestamp"].tolist(),
+            data_batch["device"].tolist(),
+            data_batch["temperature"].tolist(),
+            data_batch["humidity"].tolist()
+        )
+    ]
+
+    return "\n".join(lines).encode("utf-8")
@@ -1,172 +1,369 @@
-import time
-import os
-import pandas as pd
-import random
+import multiprocessing
+import queue
+from threading import BrokenBarrierError, Event, Thread
 from graphs_datapoints import analyze_and_plot_results
-from datetime import datetime, timedelta, timezone
-from device import Device, save_performance_result
-from sensors import connect_to_influx, connect_to_timescale, send_batch_to_influxdb, send_batch_to_timescaledb
+from datetime import datetime, timezone
+from device import save_performance_result, datetime_to_ns
+from pipeline import (
+    workload_batches, partition_workload, generate_stream, batch_stream,
+    partition_timespan_workload, generate_timespan_stream, NS_PER_DAY
+)
+from dataset_cache import load_or_build_dataset, dataset_batches, partition_dataset
+from async_ingest import run_async_test
+from latency import LatencyHistogram
+from profiling import PhaseTimer
+from resource_sampler import save_resource_series
+from results_store import get_results_store, module_config
+from repeat_runner import repeats_complete, summarize_samples, is_stable
+from null_sink import NULL_SINK_MODE
+from sensors import TIMESCALE_INGEST_MODES, INFLUX_WRITE_MODES
+from ingest_runner import (
+    run_backend_test, scalar_metrics, BATCH_SIZE, NUM_DEVICES, SEED, INFLUX_ACK_TIMEOUT, INFLUX_SERIALIZER, PROFILER
+)
 
 
 # Paramentri per il testing 
+# (BATCH_SIZE, NUM_DEVICES, SEED, INFLUX_ACK_TIMEOUT, INFLUX_SERIALIZER e PROFILER sono in ingest_runner.py,
+# NULL_SINK_MODE in null_sink.py: condivisi con gli altri benchmark e importati qui,
+# così restano registrati nella configurazione dell'esecuzione)
 
-BATCH_SIZE = 1000
 DATA_VOLUMES = [1000]
-REPEAT_PER_TEST = 1  # Numero di ripetizioni per ogni test
-
-
-def run_test(num_records_generated):
+# Ripetizioni di ogni test (repeat_runner.py): WARMUP_PER_TEST esecuzioni iniziali non salvate,
+# poi almeno REPEAT_PER_TEST ripetizioni, proseguendo fino a MAX_REPEAT_PER_TEST finché
+# l'intervallo di confidenza della mediana del throughput di ogni serie non è abbastanza stretto
+WARMUP_PER_TEST = 1
+REPEAT_PER_TEST = 3
+MAX_REPEAT_PER_TEST = 10
+
+# Modalità di inserimento TimescaleDB da confrontare sugli stessi dati
+# (sottoinsieme di TIMESCALE_INGEST_MODES: execute_values, copy_text, copy_binary).
+# Di default solo la modalità di riferimento: ogni modalità in più inserisce di nuovo le stesse
+# righe in sensors, quindi il confronto (es. list(TIMESCALE_INGEST_MODES)) va attivato
+# esplicitamente, su un database di prova o svuotando la tabella tra un'esecuzione e l'altra
+TIMESCALE_INGEST_MODES_TO_TEST = ["execute_values"]
+
+# Modalità di scrittura InfluxDB da confrontare (sottoinsieme di INFLUX_WRITE_MODES:
+# batching, acknowledged, synchronous).
+# Come per TimescaleDB di default solo la modalità di riferimento: ogni modalità in più
+# scrive di nuovo gli stessi punti nel bucket (confronto con list(INFLUX_WRITE_MODES))
+INFLUX_WRITE_MODES_TO_TEST = ["batching"]
+
+# Inserimento parallelo: per ogni numero di worker indicato si ripete il test con altrettanti
+# processi, ognuno con la propria connessione e una partizione del workload ("time" o "device").
+# Con più valori si ottiene la curva di scalabilità; [1] equivale al test a processo singolo.
+PARALLEL_WORKER_COUNTS = [1]
+PARALLEL_PARTITION = "time"
+# Attesa massima (s) del processo padre perché tutti i worker siano pronti (dataset e connessioni)
+PARALLEL_BARRIER_TIMEOUT = 600
+
+# Intervallo storico: None per record a 1 ms l'uno dall'altro a partire da adesso, oppure un numero
+# di giorni su cui distribuire i record di ogni volume (es. 28, così le query sugli ultimi 14 giorni
+# leggono dati reali). Ogni device ha il proprio intervallo di campionamento, con jitter e periodi
+# offline (vedi generate_timespan_stream); NUM_DEVICES diventa il numero di device distinti.
+TIME_SPAN_DAYS = None
+
+# Dataset pre-generato (dataset_cache.py): se True il workload di ogni volume viene generato una
+# sola volta su disco (chiave: seed, volume, NUM_DEVICES, TIME_SPAN_DAYS e parametri del generatore)
+# e letto tramite memmap, così ogni ripetizione e ogni backend ricevono esattamente gli stessi byte senza costo di generazione.
+# I timestamp vengono spostati sull'istante di partenza di ogni run.
+DATASET_CACHE = False
+
+# Motore asincrono (async_ingest.py): per ogni profondità indicata (batch in volo per connessione)
+# si ripete l'inserimento su entrambi i backend. Richiede influxdb-client[async] e asyncpg.
+ASYNC_IN_FLIGHT_DEPTHS = []
+
+
+
+def dataset_start_ns(start_ns):
     """
-    Esegue il test per il numero dei volume di dati richiesto,
-    misurandone le prestazioni per il throughput e il tempo di esecuzione.
+    Istante da cui riprodurre il dataset pre-generato: start_ns, oppure l'inizio
+    dell'intervallo storico che termina a start_ns quando TIME_SPAN_DAYS è impostato.
     """
-    print(f"\n------ Inizio test per {num_records_generated} record ------")
-    print(f" Generando :  {num_records_generated} dati di sensori...")
-
-    all_data = []
-
-    devices = []
-    for _ in range(10):
-        device = Device()
-        devices.append(device)
-
-    current_timestamp = datetime.now(timezone.utc)
-
-    for _ in range(num_records_generated):
-
-        device = random.choice(devices)
+    return start_ns - TIME_SPAN_DAYS * NS_PER_DAY if TIME_SPAN_DAYS else start_ns
 
-        all_data.append(device.generate_data(timestamp=current_timestamp))
 
-        current_timestamp += timedelta(milliseconds=1)  
-
-    print(f" {len(all_data)} dati generati.")
-
-    # INIZIO INFLUX
-
-    duration_influx = throughput_influx = None
-    duration_ts = throughput_ts = None 
-
-    print(f" Tentativo di connessione al client InfluxDB per --> {os.getenv('INFLUX_URL')}...")
-
-    influx_client, influx_write_api = connect_to_influx(BATCH_SIZE) 
+def ingest_worker(database_name, mode, worker_id, num_workers, num_records_generated, start_ns, seed,
+                  barrier, result_queue, null_sink=None):
+    """
+    Corpo di un processo worker del test parallelo: genera la propria partizione
+    del workload, apre la propria connessione e invia i batch.
+    Le metriche (o None in caso di errore) vengono restituite al processo padre tramite result_queue.
+    Qualsiasi errore (anche prima della barrier, es. partizionamento o dataset) rompe la barrier,
+    così il processo padre e gli altri worker non restano in attesa.
+    """
+    try:
+        if DATASET_CACHE:
+            dataset = load_or_build_dataset(num_records_generated, seed, NUM_DEVICES, TIME_SPAN_DAYS)
+            dataset, indexes = partition_dataset(dataset, num_workers, worker_id, PARALLEL_PARTITION)
+            params = {'num_records': len(dataset["timestamp"]) if indexes is None else len(indexes)}
+            batches = dataset_batches(dataset, BATCH_SIZE, dataset_start_ns(start_ns), indexes)
+        elif TIME_SPAN_DAYS:
+            params = partition_timespan_workload(
+                num_records_generated, start_ns, TIME_SPAN_DAYS * NS_PER_DAY, seed, NUM_DEVICES,
+                num_workers, worker_id, PARALLEL_PARTITION
+            )
+            batches = batch_stream(generate_timespan_stream(**params), BATCH_SIZE)
+        else:
+            params = partition_workload(
+                num_records_generated, start_ns, seed, NUM_DEVICES, num_workers, worker_id, PARALLEL_PARTITION
+            )
+            batches = batch_stream(generate_stream(**params), BATCH_SIZE)
+
+        metrics = run_backend_test(database_name, params['num_records'], batches, mode, barrier, null_sink)
+    except BaseException as e:
+        print(f" Errore nel worker {worker_id} ({database_name}): {e}")
+        barrier.abort()
+        result_queue.put((worker_id, None))
+        return
+    result_queue.put((worker_id, metrics))
+
+
+def run_parallel_test(database_name, mode, num_records_generated, start_ns, seed, num_workers, null_sink=None):
+    """
+    Esegue il test di inserimento con `num_workers` processi, ognuno con la propria
+    connessione e una partizione del workload (vedi PARALLEL_PARTITION).
+    Tutti i worker partono insieme dopo essersi connessi (barrier); la durata aggregata
+    è quella del worker più lento.
 
-    if influx_client and influx_write_api:
+    Ritorna la lista delle metriche per worker (scope 'worker') seguita dalla riga
+    aggregata (scope 'aggregate'), presente solo se tutti i worker hanno completato.
+    """
+    print(f"\n Avvio test parallelo {database_name} ({mode}) con {num_workers} worker ({PARALLEL_PARTITION})...")
+
+    # "spawn": i worker non ereditano i thread in background (es. write API InfluxDB) del processo padre
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(num_workers + 1)
+    result_queue = context.Queue()
+
+    workers = [
+        context.Process(
+            target=ingest_worker,
+            args=(database_name, mode, worker_id, num_workers, num_records_generated, start_ns, seed,
+                  barrier, result_queue, null_sink)
+        )
+        for worker_id in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # Un worker terminato prima della barrier senza romperla (es. ucciso dal sistema) bloccherebbe
+    # l'attesa: il processo padre controlla i worker e rompe la barrier se uno non è più attivo
+    barrier_passed = Event()
+
+    def watch_workers():
+        while not barrier_passed.wait(1):
+            if any(not worker.is_alive() for worker in workers):
+                barrier.abort()
+                return
+
+    watcher = Thread(target=watch_workers, name="parallel-watcher", daemon=True)
+    watcher.start()
+
+    try:
+        # Il processo padre partecipa alla barrier solo per sapere quando i worker sono tutti connessi
+        barrier.wait(timeout=PARALLEL_BARRIER_TIMEOUT)
+    except BrokenBarrierError:
+        print(f" Almeno un worker {database_name} non è riuscito a connettersi o è terminato prima dell'avvio.")
+    finally:
+        barrier_passed.set()
+        watcher.join()
+
+    # Le metriche vanno lette prima della join, fermandosi se un worker termina senza risposta
+    worker_metrics = {}
+    while len(worker_metrics) < num_workers:
         try:
-            print(f"\n Avvio inserimento dati in InfluxDB per {num_records_generated} record...")
-
-            start_time_influx = time.perf_counter() # INIZIO DEL COUNTER TEMPORALE
-
-            current_batch_influx = []
-
-            # CREAZIONE DEI BATCH PER INFLUX
-            for data_record in all_data:
-                current_batch_influx.append(data_record)
-                if len(current_batch_influx) >= BATCH_SIZE:
-                    send_batch_to_influxdb(current_batch_influx, influx_write_api, os.getenv("INFLUX_BUCKET"), os.getenv("INFLUX_ORG"))
-                    current_batch_influx.clear()
-
-            
-            if current_batch_influx:
-                send_batch_to_influxdb(current_batch_influx, influx_write_api, os.getenv("INFLUX_BUCKET"), os.getenv("INFLUX_ORG"))
-
-            end_time_influx = time.perf_counter() 
+            worker_id, metrics = result_queue.get(timeout=1)
+            worker_metrics[worker_id] = metrics
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers) and result_queue.empty():
+                break
+
+    for worker in workers:
+        worker.join()
+
+    results = []
+    for worker_id, metrics in sorted(worker_metrics.items()):
+        if metrics:
+            metrics.update({'scope': 'worker', 'worker_id': worker_id, 'workers': num_workers,
+                            'partition': PARALLEL_PARTITION})
+            results.append(metrics)
+
+    if len(results) < num_workers:
+        print(f" Test parallelo {database_name} ({mode}): {num_workers - len(results)} worker falliti, nessun risultato aggregato.")
+        return results
+
+    duration = max(metrics['duration'] for metrics in results)
+    records = sum(metrics['records_sent'] for metrics in results)
+    throughput = records / duration if duration > 0 else 0
+    print(f" {database_name} ({mode}) x{num_workers} --> Tempo: {duration:.2f} s, Throughput aggregato: {throughput:.2f} r/s")
+
+    aggregate = {
+        'database': database_name,
+        'ingest_mode': mode,
+        'serializer': results[0].get('serializer'),
+        'sink': null_sink,
+        'batch_size': results[0].get('batch_size'),
+        'duration': duration,
+        'throughput': throughput,
+        'records_sent': records,
+        'peak_rss_mb': sum(metrics['peak_rss_mb'] for metrics in results),
+        'records_failed': sum(metrics.get('records_failed') or 0 for metrics in results),
+        'scope': 'aggregate',
+        'workers': num_workers,
+        'partition': PARALLEL_PARTITION
+    }
+    if database_name == 'InfluxDB' and mode != "batching":
+        aggregate['records_acknowledged'] = sum(metrics['records_acknowledged'] for metrics in results)
+
+    # Le latenze per batch di tutti i worker confluiscono in un unico istogramma,
+    # i tempi per fase vengono sommati (secondi cumulativi su tutti i worker)
+    latency_histogram = LatencyHistogram()
+    phase_timer = PhaseTimer()
+    for metrics in results:
+        latency_histogram.merge(metrics['latency_histogram'])
+        phase_timer.merge(metrics['phase_timer'])
+    aggregate.update({
+        **latency_histogram.summary(), **phase_timer.summary(),
+        'latency_histogram': latency_histogram, 'phase_timer': phase_timer
+    })
+
+    return results + [aggregate]
+
+
+def run_test(num_records_generated, seed=SEED, num_workers=1, null_sink=NULL_SINK_MODE):
+    """
+    Esegue il test per il numero dei volume di dati richiesto,
+    misurandone le prestazioni per il throughput e il tempo di esecuzione.
 
-            # Calcola le metriche
-            duration_influx = (end_time_influx - start_time_influx)
-            throughput_influx = (num_records_generated / duration_influx) if duration_influx > 0 else 0
-            print(f" InfluxDB --> Completato. Tempo: {duration_influx:.2f} s, Throughput: {throughput_influx:.2f} r/s")
+    I dati non vengono materializzati: ogni backend (e ogni modalità di inserimento
+    in INFLUX_WRITE_MODES_TO_TEST e TIMESCALE_INGEST_MODES_TO_TEST) riceve lo stream
+    generatore --> batcher --> sender ricostruito dallo stesso seed e dallo
+    stesso timestamp di partenza, quindi la sequenza inviata è identica e la
+    memoria resta costante al crescere del volume.
+    Con TIME_SPAN_DAYS i record sono distribuiti sugli ultimi TIME_SPAN_DAYS giorni.
+    Con num_workers > 1 l'inserimento è diviso tra altrettanti processi (run_parallel_test).
+    Con null_sink ("discard" o "loopback") ogni test usa il backend nullo (null_sink.py).
 
-        except Exception as e:
-            
-            print(f"Errore durante l'inserimento in InfluxDB: {e}")
-        finally:
-            
-            if influx_write_api: 
-                print("Chiusura di influx_write_api e svuotamento del buffer")
-                influx_write_api.close()
-            if influx_client: 
-                print("Chiusura della connessione influx_client")
-                influx_client.close()
+    Ritorna la lista delle metriche delle sole esecuzioni riuscite.
+    """
+    print(f"\n------ Inizio test per {num_records_generated} record ({num_workers} worker) ------")
+    print(f" Stream di {num_records_generated} dati di sensori (seed {seed})...")
+
+    start_ns = datetime_to_ns(datetime.now(timezone.utc))
+
+    # Con DATASET_CACHE il dataset viene costruito (una volta) prima di avviare qualsiasi timer
+    dataset = load_or_build_dataset(num_records_generated, seed, NUM_DEVICES, TIME_SPAN_DAYS) if DATASET_CACHE else None
+
+    def batches():
+        if dataset is not None:
+            return dataset_batches(dataset, BATCH_SIZE, dataset_start_ns(start_ns))
+        if TIME_SPAN_DAYS:
+            # start_ns è la fine dell'intervallo storico: i dati arrivano fino ad adesso
+            chunks = generate_timespan_stream(num_records_generated, start_ns, TIME_SPAN_DAYS * NS_PER_DAY, seed, NUM_DEVICES)
+            return batch_stream(chunks, BATCH_SIZE)
+        return workload_batches(num_records_generated, BATCH_SIZE, start_ns, seed, NUM_DEVICES)
+
+    # INFLUX (una esecuzione per ogni modalità di scrittura), poi TS (una per ogni modalità di inserimento)
+    backend_tests = [('InfluxDB', write_mode) for write_mode in INFLUX_WRITE_MODES_TO_TEST]
+    backend_tests += [('TimescaleDB', ingest_mode) for ingest_mode in TIMESCALE_INGEST_MODES_TO_TEST]
+
+    results = []
+
+    for database_name, mode in backend_tests:
+        if num_workers > 1:
+            results.extend(run_parallel_test(database_name, mode, num_records_generated, start_ns, seed, num_workers, null_sink))
+            continue
+
+        metrics = run_backend_test(database_name, num_records_generated, batches(), mode, null_sink=null_sink)
+        if metrics:
+            metrics.update({'scope': 'aggregate', 'workers': 1})
+            results.append(metrics)
+
+    # ASYNC (una esecuzione per backend e profondità in volo, solo nel test a processo singolo)
+    if num_workers == 1 and not null_sink:
+        for database_name in ('InfluxDB', 'TimescaleDB'):
+            for in_flight in ASYNC_IN_FLIGHT_DEPTHS:
+                metrics = run_async_test(database_name, num_records_generated, batches(), in_flight)
+                if metrics:
+                    metrics.update({'scope': 'aggregate', 'workers': 1})
+                    results.append(metrics)
 
-    else:
-        print("Connessione InfluxDB fallita, test saltato")
-#FINE INFLUX
+    print(f"\n------ Fine test per {num_records_generated} record ------")
 
+    return results
 
-     # --- INIZIO TS ---
-    print(f"\nTentativo di connessione a TimescaleDB...")
-    ts_conn = connect_to_timescale()
 
-    if ts_conn:
-        try:
-            print("Connessione a TimescaleDB riuscita.")
-            print(f"\n Avvio dell'inserimento dati in TimescaleDB per {num_records_generated} record....")
-
-            # INIZIO DEL COUNTER
-            start_time_ts = time.perf_counter()
-
-            current_batch_ts = [] # CARICAMENTO DEL BATCH
-
-            for data_record in all_data:
-                current_batch_ts.append(data_record)
-                if len(current_batch_ts) >= BATCH_SIZE:
-                    send_batch_to_timescaledb(current_batch_ts, ts_conn, BATCH_SIZE)
-                    current_batch_ts.clear()
-
-            # Invia l'ultimo batch residuo
-            if current_batch_ts:
-                send_batch_to_timescaledb(current_batch_ts, ts_conn, BATCH_SIZE)
-
-            
-            end_time_ts = time.perf_counter()
-
-            
-            duration_ts = (end_time_ts - start_time_ts)
-            throughput_ts = (num_records_generated / duration_ts) if duration_ts > 0 else 0
-            print(f" TimescaleDB --> Completato. Tempo: {duration_ts:.2f} s, Throughput: {throughput_ts:.2f} r/s")
-
-        except Exception as e:
-            
-            print(f" Errore durante l'inserimento in TimescaleDB: {e}")
-        finally:
-            
-            if ts_conn:
-                print("Chiusura della connessione TimescaleDB.")
-                ts_conn.close()
-    else:
-        print("Connessione TimescaleDB fallita, test salatato.")
 
-    print(f"\n------ Fine test per {num_records_generated} record ------")
+# Colonne che identificano la serie di un risultato tra le ripetizioni
+SERIES_COLUMNS = ('database', 'ingest_mode', 'serializer', 'sink', 'workers', 'in_flight')
 
-    return duration_influx, throughput_influx, duration_ts, throughput_ts
 
+def series_key(metrics):
+    return tuple(metrics.get(column) for column in SERIES_COLUMNS)
 
 
 def main():
     """
-    Provvede a lanciare il programma ripetendo i test e rimuovendo il vecchio .csv 
-    facendone poi una media matematica dei risultati.
-    
+    Provvede a lanciare il programma ripetendo i test e registrando una nuova esecuzione
+    nell'archivio dei risultati (con la configurazione di questo modulo).
+
+    Per ogni volume e numero di worker si eseguono WARMUP_PER_TEST esecuzioni non salvate,
+    poi le ripetizioni continuano finché ogni serie ha un intervallo di confidenza stretto
+    (vedi repeat_runner.repeats_complete). Ogni ripetizione è salvata nella tabella
+    'performance' con il suo indice; le statistiche per serie (mediana, intervallo bootstrap,
+    valori anomali) nella tabella 'performance_summary'.
     """
     
-    if os.path.exists('performance_results.csv'):
-        os.remove('performance_results.csv')
-        print(" File 'performance_results.csv' precedente rimosso.")
+    results_store = get_results_store()
+    results_store.begin_run('ingest', module_config(globals()))
 
     for volume in DATA_VOLUMES:
-        print(f"\n Inizio test per {volume} record (ripetuto {REPEAT_PER_TEST} volte)...")
-
-        for run in range(REPEAT_PER_TEST):
-            print(f"\n Esecuzione {run+1} di {REPEAT_PER_TEST} per {volume} record")
-            dur_i, thr_i, dur_t, thr_t = run_test(volume)
-
-            if dur_i and thr_i:
-                save_performance_result('InfluxDB', volume, dur_i, thr_i)
-
-            if dur_t and thr_t:
-                save_performance_result('TimescaleDB', volume, dur_t, thr_t)
-
+        for num_workers in PARALLEL_WORKER_COUNTS:
+            for warmup in range(WARMUP_PER_TEST):
+                print(f"\n Warm-up {warmup+1} di {WARMUP_PER_TEST} per {volume} record ({num_workers} worker)")
+                run_test(volume, num_workers=num_workers)
+
+            samples = {}
+            repeat = 0
+            while not repeats_complete(samples.values(), repeat, REPEAT_PER_TEST, MAX_REPEAT_PER_TEST):
+                print(f"\n Ripetizione {repeat+1} (minimo {REPEAT_PER_TEST}, massimo {MAX_REPEAT_PER_TEST}) "
+                      f"per {volume} record ({num_workers} worker)")
+                results = run_test(volume, num_workers=num_workers)
+
+                for metrics in results:
+                    if metrics['duration'] and metrics['throughput']:
+                        extra_metrics = {
+                            k: v for k, v in scalar_metrics(metrics).items()
+                            if k not in ('database', 'duration', 'throughput')
+                        }
+                        save_performance_result(
+                            metrics['database'], volume, metrics['duration'], metrics['throughput'],
+                            repeat=repeat, **extra_metrics
+                        )
+                        if 'resource_series' in metrics:
+                            save_resource_series(metrics['resource_series'], {
+                                'database': metrics['database'], 'ingest_mode': metrics.get('ingest_mode'),
+                                'sink': metrics.get('sink'), 'num_records': volume, 'workers': metrics.get('workers'),
+                                'worker_id': metrics.get('worker_id'), 'in_flight': metrics.get('in_flight'),
+                                'repeat': repeat,
+                            })
+                        if metrics.get('scope') != 'worker':
+                            samples.setdefault(series_key(metrics), []).append(metrics['throughput'])
+                repeat += 1
+
+            for key, throughputs in samples.items():
+                summary = summarize_samples(throughputs)
+                results_store.add('performance_summary', {
+                    **dict(zip(SERIES_COLUMNS, key)),
+                    'num_records': volume,
+                    'metric': 'throughput_records_per_second',
+                    **summary,
+                    'converged': is_stable(throughputs),
+                })
+                print(f" {key[0]} ({key[1]}) x{key[4]}: mediana {summary['median'] or 0:.2f} r/s, "
+                      f"{summary['samples']} campioni, {summary['outliers']} anomali")
+
+    results_store.flush()
     print("\n Tutte le simulazioni di inserimento completate.")
 
 
@@ -0,0 +1,260 @@
+import multiprocessing
+import os
+import queue
+import time
+from datetime import datetime, timezone
+from device import datetime_to_ns
+from graphs_query import analyze_and_plot_mixed_workload
+from ingest_runner import BATCH_SIZE, NUM_DEVICES, SEED
+from latency import LatencyHistogram
+from pipeline import workload_batches
+from query_load import run_query_load
+from query_runner import QUERIES_FLUX, QUERIES_TS, LOAD_QUERY_MIX
+from results_store import get_results_store, module_config
+from sensors import (
+    connect_to_influx, connect_to_timescale, send_batch_to_influxdb, send_batch_to_timescaledb
+)
+
+
+# Parametri dello scenario misto lettura/scrittura
+
+MAX_INGEST_RECORDS = 1_000_000_000  # limite superiore: l'inserimento si ferma allo scadere della fase
+TIMESCALE_INGEST_MODE = "execute_values"
+
+QUERY_CLIENTS = 4
+QUERY_TARGET_QPS = 5
+BASELINE_SECONDS = 60   # query senza inserimento concorrente
+CONTENTION_SECONDS = 120  # query durante l'inserimento sostenuto
+INGEST_START_TIMEOUT_SECONDS = 120  # attesa massima della connessione e del primo batch inserito
+WINDOW_SECONDS = 1.0   # granularità della timeline condivisa
+
+
+"""  INSERIMENTO SOSTENUTO (processo separato)  """
+
+def ingest_until_stopped(database_name, start_ns, seed, stop_event, sample_queue):
+    """
+    Inserisce dati nel backend tramite sensors.py finché stop_event non viene impostato.
+    Invia a sample_queue "ready" dopo la connessione e la coppia (time.time(), record inviati)
+    dopo ogni batch; None al termine o se la connessione fallisce.
+    Gira in un processo separato per non competere con i client delle query per il GIL.
+    """
+    batches = workload_batches(MAX_INGEST_RECORDS, BATCH_SIZE, start_ns, seed, NUM_DEVICES)
+
+    if database_name == 'InfluxDB':
+        client, write_api = connect_to_influx(BATCH_SIZE, "synchronous")
+        if not client:
+            sample_queue.put(None)
+            return
+        bucket, org = os.getenv("INFLUX_BUCKET"), os.getenv("INFLUX_ORG")
+
+        def send(batch):
+            send_batch_to_influxdb(batch, write_api, bucket, org)
+
+        def close():
+            write_api.close()
+            client.close()
+    else:
+        conn = connect_to_timescale()
+        if not conn:
+            sample_queue.put(None)
+            return
+
+        def send(batch):
+            send_batch_to_timescaledb(batch, conn, BATCH_SIZE, TIMESCALE_INGEST_MODE)
+
+        close = conn.close
+
+    sample_queue.put("ready")
+    try:
+        for batch in batches:
+            if stop_event.is_set():
+                break
+            send(batch)
+            sample_queue.put((time.time(), len(batch["timestamp"])))
+    finally:
+        close()
+        sample_queue.put(None)
+
+
+"""  SCENARIO MISTO  """
+
+def run_phase(database_name, queries, phase, duration_seconds, seed, query_samples):
+    """
+    Esegue il carico di query per una fase dello scenario, aggiungendo a query_samples
+    le tuple (istante, fase, latenza, fallita) e ritorna le metriche di run_query_load.
+    """
+    def on_sample(end_time, query_name, latency, failed):
+        query_samples.append((end_time, phase, latency, failed))
+
+    return run_query_load(
+        database_name, queries, LOAD_QUERY_MIX, QUERY_CLIENTS, QUERY_TARGET_QPS,
+        duration_seconds, seed, on_sample=on_sample
+    )
+
+
+def run_mixed_workload(database_name, queries, seed=SEED):
+    """
+    Esegue lo scenario misto su un backend: una fase di sole query (baseline) seguita
+    da una fase in cui le stesse query girano durante l'inserimento sostenuto.
+
+    Ritorna (righe della timeline, righe di riepilogo per fase).
+    """
+    print(f"\n------ Scenario misto lettura/scrittura: {database_name} ------")
+
+    query_samples = []
+    ingest_samples = []
+    timeline_start = time.time()
+
+    baseline = run_phase(database_name, queries, 'baseline', BASELINE_SECONDS, seed, query_samples)
+
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    sample_queue = context.Queue()
+    start_ns = datetime_to_ns(datetime.now(timezone.utc))
+    ingest_process = context.Process(
+        target=ingest_until_stopped, args=(database_name, start_ns, seed, stop_event, sample_queue)
+    )
+    ingest_process.start()
+
+    # La fase di contesa inizia solo dopo la connessione e il primo batch inserito: l'avvio del
+    # processo (spawn) e la connessione non devono finire nelle latenze misurate sotto carico
+    contention = []
+    if wait_for_ingest(ingest_process, sample_queue, ingest_samples):
+        contention = run_phase(database_name, queries, 'contention', CONTENTION_SECONDS, seed, query_samples)
+    else:
+        print(f" Fase di contesa saltata: l'inserimento in {database_name} non è partito.")
+
+    stop_event.set()
+    while True:
+        try:
+            sample = sample_queue.get(timeout=5)
+        except queue.Empty:
+            if not ingest_process.is_alive():
+                break
+            continue
+        if sample is None:
+            break
+        ingest_samples.append(sample)
+    ingest_process.join()
+
+    timeline = build_timeline(database_name, timeline_start, query_samples, ingest_samples)
+    summary = summarize_phases(database_name, baseline, contention, ingest_samples)
+    return timeline, summary
+
+
+def wait_for_ingest(ingest_process, sample_queue, ingest_samples):
+    """
+    Attende (al più INGEST_START_TIMEOUT_SECONDS) il messaggio "ready" del processo di
+    inserimento e il suo primo campione, aggiunto a ingest_samples.
+    Ritorna False se la connessione fallisce, il processo termina o l'attesa scade.
+    """
+    deadline = time.monotonic() + INGEST_START_TIMEOUT_SECONDS
+    for expected in ("ready", "sample"):
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                message = sample_queue.get(timeout=min(remaining, 5))
+                break
+            except queue.Empty:
+                if not ingest_process.is_alive():
+                    return False
+        if message is None:
+            return False
+        if expected == "sample":
+            ingest_samples.append(message)
+    return True
+
+
+def build_timeline(database_name, timeline_start, query_samples, ingest_samples):
+    """
+    Raggruppa i campioni di query e di inserimento in finestre di WINDOW_SECONDS
+    sulla stessa timeline (secondi dall'inizio dello scenario).
+    """
+    windows = {}
+
+    def window(sample_time):
+        index = int((sample_time - timeline_start) // WINDOW_SECONDS)
+        if index not in windows:
+            windows[index] = {'records': 0, 'histogram': LatencyHistogram(), 'errors': 0, 'phase': None}
+        return windows[index]
+
+    for sample_time, records in ingest_samples:
+        current = window(sample_time)
+        current['records'] += records
+        current['phase'] = 'contention'
+
+    for sample_time, phase, latency, failed in query_samples:
+        current = window(sample_time)
+        current['phase'] = phase
+        if failed:
+            current['errors'] += 1
+        else:
+            current['histogram'].record(latency)
+
+    rows = []
+    for index in sorted(windows):
+        current = windows[index]
+        histogram = current['histogram']
+        rows.append({
+            'database': database_name,
+            'time_seconds': index * WINDOW_SECONDS,
+            'phase': current['phase'],
+            'ingest_records_per_second': current['records'] / WINDOW_SECONDS,
+            'queries_completed': histogram.count,
+            'query_errors': current['errors'],
+            **histogram.summary('query_latency'),
+        })
+    return rows
+
+
+def summarize_phases(database_name, baseline, contention, ingest_samples):
+    """
+    Riepilogo per fase: percentili complessivi delle query ('ALL') e, per la fase
+    con inserimento, il throughput medio di inserimento.
+    """
+    ingest_throughput = None
+    if len(ingest_samples) > 1:
+        ingest_duration = ingest_samples[-1][0] - ingest_samples[0][0]
+        ingest_records = sum(records for _, records in ingest_samples[1:])
+        ingest_throughput = ingest_records / ingest_duration if ingest_duration > 0 else None
+
+    rows = []
+    for phase, results in (('baseline', baseline), ('contention', contention)):
+        for metrics in results:
+            if metrics['query'] != 'ALL':
+                continue
+            rows.append({
+                **metrics,
+                'phase': phase,
+                'ingest_throughput_records_per_second': ingest_throughput if phase == 'contention' else 0,
+            })
+    return rows
+
+
+def main():
+    """
+    Esegue lo scenario misto su entrambi i database e salva timeline e riepilogo
+    nelle tabelle 'mixed_workload_timeline' e 'mixed_workload_summary' dell'archivio dei risultati.
+    """
+    results_store = get_results_store()
+    results_store.begin_run('mixed_workload', module_config(globals()))
+
+    for database_name, queries in (("InfluxDB", QUERIES_FLUX), ("TimescaleDB", QUERIES_TS)):
+        timeline, summary = run_mixed_workload(database_name, queries)
+
+        for row in timeline:
+            results_store.add('mixed_workload_timeline', row)
+        for row in summary:
+            results_store.add('mixed_workload_summary', row)
+            print(f" {database_name} [{row['phase']}] p99 query: {row['latency_p99_ms'] or 0:.1f} ms, "
+                  f"inserimento: {row['ingest_throughput_records_per_second'] or 0:.0f} r/s")
+
+    results_store.flush()
+    print("\n Scenario misto completato.")
+
+
+if __name__ == "__main__":
+    main()
+    analyze_and_plot_mixed_workload()
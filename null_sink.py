@@ -0,0 +1,280 @@
+import socket
+import threading
+import numpy as np
+from psycopg2 import extensions
+from sensors import INFLUX_WRITE_MODES, INFLUX_SERIALIZERS
+from repeat_runner import compare_runs, print_comparison
+from results_store import get_results_store, module_config
+
+
+# Destinazioni del sink nullo:
+#   - discard: i payload serializzati vengono solo contati e scartati
+#   - loopback: i payload vengono inviati ad un server TCP locale (127.0.0.1) che li legge e li scarta,
+#     così nella misura entrano anche le copie e le chiamate di sistema del socket
+NULL_SINK_MODES = ("discard", "loopback")
+
+LOOPBACK_READ_SIZE = 1 << 20
+
+# Backend usato dagli script di benchmark (main.py e gli altri): None per i database reali,
+# "discard" o "loopback" per eseguire tutta la serializzazione scartando i payload, senza
+# servizi esterni (es. in CI). I test asincroni non hanno un equivalente nullo e vengono saltati.
+NULL_SINK_MODE = None
+
+# Controllo delle prestazioni del client in CI (run_null_sink_check): ogni backend e modalità
+# viene eseguito NULL_SINK_CHECK_REPEATS volte dopo NULL_SINK_CHECK_WARMUP esecuzioni non salvate.
+# Il controllo fallisce se il throughput mediano di una serie scende sotto NULL_SINK_MIN_THROUGHPUT
+# (record/s, None per disattivare) o se è significativamente peggiore della baseline della tabella
+# 'null_sink_check' (python repeat_runner.py baseline --table null_sink_check)
+NULL_SINK_CHECK_WARMUP = 1
+NULL_SINK_CHECK_REPEATS = 5
+NULL_SINK_MIN_THROUGHPUT = 10_000
+
+
+class NullSink:
+    """
+    Destinazione finale dei payload del backend nullo.
+    Conta byte e scritture ricevuti; in modalità loopback li inoltra ad un
+    server TCP locale che li svuota in un thread in background.
+    """
+
+    def __init__(self, mode="discard"):
+        if mode not in NULL_SINK_MODES:
+            raise ValueError(f"Modalità del sink nullo sconosciuta: '{mode}'")
+        self.mode = mode
+        self.bytes_written = 0
+        self.writes = 0
+        self._socket = None
+        self._server = None
+        self._drain_thread = None
+
+        if mode == "loopback":
+            self._server = socket.create_server(("127.0.0.1", 0))
+            self._drain_thread = threading.Thread(target=self._drain, daemon=True)
+            self._drain_thread.start()
+            self._socket = socket.create_connection(self._server.getsockname())
+
+    def _drain(self):
+        connection, _ = self._server.accept()
+        with connection:
+            while connection.recv(LOOPBACK_READ_SIZE):
+                pass
+
+    def write(self, payload):
+        """
+        Scrive un payload (bytes o str) nel sink.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        if self._socket:
+            self._socket.sendall(payload)
+        self.bytes_written += len(payload)
+        self.writes += 1
+
+    def close(self):
+        """
+        Chiude il socket locale e attende che il server abbia letto tutti i dati.
+        """
+        if self._socket:
+            self._socket.close()
+            self._drain_thread.join()
+            self._server.close()
+            self._socket = None
+
+
+"""  INFLUXDB NULLO  """
+
+class NullInfluxWriteApi:
+    """
+    Sostituto della WriteApi di InfluxDB: write() riceve lo stesso record di
+    send_batch_to_influxdb (bytes in line protocol o lista di Point), completa la
+    serializzazione e la scrive nel sink in modo sincrono.
+    La callback di successo, se presente, viene chiamata subito dopo la scrittura.
+    """
+
+    def __init__(self, sink, success_callback=None):
+        self.sink = sink
+        self.success_callback = success_callback
+
+    def write(self, bucket, org, record, write_precision=None):
+        if isinstance(record, (bytes, str)):
+            payload = record
+        else:
+            payload = "\n".join(point.to_line_protocol() for point in record)
+        self.sink.write(payload)
+        if self.success_callback:
+            self.success_callback((bucket, org, write_precision), payload)
+
+    def close(self):
+        pass
+
+
+class NullInfluxClient:
+    """
+    Sostituto di InfluxDBClient: la chiusura chiude il sink.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def close(self):
+        self.sink.close()
+
+
+def connect_to_null_influx(input_batch_size, write_mode="batching", tracker=None, serializer="line_protocol",
+                           sink_mode="discard", flush_interval=None, buffer_batches=None):
+    """
+    Stessa interfaccia di connect_to_influx, ma senza server: ritorna (client, write_api)
+    nulli da usare con send_batch_to_influxdb.
+    In modalità acknowledged le conferme arrivano al tracker appena il payload è nel sink;
+    il buffering in background della modalità batching non viene simulato, quindi
+    flush_interval e buffer_batches sono accettati solo per compatibilità e non hanno effetto.
+    """
+    if write_mode not in INFLUX_WRITE_MODES:
+        raise ValueError(f"Modalità di scrittura InfluxDB sconosciuta: '{write_mode}'")
+    if serializer not in INFLUX_SERIALIZERS:
+        raise ValueError(f"Serializzazione InfluxDB sconosciuta: '{serializer}'")
+
+    sink = NullSink(sink_mode)
+    success_callback = tracker.success if write_mode == "acknowledged" and tracker else None
+    print(f"Sink nullo InfluxDB ({sink_mode}) pronto.")
+    return NullInfluxClient(sink), NullInfluxWriteApi(sink, success_callback)
+
+
+"""  TIMESCALEDB NULLO  """
+
+class NullCursor:
+    """
+    Sostituto del cursore psycopg2 per send_batch_to_timescaledb.
+    mogrify() esegue la stessa formattazione lato client di psycopg2 (usata da
+    execute_values), execute() e copy_expert() scrivono nel sink la query o lo stream COPY.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def mogrify(self, query, args):
+        if isinstance(query, str):
+            query = query.encode("utf-8")
+        return query % tuple(extensions.adapt(value).getquoted() for value in args)
+
+    def execute(self, query, args=None):
+        if args is not None:
+            query = self.mogrify(query, args)
+        self.connection.sink.write(query)
+
+    def copy_expert(self, sql, file):
+        self.connection.sink.write(sql)
+        self.connection.sink.write(file.read())
+
+
+class NullConnection:
+    """
+    Sostituto della connessione psycopg2: commit e rollback non fanno nulla,
+    la chiusura chiude il sink.
+    """
+
+    encoding = "UTF8"
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.closed = 0
+
+    def cursor(self):
+        return NullCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.sink.close()
+        self.closed = 1
+
+
+def connect_to_null_timescale(sink_mode="discard"):
+    """
+    Stessa interfaccia di connect_to_timescale, ma senza server: ritorna una
+    connessione nulla da usare con send_batch_to_timescaledb.
+    """
+    print(f"Sink nullo TimescaleDB ({sink_mode}) pronto.")
+    return NullConnection(NullSink(sink_mode))
+
+
+"""  VERIFICA DELL'HARNESS SENZA SERVIZI  """
+
+def run_null_sink_check(num_records=10_000, sink_mode="discard", repeats=NULL_SINK_CHECK_REPEATS,
+                        min_throughput=NULL_SINK_MIN_THROUGHPUT, baseline_run_id=None):
+    """
+    Esegue run_test di main.py sul backend nullo e verifica che ogni backend e modalità
+    abbia completato inviando tutti i record, con un throughput mediano non inferiore a
+    min_throughput e non significativamente peggiore della baseline (repeat_runner.compare_runs
+    sulla tabella 'null_sink_check'; di default la baseline registrata, se presente).
+    Ritorna True se il controllo è superato, così può essere usato in CI per intercettare
+    regressioni dell'harness e delle prestazioni lato client.
+    """
+    from main import run_test, INFLUX_WRITE_MODES_TO_TEST, TIMESCALE_INGEST_MODES_TO_TEST
+
+    results_store = get_results_store()
+    run_id = results_store.begin_run('null_sink_check', module_config(globals()))
+    expected = len(INFLUX_WRITE_MODES_TO_TEST) + len(TIMESCALE_INGEST_MODES_TO_TEST)
+
+    for _ in range(NULL_SINK_CHECK_WARMUP):
+        run_test(num_records, null_sink=sink_mode)
+
+    passed = True
+    samples = {}
+    for repeat in range(repeats):
+        results = run_test(num_records, null_sink=sink_mode)
+        if len(results) != expected:
+            print(f" Completati {len(results)} test su {expected}.")
+            passed = False
+
+        for metrics in results:
+            sent = metrics['records_sent']
+            if sent != num_records or metrics.get('records_failed'):
+                print(f" {metrics['database']} ({metrics['ingest_mode']}): {sent} record inviati su {num_records} ERRORE")
+                passed = False
+            results_store.add('null_sink_check', {
+                'database': metrics['database'],
+                'ingest_mode': metrics['ingest_mode'],
+                'serializer': metrics.get('serializer'),
+                'sink': sink_mode,
+                'num_records': num_records,
+                'repeat': repeat,
+                'records_sent': sent,
+                'throughput_records_per_second': metrics['throughput'],
+            })
+            samples.setdefault((metrics['database'], metrics['ingest_mode']), []).append(metrics['throughput'])
+
+    results_store.flush()
+
+    for (database, mode), throughputs in samples.items():
+        median = float(np.median(throughputs))
+        ok = min_throughput is None or median >= min_throughput
+        passed = passed and ok
+        print(f" {database} ({mode}): mediana {median:.0f} r/s su {len(throughputs)} esecuzioni "
+              f"{'OK' if ok else f'ERRORE (minimo {min_throughput} r/s)'}")
+
+    baseline_run_id = baseline_run_id or results_store.get_baseline('null_sink_check')
+    if baseline_run_id:
+        comparison = compare_runs('null_sink_check', baseline_run_id, run_id)
+        print_comparison(comparison, 'null_sink_check', baseline_run_id, run_id)
+        if not comparison.empty and (comparison['status'] == 'slower').any():
+            passed = False
+    else:
+        print(" Nessuna baseline registrata per 'null_sink_check': confronto con la baseline saltato.")
+
+    return passed
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if run_null_sink_check() else 1)
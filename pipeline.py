@@ -0,0 +1,316 @@
+import resource
+import sys
+import time
+import numpy as np
+from device import (
+    Device, create_rng, create_devices, create_device_ids, generate_columnar_batch, batch_length,
+    slice_columnar_batch, concat_columnar_batches
+)
+
+
+# Numero di record generati per ogni passata del generatore colonnare.
+# Indipendente da BATCH_SIZE: il batcher si occupa di ritagliare i batch da inviare.
+GENERATION_CHUNK_SIZE = 100_000
+
+# Strategie di suddivisione del workload tra più worker di inserimento:
+# - time: ogni worker riceve tutti i device su un intervallo temporale disgiunto
+# - device: ogni worker riceve un sottoinsieme disgiunto di device sull'intero intervallo
+PARTITION_STRATEGIES = ("time", "device")
+
+# Generazione su un intervallo storico (generate_timespan_stream):
+# - SAMPLING_INTERVAL_SPREAD: l'intervallo di campionamento di ogni device è estratto in
+#   [1 - spread, 1 + spread] volte l'intervallo medio
+# - SAMPLING_JITTER: scostamento casuale di ogni campione, in frazione dell'intervallo del device
+# - GAP_PROBABILITY: probabilità che un device sia offline in una fascia di GAP_SLOT_SECONDS
+SAMPLING_INTERVAL_SPREAD = 0.5
+SAMPLING_JITTER = 0.1
+GAP_PROBABILITY = 0.02
+GAP_SLOT_SECONDS = 3600
+
+NS_PER_DAY = 86_400 * 1_000_000_000
+
+
+"""  GENERATORE --> BATCHER --> SENDER  """
+
+def generate_stream(num_records, start_ns, seed, num_devices, chunk_size=GENERATION_CHUNK_SIZE, interval_ms=1,
+                    devices=None, cycle_devices=False):
+    """
+    Genera il workload a blocchi colonnari di al massimo `chunk_size` record,
+    senza mai materializzare l'intero volume in memoria.
+    A parità di seed, start_ns, num_devices e chunk_size la sequenza prodotta è identica,
+    così che ogni backend riceva esattamente gli stessi dati.
+    Se `devices` è indicato si usano quei Device (o quell'array di id) invece di crearne
+    num_devices dal seed. Con cycle_devices i device sono assegnati a rotazione
+    (vedi generate_columnar_batch) invece che a caso.
+    """
+    rng = create_rng(seed)
+    if devices is None:
+        devices = create_devices(num_devices, rng)
+
+    generated = 0
+    while generated < num_records:
+        current_chunk_size = min(chunk_size, num_records - generated)
+        chunk_start_ns = start_ns + generated * int(interval_ms * 1_000_000)
+        device_offset = generated if cycle_devices else None
+        yield generate_columnar_batch(devices, current_chunk_size, chunk_start_ns, rng, interval_ms, device_offset)
+        generated += current_chunk_size
+
+
+def generate_timespan_stream(num_records, end_ns, span_ns, seed, num_devices, chunk_size=GENERATION_CHUNK_SIZE,
+                             device_ids=None, interval_spread=SAMPLING_INTERVAL_SPREAD, jitter=SAMPLING_JITTER,
+                             gap_probability=GAP_PROBABILITY, gap_slot_seconds=GAP_SLOT_SECONDS):
+    """
+    Genera circa `num_records` record distribuiti sull'intervallo storico [end_ns - span_ns, end_ns),
+    come farebbe una flotta di device reali:
+        - ogni device campiona con un proprio intervallo fisso (attorno alla media necessaria
+          per ottenere num_records sull'intervallo) e una propria fase iniziale
+        - ogni campione è spostato di un jitter casuale (minore di metà intervallo,
+          quindi l'ordine dei campioni di un device non cambia)
+        - ogni device può essere offline per intere fasce di gap_slot_seconds (gap nei dati)
+
+    L'intervallo viene percorso a finestre temporali consecutive dimensionate per contenere
+    circa chunk_size record, ordinate per timestamp: l'inserimento procede in ordine di tempo
+    (backfill) e riempie un chunk della hypertable, o uno shard di InfluxDB, alla volta.
+    Lo stream si ferma a num_records; per effetto dei gap può produrne qualcuno in meno.
+    L'intervallo deve rientrare nella retention del bucket InfluxDB.
+
+    Parametri:
+        - device_ids: array di id (create_device_ids), di default num_devices id distinti
+    """
+    rng = create_rng(seed)
+    if device_ids is None:
+        device_ids = create_device_ids(num_devices)
+    num_devices = len(device_ids)
+    start_ns = end_ns - span_ns
+
+    # Intervalli scalati in modo che il numero atteso di record, al netto dei gap, sia num_records
+    interval_factors = rng.uniform(1 - interval_spread, 1 + interval_spread, size=num_devices)
+    intervals_ns = interval_factors * np.sum(1.0 / interval_factors) * span_ns * (1 - gap_probability) / num_records
+    phases_ns = rng.uniform(0, intervals_ns)
+    window_ns = max(int(chunk_size / np.sum(1.0 / intervals_ns)), 1)
+    gap_slot_ns = int(gap_slot_seconds * 1_000_000_000)
+
+    # Le fasce offline dipendono solo da seed e indice della fascia: identiche tra le finestre.
+    # Senza seed l'entropia viene estratta una sola volta per lo stream
+    offline_slots = {}
+    gap_entropy = np.atleast_1d(np.random.SeedSequence(seed).entropy).tolist()
+
+    def offline_mask(slot):
+        if slot not in offline_slots:
+            if len(offline_slots) > 4:
+                offline_slots.clear()
+            offline_slots[slot] = create_rng([*gap_entropy, slot]).random(num_devices) < gap_probability
+        return offline_slots[slot]
+
+    generated = 0
+    window_start = start_ns
+    while window_start < end_ns and generated < num_records:
+        window_end = min(window_start + window_ns, end_ns)
+
+        # Indici dei campioni di ogni device che cadono nella finestra
+        first = np.ceil((window_start - start_ns - phases_ns) / intervals_ns).astype(np.int64)
+        last = np.ceil((window_end - start_ns - phases_ns) / intervals_ns).astype(np.int64)
+        counts = np.maximum(last - first, 0)
+        total = int(counts.sum())
+        window_start = window_end
+        if total == 0:
+            continue
+
+        devices = np.repeat(np.arange(num_devices), counts)
+        sample_index = first[devices] + np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        # Offset da start_ns in float: restano piccoli, quindi precisi al nanosecondo
+        nominal_offsets = phases_ns[devices] + sample_index * intervals_ns[devices]
+        offsets = nominal_offsets + rng.uniform(-jitter, jitter, size=total) * intervals_ns[devices]
+        timestamps = start_ns + np.clip(offsets, 0, span_ns - 1).astype(np.int64)
+
+        slots = nominal_offsets.astype(np.int64) // gap_slot_ns
+        keep = np.ones(total, dtype=bool)
+        for slot in np.unique(slots).tolist():
+            in_slot = slots == slot
+            keep[in_slot] = ~offline_mask(slot)[devices[in_slot]]
+
+        order = np.argsort(timestamps[keep], kind="stable")
+        chunk_length = min(len(order), num_records - generated)
+        if chunk_length == 0:
+            continue
+        order = order[:chunk_length]
+
+        yield {
+            "timestamp": timestamps[keep][order],
+            "device": device_ids[devices[keep][order]],
+            "temperature": np.round(rng.uniform(20, 30, size=chunk_length), 2),
+            "humidity": np.round(rng.uniform(30, 60, size=chunk_length), 2),
+        }
+        generated += chunk_length
+
+
+def batch_stream(chunks, batch_size):
+    """
+    Ritaglia i blocchi colonnari in ingresso in batch di esattamente `batch_size` record
+    (tranne l'ultimo), usando viste NumPy senza copiare i dati.
+    Il residuo di un blocco viene unito al blocco successivo.
+    """
+    pending = None
+
+    for chunk in chunks:
+        if pending is not None:
+            chunk = concat_columnar_batches(pending, chunk)
+            pending = None
+
+        chunk_length = batch_length(chunk)
+        full_length = chunk_length - chunk_length % batch_size
+
+        for start in range(0, full_length, batch_size):
+            yield slice_columnar_batch(chunk, start, start + batch_size)
+
+        if full_length < chunk_length:
+            pending = slice_columnar_batch(chunk, full_length, chunk_length)
+
+    if pending is not None:
+        yield pending
+
+
+def send_stream(batches, send_batch, histogram=None, timer=None):
+    """
+    Consuma lo stream di batch passando ciascuno a `send_batch` (callable con il batch come unico argomento).
+    Se viene passato un LatencyHistogram, la durata di ogni chiamata a send_batch viene registrata.
+    Se viene passato un PhaseTimer, l'attesa di ogni batch dallo stream è misurata come fase generate.
+    Ritorna il numero di record inviati.
+    """
+    if timer is not None:
+        batches = timer.iterate(batches, "generate")
+
+    records_sent = 0
+    for batch in batches:
+        if histogram is not None:
+            send_start = time.perf_counter()
+            send_batch(batch)
+            histogram.record(time.perf_counter() - send_start)
+        else:
+            send_batch(batch)
+        records_sent += batch_length(batch)
+    return records_sent
+
+
+def workload_batches(num_records, batch_size, start_ns, seed, num_devices):
+    """
+    Scorciatoia per generatore + batcher: ritorna lo stream di batch da inviare ad un backend.
+    """
+    return batch_stream(generate_stream(num_records, start_ns, seed, num_devices), batch_size)
+
+
+def partition_workload(num_records, start_ns, seed, num_devices, num_workers, worker_id,
+                       partition="time", interval_ms=1):
+    """
+    Calcola la porzione di workload assegnata al worker `worker_id` su `num_workers`.
+    I device sono gli stessi del seed base, mentre ogni worker genera i valori con
+    un proprio seed derivato ([seed, worker_id]), quindi le partizioni sono
+    riproducibili e identiche per ogni backend.
+
+    Ritorna il dizionario di argomenti da passare a generate_stream.
+    """
+    if partition not in PARTITION_STRATEGIES:
+        raise ValueError(f"Strategia di partizionamento sconosciuta: '{partition}'")
+
+    devices = create_devices(num_devices, create_rng(seed))
+    worker_seed = [seed, worker_id]
+
+    if partition == "time":
+        first = num_records * worker_id // num_workers
+        last = num_records * (worker_id + 1) // num_workers
+        return {
+            "num_records": last - first,
+            "start_ns": start_ns + first * int(interval_ms * 1_000_000),
+            "seed": worker_seed,
+            "num_devices": num_devices,
+            "interval_ms": interval_ms,
+            "devices": devices,
+        }
+
+    device_ids = sorted({device.device_id for device in devices})
+    if num_workers > len(device_ids):
+        raise ValueError(f"Impossibile dividere {len(device_ids)} device distinti tra {num_workers} worker")
+
+    worker_device_ids = device_ids[worker_id::num_workers]
+    first = num_records * worker_id // num_workers
+    last = num_records * (worker_id + 1) // num_workers
+    return {
+        "num_records": last - first,
+        "start_ns": start_ns,
+        "seed": worker_seed,
+        "num_devices": len(worker_device_ids),
+        "interval_ms": interval_ms * num_workers,  # stesso intervallo complessivo del workload
+        "devices": [Device(device_id=device_id) for device_id in worker_device_ids],
+    }
+
+
+def partition_timespan_workload(num_records, end_ns, span_ns, seed, num_devices, num_workers, worker_id,
+                                partition="time"):
+    """
+    Equivalente di partition_workload per generate_timespan_stream:
+    con "time" ogni worker genera tutti i device su un sotto-intervallo disgiunto dello span,
+    con "device" un sottoinsieme disgiunto di device sull'intero span.
+    Il seed di ogni worker è [seed, worker_id].
+
+    Ritorna il dizionario di argomenti da passare a generate_timespan_stream.
+    """
+    if partition not in PARTITION_STRATEGIES:
+        raise ValueError(f"Strategia di partizionamento sconosciuta: '{partition}'")
+
+    device_ids = create_device_ids(num_devices)
+    first = num_records * worker_id // num_workers
+    last = num_records * (worker_id + 1) // num_workers
+    params = {
+        "num_records": last - first,
+        "end_ns": end_ns,
+        "span_ns": span_ns,
+        "seed": [seed, worker_id],
+        "num_devices": num_devices,
+        "device_ids": device_ids,
+    }
+
+    if partition == "time":
+        span_start_ns = end_ns - span_ns
+        params["end_ns"] = span_start_ns + span_ns * (worker_id + 1) // num_workers
+        params["span_ns"] = params["end_ns"] - (span_start_ns + span_ns * worker_id // num_workers)
+        return params
+
+    if num_workers > num_devices:
+        raise ValueError(f"Impossibile dividere {num_devices} device distinti tra {num_workers} worker")
+    params["device_ids"] = device_ids[worker_id::num_workers]
+    params["num_devices"] = len(params["device_ids"])
+    return params
+
+
+"""  MEMORIA DEL PROCESSO  """
+
+def reset_peak_rss():
+    """
+    Azzera il picco di RSS del processo (solo Linux, tramite /proc/self/clear_refs),
+    in modo da poter misurare il picco di ogni backend separatamente.
+    Ritorna True se l'azzeramento è riuscito.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    """
+    Ritorna il picco di memoria residente (RSS) del processo in MB.
+    Su Linux legge VmHWM (che rispetta reset_peak_rss), altrimenti usa getrusage.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in KB su Linux ma in byte su macOS
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
@@ -0,0 +1,189 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+
+# Fasi dell'inserimento misurate da PhaseTimer, nell'ordine in cui compaiono nei risultati:
+# - generate: attesa del batch successivo dallo stream (generazione, batching o lettura del dataset)
+# - serialize: conversione del batch nel formato di invio (line protocol, Point, tuple, COPY)
+# - send: chiamata al driver (write API InfluxDB, execute_values o copy_expert)
+# - commit: conn.commit() di TimescaleDB
+# - flush: svuotamento finale del buffer InfluxDB e attesa delle conferme
+PHASES = ("generate", "serialize", "send", "commit", "flush")
+
+# Profiler disponibili per profile_run: None (disattivato), "cprofile" (deterministico, solo il
+# thread che esegue il test, file .prof leggibile con pstats o snakeviz) oppure "sampling"
+# (campiona gli stack di tutti i thread, file .txt in formato "collapsed" per i flame graph)
+PROFILERS = (None, "cprofile", "sampling")
+PROFILE_DIR = "profiles"
+SAMPLING_INTERVAL_SECONDS = 0.005
+
+
+"""  TIMER PER FASE  """
+
+class PhaseTimer:
+    """
+    Tempi cumulativi (secondi) e numero di intervalli per ogni fase del percorso di
+    inserimento. Le fasi sono misurate con perf_counter attorno a ogni chiamata,
+    una volta per batch, quindi il costo resta trascurabile rispetto al batch.
+    Più timer (es. dei worker paralleli) possono essere uniti con merge().
+    """
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(PHASES, 0)
+
+    def add(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+    @contextmanager
+    def phase(self, phase):
+        """
+        Misura il blocco `with` e lo somma alla fase indicata.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def iterate(self, iterable, phase="generate"):
+        """
+        Itera su `iterable` sommando alla fase indicata il tempo di attesa di ogni elemento.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(phase, time.perf_counter() - start)
+                return
+            self.add(phase, time.perf_counter() - start)
+            yield item
+
+    def merge(self, other):
+        for phase, seconds in other.seconds.items():
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+            self.counts[phase] = self.counts.get(phase, 0) + other.counts.get(phase, 0)
+
+    def summary(self, total_seconds=None, prefix='phase'):
+        """
+        Ritorna i secondi cumulativi di ogni fase con chiavi '<prefix>_<fase>_seconds'.
+        Con total_seconds (durata misurata del test) viene aggiunto anche il tempo non
+        attribuito a nessuna fase ('<prefix>_other_seconds': cicli, istogrammi, ...).
+        """
+        summary = {f'{prefix}_{phase}_seconds': seconds for phase, seconds in self.seconds.items()}
+        if total_seconds is not None:
+            summary[f'{prefix}_other_seconds'] = max(0.0, total_seconds - sum(self.seconds.values()))
+        return summary
+
+    def report(self, total_seconds):
+        """
+        Riga di riepilogo con la quota di ogni fase sulla durata totale.
+        """
+        if not total_seconds:
+            return ""
+        return ", ".join(
+            f"{phase} {seconds / total_seconds:.0%}" for phase, seconds in self.seconds.items() if seconds
+        )
+
+
+def timed(timer, phase):
+    """
+    Context manager che misura la fase sul timer indicato, oppure non fa nulla se timer è None.
+    """
+    return timer.phase(phase) if timer is not None else nullcontext()
+
+
+"""  PROFILER  """
+
+class SamplingProfiler:
+    """
+    Profiler a campionamento: un thread in background legge ogni `interval` secondi gli
+    stack di tutti gli altri thread (sys._current_frames) e conta gli stack identici.
+    Il costo non dipende dal numero di chiamate, quindi il percorso caldo non viene rallentato
+    come con cProfile; i thread in background (es. il writer di InfluxDB) compaiono con il loro nome.
+    """
+
+    def __init__(self, interval=SAMPLING_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        """
+        Scrive gli stack nel formato "collapsed" (stack;separati;da;punto-e-virgola conteggio),
+        leggibile da flamegraph.pl e speedscope.
+        """
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def profile_run(profiler, name, profile_dir=PROFILE_DIR):
+    """
+    Profila il blocco `with` con il profiler indicato (vedi PROFILERS) e scrive il file in
+    profile_dir, con nome '<name>-<data>-<pid>' (il pid distingue i worker paralleli).
+    Con profiler None il blocco viene eseguito senza profilazione.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Profiler sconosciuto: '{profiler}'")
+    if profiler is None:
+        yield
+        return
+
+    os.makedirs(profile_dir, exist_ok=True)
+    base_path = os.path.join(profile_dir, f"{name}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{os.getpid()}")
+
+    if profiler == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            path = f"{base_path}.prof"
+            profile.dump_stats(path)
+            print(f" Profilo cProfile salvato in '{path}'.")
+    else:
+        sampler = SamplingProfiler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            path = f"{base_path}.txt"
+            sampler.dump(path)
+            print(f" Profilo a campionamento salvato in '{path}' ({sum(sampler.stacks.values())} campioni).")
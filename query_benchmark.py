@@ -1,25 +1,31 @@
+import json
 import os
 import time
+import zlib
 from influxdb_client import InfluxDBClient
-from device import save_query_result
-from typing import Optional
+from device import save_query_result, datetime_to_ns
 from dotenv import load_dotenv
 import psycopg2 
+import pandas as pd
 
 
 load_dotenv()
 
 
-def run_query_influx(flux_query: str, query_name_influx: str) -> Optional[list]:
-    """
-    Esegue una query InfluxDB, misura la durata e salva il risultato.
+# Sessioni riutilizzate tra le esecuzioni (una per database), vedi get_influx_session/get_timescale_connection
+_influx_session = None
+_timescale_connection = None
 
-    Parametri:
-        - flux_query: stringa Flux della query
-        - query_name_influx: nome descrittivo della query da salvare nei risultati
+
+"""  SESSIONI  """
+
+def open_influx_session():
+    """
+    Crea un client InfluxDB e ne stabilisce la connessione HTTP con un ping,
+    così che il costo di connessione non finisca nel tempo della prima query.
 
     Ritorna:
-        - Lista dei risultati della query 
+        - Tupla (client, query_api, durata della connessione in secondi) oppure None
     """
     influx_url = os.getenv("INFLUX_URL")
     influx_token = os.getenv("INFLUX_TOKEN")
@@ -32,99 +38,512 @@ def run_query_influx(flux_query: str, query_name_influx: str) -> Optional[list]:
     print(f" Connessione a InfluxDB ({influx_url}) in corso...")
 
     try:
+        start_time = time.perf_counter()
         influx_client = InfluxDBClient(
             url=influx_url,
             token=influx_token,
             org=influx_org,
             timeout=3000_000 
         )
-        query_api = influx_client.query_api()
+        if not influx_client.ping():
+            print(f"Connessione a InfluxDB fallita: il server {influx_url} non risponde al ping")
+            influx_client.close()
+            return None
+        connect_duration = time.perf_counter() - start_time
+        return influx_client, influx_client.query_api(), connect_duration
     except Exception as e:
         print(f"Connessione a InfluxDB fallita: {e}")
         return None
 
-    print(f" Esecuzione query '{query_name_influx}'...")
+
+def open_timescale_connection():
+    """
+    Apre una connessione a TimescaleDB.
+
+    Ritorna:
+        - Tupla (connessione, durata della connessione in secondi) oppure None
+    """
+    try:
+        start_time = time.perf_counter()
+        conn = psycopg2.connect(
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            dbname=os.getenv("DB_NAME")
+        )
+        return conn, time.perf_counter() - start_time
+    except psycopg2.Error as e:
+        print(f"Errore TimescaleDB (psycopg2) durante la connessione: {e}")
+        return None
+    except Exception as e:
+        print(f"Errore generico TimescaleDB durante la connessione: {e}")
+        return None
+
+
+def get_influx_session(reuse_connection=True):
+    """
+    Ritorna (client, query_api, durata della connessione, riutilizzata) riutilizzando, se richiesto,
+    la sessione già aperta: in quel caso la durata della connessione è 0. Oppure None.
+    """
+    global _influx_session
+
+    if reuse_connection and _influx_session:
+        client, query_api, _ = _influx_session
+        return client, query_api, 0.0, True
+
+    session = open_influx_session()
+    if not session:
+        return None
+    if reuse_connection:
+        _influx_session = session
+    return (*session, False)
+
+
+def get_timescale_connection(reuse_connection=True):
+    """
+    Ritorna (connessione, durata della connessione, riutilizzata) riutilizzando, se richiesto,
+    la connessione già aperta (se ancora valida): in quel caso la durata è 0. Oppure None.
+    """
+    global _timescale_connection
+
+    if reuse_connection and _timescale_connection and not _timescale_connection[0].closed:
+        return _timescale_connection[0], 0.0, True
+
+    session = open_timescale_connection()
+    if not session:
+        return None
+    if reuse_connection:
+        _timescale_connection = session
+    return (*session, False)
+
+
+def close_sessions():
+    """
+    Chiude le sessioni riutilizzate da run_query_influx e run_query_timescale.
+    """
+    global _influx_session, _timescale_connection
+
+    if _influx_session:
+        _influx_session[0].close()
+        _influx_session = None
+    if _timescale_connection:
+        if not _timescale_connection[0].closed:
+            _timescale_connection[0].close()
+        _timescale_connection = None
+
+
+"""  MODALITÀ DI LETTURA DEI RISULTATI  """
+
+# Come vengono consumati i risultati delle query:
+# - materialize: tutti i risultati in memoria come oggetti Python (FluxTable / fetchall)
+# - stream: un record alla volta (query_stream). Per TimescaleDB il cursore lato client riceve
+#   l'intero risultato in execute(): si iterano le righe già ricevute, senza streaming dal server
+#   (lo streaming reale è server_cursor)
+# - dataframe: DataFrame pandas (query_data_frame_stream / DataFrame dalle righe)
+# - server_cursor: solo TimescaleDB, cursore lato server che legge FETCH_SIZE righe per round-trip
+# - discard: i byte della risposta vengono letti e scartati senza decodifica
+#   (CSV grezzo per InfluxDB, COPY ... TO STDOUT per TimescaleDB)
+RESULT_MODES = ("materialize", "stream", "dataframe", "server_cursor", "discard")
+INFLUX_RESULT_MODES = ("materialize", "stream", "dataframe", "discard")
+
+# Righe lette per ogni round-trip dal cursore lato server
+FETCH_SIZE = 10_000
+
+# Dimensione dei blocchi letti dalla risposta HTTP grezza in modalità discard
+RAW_READ_SIZE = 64 * 1024
+
+
+class CountingSink:
+    """
+    Destinazione di COPY ... TO STDOUT che conta byte e righe e registra
+    l'istante in cui arriva il primo blocco, scartando i dati.
+    """
+
+    def __init__(self):
+        self.bytes = 0
+        self.rows = 0
+        self.first_data_time = None
+
+    def write(self, data):
+        if self.first_data_time is None:
+            self.first_data_time = time.perf_counter()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bytes += len(data)
+        self.rows += data.count(b"\n")
+
+
+def strip_statement(query):
+    """
+    Rimuove spazi e punto e virgola finali, così la query può essere racchiusa in COPY (...) o DECLARE.
+    """
+    return query.strip().rstrip(";").strip()
+
+
+def consume_influx_result(query_api, flux_query, result_mode):
+    """
+    Esegue la query Flux consumando i risultati secondo result_mode.
+
+    Ritorna:
+        - Tupla (risultato, istante del primo record, righe, byte): il risultato è None
+          in modalità discard, l'istante è un valore di time.perf_counter() (None in materialize,
+          dove il risultato arriva solo completo) e i byte sono noti solo in modalità discard
+    """
+    if result_mode == "materialize":
+        result = list(query_api.query(flux_query))
+        return result, None, sum(len(table.records) for table in result), None
+
+    if result_mode == "stream":
+        first_row_time = None
+        rows = 0
+        for _ in query_api.query_stream(flux_query):
+            if first_row_time is None:
+                first_row_time = time.perf_counter()
+            rows += 1
+        return None, first_row_time, rows, None
+
+    if result_mode == "dataframe":
+        first_row_time = None
+        frames = []
+        for frame in query_api.query_data_frame_stream(flux_query):
+            if first_row_time is None:
+                first_row_time = time.perf_counter()
+            frames.append(frame)
+        result = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        return result, first_row_time, len(result), None
+
+    # discard: CSV annotato letto a blocchi; le righe dati iniziano con "," ma non sono intestazioni
+    response = query_api.query_raw(flux_query)
+    first_row_time = None
+    total_bytes = 0
+    rows = 0
+    remainder = b""
+    try:
+        for chunk in response.stream(RAW_READ_SIZE):
+            if first_row_time is None:
+                first_row_time = time.perf_counter()
+            total_bytes += len(chunk)
+            lines = (remainder + chunk).split(b"\n")
+            remainder = lines.pop()
+            rows += sum(1 for line in lines if line.startswith(b",") and not line.startswith(b",result,"))
+        if remainder.startswith(b",") and not remainder.startswith(b",result,"):
+            rows += 1
+    finally:
+        response.release_conn()
+    return None, first_row_time, rows, total_bytes
+
+
+def consume_timescale_result(conn, sql_query, result_mode):
+    """
+    Esegue la query SQL consumando i risultati secondo result_mode.
+    Con i cursori lato client (materialize, stream, dataframe) execute() riceve l'intero
+    risultato prima di restituire la prima riga: il tempo al primo record non è misurabile
+    e l'istante ritornato è None.
+
+    Ritorna:
+        - Tupla (risultato, istante del primo record, righe, byte) come consume_influx_result
+    """
+    if result_mode == "discard":
+        sink = CountingSink()
+        with conn.cursor() as cursor:
+            cursor.copy_expert(f"COPY ({strip_statement(sql_query)}) TO STDOUT", sink)
+        return None, sink.first_data_time, sink.rows, sink.bytes
+
+    if result_mode == "server_cursor":
+        first_row_time = None
+        rows = 0
+        with conn.cursor(name="benchmark_cursor") as cursor:
+            cursor.itersize = FETCH_SIZE
+            cursor.execute(strip_statement(sql_query))
+            while True:
+                fetched = cursor.fetchmany(FETCH_SIZE)
+                if not fetched:
+                    break
+                if first_row_time is None:
+                    first_row_time = time.perf_counter()
+                rows += len(fetched)
+        return None, first_row_time, rows, None
+
+    with conn.cursor() as cursor:
+        cursor.execute(sql_query)
+
+        if not cursor.description:
+            return None, None, 0, None
+
+        if result_mode == "stream":
+            rows = sum(1 for _ in cursor)
+            return None, None, rows, None
+
+        result = cursor.fetchall()
+        if result_mode == "dataframe":
+            result = pd.DataFrame.from_records(result, columns=[column.name for column in cursor.description])
+        return result, None, len(result), None
+
+
+"""  ESECUZIONE DELLE QUERY  """
+
+def run_query_influx(flux_query: str, query_name_influx: str, reuse_connection: bool = True,
+                     save_result: bool = True, result_mode: str = "materialize", extra_metrics: dict = None):
+    """
+    Esegue una query InfluxDB, misura la durata e salva il risultato.
+
+    Parametri:
+        - flux_query: stringa Flux della query
+        - query_name_influx: nome descrittivo della query da salvare nei risultati
+        - reuse_connection: riutilizza la sessione già aperta invece di crearne una nuova
+        - save_result: se False (esecuzioni di warm-up) la durata non viene salvata
+        - result_mode: modalità di lettura dei risultati (vedi INFLUX_RESULT_MODES)
+        - extra_metrics: colonne aggiuntive salvate con la durata (es. i parametri della query)
+
+    Oltre alla durata totale vengono salvati il tempo al primo record (None se non misurabile), le righe
+    e (in modalità discard) i byte restituiti.
+
+    Ritorna:
+        - Tuple contenente i risultati della query (lista di FluxTable o DataFrame, None in
+          stream e discard) e la durata della query in secondi (None in caso di errore)
+    """
+    if result_mode not in INFLUX_RESULT_MODES:
+        raise ValueError(f"Modalità di lettura non supportata da InfluxDB: '{result_mode}'")
+
+    session = get_influx_session(reuse_connection)
+    if not session:
+        return None
+    influx_client, query_api, connect_duration, reused_connection = session
+
+    print(f" Esecuzione query '{query_name_influx}' ({result_mode})...")
 
     result = None
     duration_query_influx = None
 
     try:
         start_time = time.perf_counter()
-        result = list(query_api.query(flux_query))
+        result, first_row_time, rows, result_bytes = consume_influx_result(query_api, flux_query, result_mode)
         end_time = time.perf_counter()
         duration_query_influx = end_time - start_time
+        time_to_first_row = first_row_time - start_time if first_row_time else None
 
-        print(f"Query '{query_name_influx}' completata in {duration_query_influx:.4f}s")
-        save_query_result("InfluxDB", query_name_influx, duration_query_influx)
+        print(f"Query '{query_name_influx}' completata in {duration_query_influx:.4f}s ({rows} righe)")
+        if save_result:
+            save_query_result("InfluxDB", query_name_influx, duration_query_influx,
+                              connect_duration_seconds=connect_duration, reused_connection=reused_connection,
+                              result_mode=result_mode, time_to_first_row_seconds=time_to_first_row,
+                              rows_returned=rows, bytes_returned=result_bytes, **(extra_metrics or {}))
 
-        if not result:
+        if not rows:
             print("Nessun risultato restituito dalla query.")
 
     except Exception as e:
         print(f"Errore durante la query '{query_name_influx}': {e}")
     finally:
-        influx_client.close()
+        if not reuse_connection:
+            influx_client.close()
 
-    return result
+    return result, duration_query_influx
 
 
 
-def run_query_timescale(timescale_query: str, query_name_ts: str):
+def run_query_timescale(timescale_query: str, query_name_ts: str, reuse_connection: bool = True,
+                        save_result: bool = True, result_mode: str = "materialize", extra_metrics: dict = None):
     """
     Esegue una query su TimescaleDB, misura la durata e salva il risultato.
 
     Parametri:
         - timescale_query: stringa SQL della query da eseguire
         - query_name_ts: nome descrittivo della query da salvare nei risultati
+        - reuse_connection: riutilizza la connessione già aperta invece di crearne una nuova
+        - save_result: se False (esecuzioni di warm-up) la durata non viene salvata
+        - result_mode: modalità di lettura dei risultati (vedi RESULT_MODES)
+        - extra_metrics: colonne aggiuntive salvate con la durata (es. i parametri della query)
+
+    Oltre alla durata totale vengono salvati il tempo al primo record (None se non misurabile), le righe
+    e (in modalità discard) i byte restituiti.
 
     Ritorna:
-        - Tuple contenente la lista dei risultati della query (o None) e la durata della query in secondi
+        - Tuple contenente i risultati della query (lista di tuple o DataFrame, None in
+          stream, server_cursor e discard) e la durata della query in secondi
     """
-    ts_host = os.getenv("DB_HOST")
-    ts_port = os.getenv("DB_PORT")
-    ts_dbname = os.getenv("DB_NAME")
-    ts_password = os.getenv("DB_PASSWORD")
-    ts_user = os.getenv("DB_USER")
+    if result_mode not in RESULT_MODES:
+        raise ValueError(f"Modalità di lettura sconosciuta: '{result_mode}'")
+
+    session = get_timescale_connection(reuse_connection)
+    if not session:
+        return None
+    conn, connect_duration, reused_connection = session
+
+    result = None
+    duration_query_ts = None
 
     try:
-        conn = psycopg2.connect(
-            user=ts_user,
-            password=ts_password,
-            host=ts_host,
-            port=ts_port,
-            dbname=ts_dbname
-        )
+        start_time = time.perf_counter()
+        result, first_row_time, rows, result_bytes = consume_timescale_result(conn, timescale_query, result_mode)
+        duration_query_ts = time.perf_counter() - start_time
+        time_to_first_row = first_row_time - start_time if first_row_time else None
+
+        conn.commit()
+        print(f" Query '{query_name_ts}' ({result_mode}) completata in {duration_query_ts:.4f} secondi ({rows} righe)")
+        if save_result:
+            save_query_result('TimescaleDB', query_name_ts, duration_query_ts,
+                              connect_duration_seconds=connect_duration, reused_connection=reused_connection,
+                              result_mode=result_mode, time_to_first_row_seconds=time_to_first_row,
+                              rows_returned=rows, bytes_returned=result_bytes, **(extra_metrics or {}))
     except psycopg2.Error as e:
-        print(f"Errore TimescaleDB (psycopg2) durante la connessione: {e}")
+        print(f"Errore TimescaleDB durante la query: {e}")
+        try:
+            conn.rollback()
+        except psycopg2.Error as rollb_error:
+            print(f"Errore durante il rollback in TimescaleDB: {rollb_error}")
+    finally:
+        if not reuse_connection:
+            conn.close()
+
+    return result, duration_query_ts
+
+
+"""  ESTENSIONE DEI DATI  """
+
+def influx_data_extent(bucket: str, reuse_connection: bool = True):
+    """
+    Legge il primo e l'ultimo timestamp dei punti 'sensor_data' nel bucket InfluxDB.
+
+    Ritorna:
+        - Tupla (primo, ultimo) in nanosecondi oppure None (bucket vuoto o errore)
+    """
+    session = get_influx_session(reuse_connection)
+    if not session:
         return None
+    influx_client, query_api, _, _ = session
+
+    extent = []
+    try:
+        for selector in ("min", "max"):
+            tables = query_api.query(f'''
+                from(bucket: "{bucket}")
+                  |> range(start: 0)
+                  |> filter(fn: (r) => r["_measurement"] == "sensor_data" and r["_field"] == "temperature")
+                  |> group()
+                  |> {selector}(column: "_time")
+            ''')
+            records = [record for table in tables for record in table.records]
+            if not records:
+                return None
+            extent.append(datetime_to_ns(records[0].get_time()))
     except Exception as e:
-        print(f"Errore generico TimescaleDB durante la connessione: {e}")
+        print(f"Errore InfluxDB durante la lettura dell'intervallo dei dati: {e}")
         return None
+    finally:
+        if not reuse_connection:
+            influx_client.close()
 
-    result = None
-    duration_query_ts = None
+    return tuple(extent)
 
-    try:
-        with conn.cursor() as cursor:
-            start_time = time.perf_counter()
-            cursor.execute(timescale_query)
 
-            
-            if cursor.description:
-                result = cursor.fetchall()
+def timescale_data_extent(reuse_connection: bool = True):
+    """
+    Legge il primo e l'ultimo timestamp della tabella sensors in TimescaleDB.
+
+    Ritorna:
+        - Tupla (primo, ultimo) in nanosecondi oppure None (tabella vuota o errore)
+    """
+    session = get_timescale_connection(reuse_connection)
+    if not session:
+        return None
+    conn, _, _ = session
 
-            duration_query_ts = time.perf_counter() - start_time
-            conn.commit()
-            print(f" Query '{query_name_ts}' completata in {duration_query_ts:.4f} secondi")
-            save_query_result('Timescaldb', query_name_ts, duration_query_ts)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT MIN(time), MAX(time) FROM sensors")
+            first, last = cursor.fetchone()
+        conn.rollback()
     except psycopg2.Error as e:
-        print(f"Errore TimescaleDB durante la query: {e}")
+        print(f"Errore TimescaleDB durante la lettura dell'intervallo dei dati: {e}")
+        try:
+            conn.rollback()
+        except psycopg2.Error as rollb_error:
+            print(f"Errore durante il rollback in TimescaleDB: {rollb_error}")
+        return None
     finally:
-        conn.close()
+        if not reuse_connection:
+            conn.close()
 
-    return result, duration_query_ts
+    if first is None:
+        return None
+    return datetime_to_ns(first), datetime_to_ns(last)
 
 
+"""  PIANI DI ESECUZIONE  """
 
+def explain_timescale_query(timescale_query: str, reuse_connection: bool = True):
+    """
+    Esegue EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) della query su TimescaleDB.
+    ANALYZE esegue di nuovo la query: il piano descrive un'esecuzione successiva a quella
+    misurata (con la cache già calda per quei parametri), non la stessa.
 
+    Ritorna:
+        - Il piano come decodificato da JSON (lista con un dizionario) oppure None in caso di errore
+    """
+    session = get_timescale_connection(reuse_connection)
+    if not session:
+        return None
+    conn, _, _ = session
 
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {strip_statement(timescale_query)}")
+            plan = cursor.fetchone()[0]
+        conn.rollback()
+        return json.loads(plan) if isinstance(plan, str) else plan
+    except psycopg2.Error as e:
+        print(f"Errore TimescaleDB durante EXPLAIN: {e}")
+        try:
+            conn.rollback()
+        except psycopg2.Error as rollb_error:
+            print(f"Errore durante il rollback in TimescaleDB: {rollb_error}")
+        return None
+    finally:
+        if not reuse_connection:
+            conn.close()
+
+
+def iter_plan_nodes(node):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from iter_plan_nodes(child)
+
+
+def summarize_plan(explain_output):
+    """
+    Riassume l'output di explain_timescale_query nelle colonne salvate con il piano:
+    - tempi di pianificazione ed esecuzione riportati da PostgreSQL
+    - blocchi condivisi trovati in cache (hit) e letti da disco o dalla cache del sistema (read),
+      blocchi temporanei (ordinamenti e hash oltre work_mem)
+    - chunk dell'hypertable letti e chunk esclusi a runtime da ChunkAppend
+    - forma del piano: hash dei tipi di nodo in preordine, cambia quando cambia il piano
+      (es. da index scan a sequential scan sui chunk)
+    Il piano completo è salvato come JSON nella colonna 'plan'.
+    """
+    root = explain_output[0]
+    plan = root["Plan"]
+    nodes = list(iter_plan_nodes(plan))
+    chunks = {node["Relation Name"] for node in nodes if node.get("Relation Name", "").startswith("_hyper_")}
+    # Nella forma i chunk compaiono solo come tipo di nodo e le scansioni consecutive uguali
+    # contano una volta: finestre più ampie leggono più chunk ma con lo stesso piano
+    labels = [node["Node Type"] if node.get("Relation Name", "").startswith("_hyper_")
+              else f"{node['Node Type']}:{node.get('Relation Name', '')}".rstrip(":") for node in nodes]
+    shape = ";".join(label for i, label in enumerate(labels) if i == 0 or label != labels[i - 1])
+
+    return {
+        'plan_planning_time_ms': root.get("Planning Time"),
+        'plan_execution_time_ms': root.get("Execution Time"),
+        'plan_shared_hit_blocks': plan.get("Shared Hit Blocks"),
+        'plan_shared_read_blocks': plan.get("Shared Read Blocks"),
+        'plan_temp_blocks': (plan.get("Temp Read Blocks") or 0) + (plan.get("Temp Written Blocks") or 0),
+        'plan_chunks_scanned': len(chunks),
+        'plan_chunks_excluded': sum(
+            (node.get("Chunks excluded during startup") or 0) + (node.get("Chunks excluded during runtime") or 0)
+            for node in nodes
+        ),
+        'plan_nodes': len(nodes),
+        'plan_shape': f"{zlib.crc32(shape.encode('utf-8')):08x}",
+        'plan': json.dumps(root),
+    }
@@ -0,0 +1,114 @@
+import json
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+
+# Tolleranze del confronto dei valori numerici (np.isclose): le aggregazioni in virgola mobile
+# (es. AVG e mean()) possono differire nelle ultime cifre per l'ordine delle somme
+EQUIVALENCE_RTOL = 1e-9
+EQUIVALENCE_ATOL = 1e-9
+
+# Righe non equivalenti riportate come esempio nei risultati di ogni controllo
+MISMATCH_EXAMPLES = 5
+
+
+def is_datetime_column(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    values = series.dropna()
+    return series.dtype == object and len(values) > 0 and isinstance(values.iloc[0], datetime)
+
+
+def normalize_result(frame, keys, values):
+    """
+    Porta il risultato di una query (DataFrame della modalità di lettura 'dataframe' di
+    run_query_influx/run_query_timescale) in una forma confrontabile tra i due database:
+    solo le colonne chiave e valore, tempi in UTC troncati al microsecondo (la precisione di
+    PostgreSQL), numeri come float64, righe ordinate per chiave.
+    Solleva KeyError se mancano colonne in un risultato non vuoto.
+    """
+    columns = list(keys) + list(values)
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=columns)
+
+    missing = [column for column in columns if column not in frame.columns]
+    if missing:
+        raise KeyError(f"Colonne mancanti nel risultato: {missing}")
+
+    frame = frame[columns].copy()
+    for column in columns:
+        if is_datetime_column(frame[column]):
+            frame[column] = pd.to_datetime(frame[column], utc=True).dt.floor("us")
+        elif pd.api.types.is_numeric_dtype(frame[column]):
+            frame[column] = frame[column].astype("float64")
+        else:
+            frame[column] = frame[column].astype(str)
+    return frame.sort_values(list(keys)).reset_index(drop=True)
+
+
+def compare_results(influx_frame, timescale_frame, keys, values, rtol=EQUIVALENCE_RTOL, atol=EQUIVALENCE_ATOL):
+    """
+    Confronta i risultati della stessa query sui due database: le righe sono accoppiate per
+    chiave e i valori confrontati con le tolleranze indicate (i tempi in modo esatto).
+
+    Ritorna il dizionario salvato nella tabella 'query_equivalence': righe per database,
+    righe presenti in uno solo dei due, chiavi duplicate, righe con valori diversi, massima
+    differenza assoluta sui valori numerici, esito ed esempi delle differenze.
+    L'esito è in 'status' (equivalent, different, empty oppure error) e in 'equivalent':
+    se entrambi i risultati sono vuoti non è stata confrontata alcuna riga, quindi lo stato è
+    'empty' ed equivalent è None (controllo non conclusivo).
+    """
+    try:
+        influx = normalize_result(influx_frame, keys, values)
+        timescale = normalize_result(timescale_frame, keys, values)
+    except KeyError as e:
+        return {'status': "error", 'equivalent': False, 'error': str(e)}
+
+    if influx.empty and timescale.empty:
+        return {'status': "empty", 'equivalent': None, 'rows_influx': 0, 'rows_timescale': 0}
+
+    # Con chiavi duplicate l'accoppiamento delle righe non è univoco
+    duplicate_keys = int(influx.duplicated(keys).sum() + timescale.duplicated(keys).sum())
+
+    # Colonne di tipo diverso nei due risultati (es. una vuota) non sono unibili: si usa la stringa
+    for column in keys:
+        if influx[column].dtype != timescale[column].dtype:
+            influx[column], timescale[column] = influx[column].astype(str), timescale[column].astype(str)
+
+    merged = influx.merge(timescale, on=list(keys), how="outer", suffixes=("_influx", "_timescale"), indicator=True)
+    both = merged[merged["_merge"] == "both"]
+
+    mismatched = np.zeros(len(both), dtype=bool)
+    max_abs_difference = 0.0
+    for value in values:
+        influx_values, timescale_values = both[f"{value}_influx"], both[f"{value}_timescale"]
+        if pd.api.types.is_numeric_dtype(influx_values) and pd.api.types.is_numeric_dtype(timescale_values):
+            a, b = influx_values.to_numpy(dtype=float), timescale_values.to_numpy(dtype=float)
+            mismatched |= ~np.isclose(a, b, rtol=rtol, atol=atol, equal_nan=True)
+            differences = np.abs(a - b)
+            if len(differences) and not np.all(np.isnan(differences)):
+                max_abs_difference = max(max_abs_difference, float(np.nanmax(differences)))
+        else:
+            mismatched |= (influx_values.astype(str) != timescale_values.astype(str)).to_numpy()
+
+    only_influx = int((merged["_merge"] == "left_only").sum())
+    only_timescale = int((merged["_merge"] == "right_only").sum())
+    examples = pd.concat([merged[merged["_merge"] != "both"], both[mismatched]]).head(MISMATCH_EXAMPLES)
+    examples = examples.drop(columns="_merge").astype(object)
+    examples = examples.where(examples.notna(), None)
+
+    equivalent = not (only_influx or only_timescale or duplicate_keys or mismatched.any())
+    return {
+        'status': "equivalent" if equivalent else "different",
+        'rows_influx': len(influx),
+        'rows_timescale': len(timescale),
+        'rows_only_influx': only_influx,
+        'rows_only_timescale': only_timescale,
+        'duplicate_keys': duplicate_keys,
+        'rows_mismatched': int(mismatched.sum()),
+        'max_abs_difference': max_abs_difference,
+        'equivalent': equivalent,
+        'mismatch_examples': json.dumps(examples.to_dict("records"), default=str)
+                             if len(examples) else None,
+    }
@@ -0,0 +1,212 @@
+import os
+import queue
+import threading
+import time
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+from influxdb_client import InfluxDBClient
+from latency import LatencyHistogram
+
+
+load_dotenv()
+
+
+"""  SESSIONI DEI CLIENT  """
+
+def open_influx_session():
+    """
+    Apre una sessione InfluxDB dedicata ad un client del generatore di carico.
+    Ritorna (funzione esegui_query, funzione chiudi).
+    """
+    client = InfluxDBClient(
+        url=os.getenv("INFLUX_URL"),
+        token=os.getenv("INFLUX_TOKEN"),
+        org=os.getenv("INFLUX_ORG"),
+        timeout=3000_000
+    )
+    query_api = client.query_api()
+
+    def execute(flux_query):
+        return list(query_api.query(flux_query))
+
+    return execute, client.close
+
+
+def open_timescale_session():
+    """
+    Apre una connessione TimescaleDB dedicata ad un client del generatore di carico.
+    Ritorna (funzione esegui_query, funzione chiudi).
+    """
+    conn = psycopg2.connect(
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        dbname=os.getenv("DB_NAME")
+    )
+    conn.autocommit = True
+
+    def execute(sql_query):
+        with conn.cursor() as cursor:
+            cursor.execute(sql_query)
+            return cursor.fetchall() if cursor.description else None
+
+    return execute, conn.close
+
+
+SESSION_FACTORIES = {
+    'InfluxDB': open_influx_session,
+    'TimescaleDB': open_timescale_session,
+}
+
+
+"""  PIANIFICAZIONE A CICLO APERTO  """
+
+def build_schedule(target_qps, duration_seconds, query_mix, seed, arrivals="poisson"):
+    """
+    Calcola in anticipo gli istanti di avvio previsti (secondi dall'inizio del test)
+    e la query da eseguire per ciascuno.
+
+    Parametri:
+        - target_qps: frequenza obiettivo di query al secondo
+        - duration_seconds: durata del test
+        - query_mix: dizionario {nome_query: peso}
+        - seed: seed del generatore, stessa pianificazione per ogni backend
+        - arrivals: "poisson" (intervalli esponenziali) oppure "uniform" (intervallo costante)
+
+    Ritorna:
+        - Lista di tuple (istante_previsto, nome_query)
+    """
+    rng = np.random.default_rng(seed)
+    expected_count = int(target_qps * duration_seconds)
+
+    if arrivals == "poisson":
+        offsets = np.cumsum(rng.exponential(1.0 / target_qps, size=max(expected_count * 2, 16)))
+        offsets = offsets[offsets < duration_seconds]
+    else:
+        offsets = np.arange(expected_count) / target_qps
+
+    names = list(query_mix)
+    weights = np.array([query_mix[name] for name in names], dtype=float)
+    choices = rng.choice(len(names), size=len(offsets), p=weights / weights.sum())
+
+    return [(float(offset), names[choice]) for offset, choice in zip(offsets, choices)]
+
+
+"""  GENERATORE DI CARICO  """
+
+def run_query_load(database_name, queries, query_mix, num_clients, target_qps, duration_seconds,
+                   seed=42, arrivals="poisson", on_sample=None):
+    """
+    Esegue un test di carico a ciclo aperto su un backend: le query vengono avviate
+    secondo la pianificazione (build_schedule) indipendentemente dal loro completamento
+    e servite da `num_clients` client concorrenti, ognuno con la propria connessione.
+
+    La latenza di risposta è misurata dall'istante previsto di avvio, quindi include
+    l'attesa in coda quando tutti i client sono occupati (niente coordinated omission);
+    il tempo di servizio misura la sola esecuzione della query.
+    Se indicata, on_sample(istante_fine, nome_query, latenza, fallita) viene chiamata
+    per ogni query completata; istante_fine è time.time() per poterlo allineare ad
+    altri processi.
+
+    Ritorna la lista di dizionari di metriche, uno per query più uno complessivo ('ALL').
+    """
+    schedule = build_schedule(target_qps, duration_seconds, query_mix, seed, arrivals)
+    open_session = SESSION_FACTORIES[database_name]
+
+    histograms = {name: (LatencyHistogram(), LatencyHistogram()) for name in list(query_mix) + ['ALL']}
+    errors = {name: 0 for name in list(query_mix) + ['ALL']}
+    lock = threading.Lock()
+    work_queue = queue.Queue()
+    ready = threading.Barrier(num_clients + 1)
+
+    def client_loop():
+        try:
+            execute, close = open_session()
+        except Exception as e:
+            print(f"Errore di connessione di un client {database_name}: {e}")
+            ready.abort()
+            return
+
+        try:
+            ready.wait()
+            while True:
+                item = work_queue.get()
+                if item is None:
+                    break
+                intended_time, query_name = item
+
+                service_start = time.perf_counter()
+                try:
+                    execute(queries[query_name])
+                    failed = False
+                except Exception as e:
+                    print(f"Errore durante la query '{query_name}' ({database_name}): {e}")
+                    failed = True
+                end_time = time.perf_counter()
+
+                with lock:
+                    if on_sample:
+                        on_sample(time.time(), query_name, end_time - intended_time, failed)
+                    for name in (query_name, 'ALL'):
+                        if failed:
+                            errors[name] += 1
+                        else:
+                            histograms[name][0].record(end_time - intended_time)
+                            histograms[name][1].record(end_time - service_start)
+        except threading.BrokenBarrierError:
+            pass
+        finally:
+            close()
+
+    clients = [threading.Thread(target=client_loop, daemon=True) for _ in range(num_clients)]
+    for client in clients:
+        client.start()
+
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        print(f"Test di carico {database_name} annullato: non tutti i client si sono connessi.")
+        for client in clients:
+            client.join()
+        return []
+
+    print(f"\n Test di carico {database_name}: {len(schedule)} query a {target_qps} qps con {num_clients} client...")
+
+    # Il dispatcher rispetta gli istanti previsti anche se i client sono in ritardo
+    start_time = time.perf_counter()
+    for offset, query_name in schedule:
+        delay = start_time + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        work_queue.put((start_time + offset, query_name))
+
+    for _ in clients:
+        work_queue.put(None)
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start_time
+
+    results = []
+    for name, (response_histogram, service_histogram) in histograms.items():
+        completed = response_histogram.count
+        if completed == 0 and errors[name] == 0:
+            continue
+        metrics = {
+            'database': database_name,
+            'query': name,
+            'clients': num_clients,
+            'target_qps': target_qps,
+            'arrivals': arrivals,
+            'completed': completed,
+            'errors': errors[name],
+            'throughput_qps': completed / elapsed if elapsed > 0 else 0,
+            **response_histogram.summary('latency'),
+            **service_histogram.summary('service_time'),
+        }
+        results.append(metrics)
+        print(f" {database_name} '{name}': {completed} query, {metrics['throughput_qps']:.2f} qps, "
+              f"p99 {metrics['latency_p99_ms'] or 0:.1f} ms, errori {errors[name]}")
+
+    return results
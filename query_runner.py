@@ -1,14 +1,79 @@
-from query_benchmark import run_query_influx, run_query_timescale
+from query_benchmark import (
+    run_query_influx, run_query_timescale, close_sessions, explain_timescale_query, summarize_plan,
+    influx_data_extent, timescale_data_extent, INFLUX_RESULT_MODES
+)
 import os
+from datetime import datetime, timezone
+import numpy as np
 from dotenv import load_dotenv
-from graphs_query import analyze_and_plot_results_query
+from device import datetime_to_ns, ns_to_rfc3339
+from device import save_query_load_result
+from graphs_query import analyze_and_plot_results_query, analyze_and_plot_query_load
+from query_load import run_query_load
+from query_equivalence import compare_results
+from query_templates import (
+    template_rng, draw_query_parameters, render_flux, render_sql,
+    HIGH_TEMPERATURE_THRESHOLD, TOP_DEVICES, TEMPLATE_LOOKBACK_DAYS
+)
+from results_store import get_results_store, module_config
+from repeat_runner import run_repeated
+from resource_sampler import ResourceSampler, save_resource_series
 
 
 
 load_dotenv()
 
-# Numero di ripetizioni per ogni query
-REPEAT_PER_QUERY = 1
+# Ripetizioni per ogni query (repeat_runner.py): almeno REPEAT_PER_QUERY, proseguendo fino a
+# MAX_REPEAT_PER_QUERY finché l'intervallo di confidenza della durata mediana non è abbastanza stretto
+REPEAT_PER_QUERY = 5
+MAX_REPEAT_PER_QUERY = 30
+
+# Esecuzioni di warm-up per ogni query (non salvate) e riutilizzo della connessione tra le ripetizioni
+WARMUP_PER_QUERY = 1
+REUSE_CONNECTIONS = True
+
+# Modalità di lettura dei risultati da confrontare (vedi query_benchmark.RESULT_MODES:
+# materialize, stream, dataframe, server_cursor, discard). server_cursor vale solo per TimescaleDB.
+RESULT_MODES_TO_TEST = ["materialize"]
+
+# Query parametrizzate (QUERY_TEMPLATES_FLUX/QUERY_TEMPLATES_TS): a ogni esecuzione finestra
+# temporale, ampiezza, sottoinsieme di device e intervallo di aggregazione sono estratti da una
+# distribuzione con seed (vedi query_templates.py), così le ripetizioni non misurano solo risultati
+# già in cache. Le finestre cadono sull'intervallo coperto dai dati (vedi data_extent).
+# Con False vengono eseguite le query fisse QUERIES_FLUX/QUERIES_TS.
+PARAMETERIZED_QUERIES = True
+QUERY_SEED = 42
+
+# Piani di esecuzione TimescaleDB (EXPLAIN (ANALYZE, BUFFERS), tabella 'query_plans'): catturati
+# per una frazione casuale delle esecuzioni misurate e per ogni esecuzione più lenta di
+# EXPLAIN_SLOW_FACTOR volte la mediana delle precedenti (almeno EXPLAIN_MIN_HISTORY)
+EXPLAIN_SAMPLE_RATE = 0.2
+EXPLAIN_SLOW_FACTOR = 2.0
+EXPLAIN_MIN_HISTORY = 3
+
+# Test di carico a ciclo aperto (query_load.py): client concorrenti, frequenza obiettivo,
+# durata in secondi e mix pesato delle query definite sotto (stesso mix per entrambi i database)
+LOAD_TEST = False
+LOAD_CLIENTS = 8
+LOAD_TARGET_QPS = 20
+LOAD_DURATION_SECONDS = 60
+LOAD_ARRIVALS = "poisson"  # "poisson" oppure "uniform"
+LOAD_SEED = 42
+LOAD_QUERY_MIX = {
+    "aggregation_query": 1,
+    "mean_humidity": 4,
+    "count_records_for_each_device": 2,
+    "join_counter": 1,
+}
+
+# Controllo di equivalenza dei risultati (vedi run_equivalence_checks): le stesse query vengono
+# eseguite su entrambi i database con gli stessi parametri e i risultati confrontati riga per riga
+EQUIVALENCE_CHECK = True
+EQUIVALENCE_CHECKS_PER_QUERY = 3
+EQUIVALENCE_SEED = 7
+
+# Device interrogato dalla query fissa 'single_device_range'
+SINGLE_DEVICE = "sensor_1"
 
 # Definizione delle query Flux di benchmark
 
@@ -19,7 +84,8 @@ QUERIES_FLUX = {
       from(bucket: "{bucket}")
     |> range(start: -14d)
     |> filter(fn: (r) => r["_measurement"] == "sensor_data")
-    |> aggregateWindow(every: 1h, fn: count, createEmpty: false)
+    |> filter(fn: (r) => r["_field"] == "temperature")
+    |> aggregateWindow(every: 1h, fn: count, createEmpty: false, timeSrc: "_start")
     |> group(columns: ["device"])
     |> rename(columns: {{_value: "records_per_hour", _time: "device_per_hour"}})
     |> sort(columns: ["device"])
@@ -32,11 +98,13 @@ QUERIES_FLUX = {
           |> filter(fn: (r) => r["_field"] == "humidity")
           |> group(columns: ["device"])
           |> mean()
+          |> rename(columns: {{_value: "mean_humidity"}})
     ''',
     "count_records_for_each_device": f'''
         from(bucket: "{bucket}")
           |> range(start: -14d)
           |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+          |> filter(fn: (r) => r["_field"] == "temperature")
           |> group(columns: ["device"])
           |> count()
           |> rename(columns : {{_value:"devices_counted"}})
@@ -68,7 +136,51 @@ joined
   |> rename(columns: {{max_temperature: "counter"}}
   )
 
-'''
+''',
+
+    # Suite per dashboard (sul modello delle query IoT di TSBS)
+    "lastpoint": f'''
+        from(bucket: "{bucket}")
+          |> range(start: -14d)
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+          |> last()
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> group()
+          |> keep(columns: ["device", "_time", "temperature", "humidity"])
+          |> rename(columns: {{_time: "time"}})
+          |> sort(columns: ["device"])
+    ''',
+    "top_devices_max_temperature": f'''
+        from(bucket: "{bucket}")
+          |> range(start: -1h)
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data" and r["_field"] == "temperature")
+          |> group(columns: ["device"])
+          |> max()
+          |> group()
+          |> sort(columns: ["_value", "device"], desc: true)
+          |> limit(n: {TOP_DEVICES})
+          |> keep(columns: ["device", "_value"])
+          |> rename(columns: {{_value: "max_temperature"}})
+    ''',
+    "high_temperature": f'''
+        from(bucket: "{bucket}")
+          |> range(start: -1h)
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data" and r["_field"] == "temperature")
+          |> filter(fn: (r) => r["_value"] > {HIGH_TEMPERATURE_THRESHOLD})
+          |> group()
+          |> keep(columns: ["device", "_time", "_value"])
+          |> rename(columns: {{_time: "time", _value: "temperature"}})
+          |> sort(columns: ["device", "time"])
+    ''',
+    "single_device_range": f'''
+        from(bucket: "{bucket}")
+          |> range(start: -1h)
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data" and r["device"] == "{SINGLE_DEVICE}")
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> keep(columns: ["_time", "temperature", "humidity"])
+          |> rename(columns: {{_time: "time"}})
+          |> sort(columns: ["time"])
+    '''
 }
 
 QUERIES_TS = {
@@ -94,6 +206,7 @@ QUERIES_TS = {
     '''
     SELECT device, COUNT(*) as devices_counted
     FROM sensors
+    WHERE time >= NOW() - INTERVAL '14 days'
     GROUP BY device;
     '''
     ,
@@ -136,32 +249,481 @@ SELECT
 FROM joined
 GROUP BY device
 ORDER BY device;
+    ''',
+
+    # Suite per dashboard (sul modello delle query IoT di TSBS)
+    "lastpoint": '''
+    SELECT DISTINCT ON (device) device, time, temperature, humidity
+    FROM sensors
+    WHERE time >= NOW() - INTERVAL '14 days'
+    ORDER BY device, time DESC;
+    ''',
+
+    "top_devices_max_temperature": f'''
+    SELECT device, MAX(temperature) AS max_temperature
+    FROM sensors
+    WHERE time >= NOW() - INTERVAL '1 hour'
+    GROUP BY device
+    ORDER BY max_temperature DESC, device DESC
+    LIMIT {TOP_DEVICES};
+    ''',
+
+    "high_temperature": f'''
+    SELECT device, time, temperature
+    FROM sensors
+    WHERE time >= NOW() - INTERVAL '1 hour'
+      AND temperature > {HIGH_TEMPERATURE_THRESHOLD}
+    ORDER BY device, time;
+    ''',
+
+    "single_device_range": f'''
+    SELECT time, temperature, humidity
+    FROM sensors
+    WHERE device = '{SINGLE_DEVICE}'
+      AND time >= NOW() - INTERVAL '1 hour'
+    ORDER BY time;
     '''
-    
-    
 }
 
+# Template delle query parametrizzate: stesse query di QUERIES_FLUX/QUERIES_TS, limitate a una
+# finestra temporale e a un sottoinsieme di device, con l'intervallo di aggregazione variabile
+# (segnaposto {start}, {stop}, {every}, {devices} e {bucket}, vedi query_templates.py)
+
+QUERY_TEMPLATES_FLUX = {
+    "aggregation_query": '''
+      from(bucket: "{bucket}")
+    |> range(start: {start}, stop: {stop})
+    |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+    |> filter(fn: (r) => r["_field"] == "temperature")
+    |> filter(fn: (r) => contains(value: r["device"], set: {devices}))
+    |> aggregateWindow(every: {every}, fn: count, createEmpty: false, timeSrc: "_start")
+    |> group(columns: ["device"])
+    |> rename(columns: {{_value: "records_per_hour", _time: "device_per_hour"}})
+    |> sort(columns: ["device"])
+    ''',
+    "mean_humidity": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+          |> filter(fn: (r) => r["_field"] == "humidity")
+          |> filter(fn: (r) => contains(value: r["device"], set: {devices}))
+          |> group(columns: ["device"])
+          |> mean()
+          |> rename(columns: {{_value: "mean_humidity"}})
+    ''',
+    "count_records_for_each_device": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+          |> filter(fn: (r) => r["_field"] == "temperature")
+          |> filter(fn: (r) => contains(value: r["device"], set: {devices}))
+          |> group(columns: ["device"])
+          |> count()
+          |> rename(columns : {{_value:"devices_counted"}})
+    ''',
+    "join_counter": '''
+  temp = from(bucket: "{bucket}")
+  |> range(start: {start}, stop: {stop})
+  |> filter(fn: (r) => r._measurement == "sensor_data" and r._field == "temperature")
+  |> filter(fn: (r) => contains(value: r.device, set: {devices}))
+  |> aggregateWindow(every: {every}, fn: max, createEmpty: false)
+  |> rename(columns: {{_value: "max_temperature"}})
+
+hum = from(bucket: "{bucket}")
+  |> range(start: {start}, stop: {stop})
+  |> filter(fn: (r) => r._measurement == "sensor_data" and r._field == "humidity")
+  |> filter(fn: (r) => contains(value: r.device, set: {devices}))
+  |> aggregateWindow(every: {every}, fn: max, createEmpty: false)
+  |> rename(columns: {{_value: "max_humidity"}})
+
+joined = join(
+  tables: {{t: temp, h: hum}},
+  on: ["_time", "device"],
+  method: "inner"
+)
+  |> keep(columns: ["_time", "device", "max_temperature", "max_humidity"])
+
+joined
+  |> group(columns: ["device"])
+  |> count(column: "max_temperature")
+  |> rename(columns: {{max_temperature: "counter"}})
+''',
+
+    "lastpoint": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data")
+          |> filter(fn: (r) => contains(value: r["device"], set: {devices}))
+          |> last()
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> group()
+          |> keep(columns: ["device", "_time", "temperature", "humidity"])
+          |> rename(columns: {{_time: "time"}})
+          |> sort(columns: ["device"])
+    ''',
+    # Le temperature hanno 2 decimali: a parità di massimo al limite della classifica decide il
+    # device (ordine decrescente in entrambe le query), altrimenti i device restituiti possono differire
+    "top_devices_max_temperature": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data" and r["_field"] == "temperature")
+          |> filter(fn: (r) => contains(value: r["device"], set: {devices}))
+          |> group(columns: ["device"])
+          |> max()
+          |> group()
+          |> sort(columns: ["_value", "device"], desc: true)
+          |> limit(n: {limit})
+          |> keep(columns: ["device", "_value"])
+          |> rename(columns: {{_value: "max_temperature"}})
+    ''',
+    "high_temperature": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data" and r["_field"] == "temperature")
+          |> filter(fn: (r) => contains(value: r["device"], set: {devices}))
+          |> filter(fn: (r) => r["_value"] > {threshold})
+          |> group()
+          |> keep(columns: ["device", "_time", "_value"])
+          |> rename(columns: {{_time: "time", _value: "temperature"}})
+          |> sort(columns: ["device", "time"])
+    ''',
+    "single_device_range": '''
+        from(bucket: "{bucket}")
+          |> range(start: {start}, stop: {stop})
+          |> filter(fn: (r) => r["_measurement"] == "sensor_data" and r["device"] == {device})
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> keep(columns: ["_time", "temperature", "humidity"])
+          |> rename(columns: {{_time: "time"}})
+          |> sort(columns: ["time"])
+    '''
+}
+
+QUERY_TEMPLATES_TS = {
+    "aggregation_query": '''
+    SELECT time_bucket({every}, time) AS device_per_hour,
+       device,
+       COUNT(*) AS records_per_hour
+        FROM sensors
+        WHERE time >= {start} AND time < {stop}
+          AND device IN ({devices})
+        GROUP BY device_per_hour, device
+        ORDER BY device;''',
+
+    "mean_humidity": '''
+    SELECT device,
+    AVG(humidity) AS mean_humidity
+    FROM sensors
+    WHERE time >= {start} AND time < {stop}
+      AND device IN ({devices})
+    GROUP BY device;
+    ''',
+
+    "count_records_for_each_device": '''
+    SELECT device, COUNT(*) as devices_counted
+    FROM sensors
+    WHERE time >= {start} AND time < {stop}
+      AND device IN ({devices})
+    GROUP BY device;
+    ''',
+
+    "join_counter": '''
+    WITH max_temp AS (
+    SELECT
+        time_bucket({every}, time) AS bucket,
+        device,
+        MAX(temperature) AS max_temperature
+    FROM sensors
+    WHERE time >= {start} AND time < {stop}
+      AND device IN ({devices})
+    GROUP BY bucket, device
+),
+
+max_hum AS (
+    SELECT
+        time_bucket({every}, time) AS bucket,
+        device,
+        MAX(humidity) AS max_humidity
+    FROM sensors
+    WHERE time >= {start} AND time < {stop}
+      AND device IN ({devices})
+    GROUP BY bucket, device
+),
+
+joined AS (
+    SELECT
+        t.bucket,
+        t.device
+    FROM max_temp t
+    JOIN max_hum h
+        ON t.bucket = h.bucket
+        AND t.device = h.device
+)
+
+SELECT
+    device,
+    COUNT(*) AS counter
+FROM joined
+GROUP BY device
+ORDER BY device;
+    ''',
+
+    "lastpoint": '''
+    SELECT DISTINCT ON (device) device, time, temperature, humidity
+    FROM sensors
+    WHERE time >= {start} AND time < {stop}
+      AND device IN ({devices})
+    ORDER BY device, time DESC;
+    ''',
+
+    "top_devices_max_temperature": '''
+    SELECT device, MAX(temperature) AS max_temperature
+    FROM sensors
+    WHERE time >= {start} AND time < {stop}
+      AND device IN ({devices})
+    GROUP BY device
+    ORDER BY max_temperature DESC, device DESC
+    LIMIT {limit};
+    ''',
+
+    "high_temperature": '''
+    SELECT device, time, temperature
+    FROM sensors
+    WHERE time >= {start} AND time < {stop}
+      AND device IN ({devices})
+      AND temperature > {threshold}
+    ORDER BY device, time;
+    ''',
+
+    "single_device_range": '''
+    SELECT time, temperature, humidity
+    FROM sensors
+    WHERE device = {device}
+      AND time >= {start} AND time < {stop}
+    ORDER BY time;
+    '''
+}
+
+# Colonne confrontate dal controllo di equivalenza (query_equivalence.py) per ogni query:
+# (colonne chiave, colonne valore), con gli stessi nomi nei risultati Flux e SQL
+QUERY_RESULT_COLUMNS = {
+    "aggregation_query": (["device", "device_per_hour"], ["records_per_hour"]),
+    "mean_humidity": (["device"], ["mean_humidity"]),
+    "count_records_for_each_device": (["device"], ["devices_counted"]),
+    "join_counter": (["device"], ["counter"]),
+    "lastpoint": (["device"], ["time", "temperature", "humidity"]),
+    "top_devices_max_temperature": (["device"], ["max_temperature"]),
+    "high_temperature": (["device", "time"], ["temperature"]),
+    "single_device_range": (["time"], ["temperature", "humidity"]),
+}
+
+def capture_plan(sql_query, database_name, name, result_mode, execution, duration, parameters, reason):
+    """
+    Salva nella tabella 'query_plans' il piano EXPLAIN (ANALYZE, BUFFERS) di un'esecuzione
+    misurata, con durata e parametri, così le esecuzioni lente possono essere ricondotte a un
+    cambio di piano, all'esclusione dei chunk o ai blocchi letti fuori dalla cache.
+    """
+    plan = explain_timescale_query(sql_query, REUSE_CONNECTIONS)
+    if plan is None:
+        return
+    get_results_store().add('query_plans', {
+        'database': database_name,
+        'query': name,
+        'result_mode': result_mode,
+        'execution': execution,
+        'duration_seconds': duration,
+        'explain_reason': reason,
+        **parameters,
+        **summarize_plan(plan),
+    })
+
+
+def run_repeated_query(run_query, database_name, query, name, result_mode, render=None, extent=None):
+    """
+    Esegue una query con warm-up e ripetizioni adattive (vedi repeat_runner.run_repeated)
+    e salva le statistiche della durata nella tabella 'queries_summary'.
+    Durante le ripetizioni le risorse del client sono campionate (resource_sampler.py):
+    il riepilogo va nella stessa riga, le serie temporali nelle tabelle del campionatore.
+
+    Con render (render_flux o render_sql) `query` è un template: ogni esecuzione, warm-up
+    compresi, estrae nuovi parametri (finestre che intersecano extent) e li salva con
+    la durata. Per TimescaleDB vengono catturati i piani di esecuzione (vedi EXPLAIN_SAMPLE_RATE).
+    """
+    parameters_rng = template_rng(QUERY_SEED, name)
+    explain_rng = template_rng(QUERY_SEED, name + ":explain")
+    durations = []
+
+    def measure(save_result=True):
+        parameters = draw_query_parameters(parameters_rng, extent) if render else {}
+        query_text = render(query, parameters) if render else query
+        execution = len(durations) if save_result else None
+        outcome = run_query(query_text, name, REUSE_CONNECTIONS, save_result=save_result,
+                            result_mode=result_mode, extra_metrics={**parameters, 'execution': execution})
+        duration = outcome[1] if outcome else None
+        if not save_result or duration is None:
+            return duration
+
+        if run_query is run_query_timescale:
+            if explain_rng.random() < EXPLAIN_SAMPLE_RATE:
+                reason = "sampled"
+            elif len(durations) >= EXPLAIN_MIN_HISTORY and duration > EXPLAIN_SLOW_FACTOR * np.median(durations):
+                reason = "slow"
+            else:
+                reason = None
+            if reason:
+                capture_plan(query_text, database_name, name, result_mode, execution, duration, parameters, reason)
+
+        durations.append(duration)
+        return duration
+
+    for i in range(WARMUP_PER_QUERY):
+        measure(save_result=False)
+
+    labels = {'database': database_name, 'query': name, 'result_mode': result_mode}
+    with ResourceSampler() as sampler:
+        samples, summary = run_repeated(measure, 0, REPEAT_PER_QUERY, MAX_REPEAT_PER_QUERY)
+
+    get_results_store().add('queries_summary', {
+        **labels,
+        'metric': 'duration_seconds',
+        **summary,
+        **sampler.summary(),
+    })
+    save_resource_series(sampler.series(), labels)
+
+
+def run_equivalence_checks(queries_flux, queries_ts, render_influx=None, render_timescale=None, extent=None):
+    """
+    Verifica che le query delle due suite abbiano la stessa semantica: per ogni query presente
+    in entrambe (e in QUERY_RESULT_COLUMNS) esegue EQUIVALENCE_CHECKS_PER_QUERY volte la versione
+    Flux e quella SQL con gli stessi parametri, legge i risultati come DataFrame e li confronta
+    (query_equivalence.compare_results). Le esecuzioni non sono misurate; gli esiti vanno nella
+    tabella 'query_equivalence'.
+    Con le query fisse le finestre relative (-14d, NOW()) sono valutate in istanti diversi sui
+    due database, quindi possono differire le righe ai bordi: l'esito è affidabile con i template.
+    """
+    results_store = get_results_store()
+    failed = []
+    statuses = []
+
+    for name, (keys, values) in QUERY_RESULT_COLUMNS.items():
+        if name not in queries_flux or name not in queries_ts:
+            continue
+        rng = template_rng(EQUIVALENCE_SEED, name)
+
+        for check in range(EQUIVALENCE_CHECKS_PER_QUERY):
+            parameters = draw_query_parameters(rng, extent) if render_influx else {}
+            flux_query = render_influx(queries_flux[name], parameters) if render_influx else queries_flux[name]
+            sql_query = render_timescale(queries_ts[name], parameters) if render_timescale else queries_ts[name]
+
+            influx_outcome = run_query_influx(flux_query, name, REUSE_CONNECTIONS, save_result=False,
+                                              result_mode="dataframe")
+            timescale_outcome = run_query_timescale(sql_query, name, REUSE_CONNECTIONS, save_result=False,
+                                                    result_mode="dataframe")
+            if not influx_outcome or influx_outcome[1] is None or not timescale_outcome or timescale_outcome[1] is None:
+                comparison = {'status': "error", 'equivalent': False, 'error': "query fallita su almeno un database"}
+            else:
+                comparison = compare_results(influx_outcome[0], timescale_outcome[0], keys, values)
+
+            results_store.add('query_equivalence', {'query': name, 'check': check, **parameters, **comparison})
+            statuses.append(comparison['status'])
+            if comparison['status'] == "empty":
+                print(f" Query '{name}' (controllo {check}): risultati vuoti su entrambi i database, non confrontati")
+            elif not comparison['equivalent']:
+                failed.append(name)
+                print(f" Query '{name}' NON equivalente (controllo {check}): "
+                      f"{comparison.get('error') or comparison.get('mismatch_examples')}")
+
+    compared = statuses.count("equivalent")
+    empty = statuses.count("empty")
+    if failed:
+        print(f"\n Controllo di equivalenza fallito per: {', '.join(sorted(set(failed)))}")
+    elif not compared:
+        print(f"\n Controllo di equivalenza non conclusivo: nessun controllo ha confrontato righe "
+              f"({empty} con risultati vuoti su entrambi i database).")
+    else:
+        print(f"\n Controllo di equivalenza superato: i risultati coincidono su entrambi i database "
+              f"({compared} controlli con righe, {empty} con risultati vuoti).")
+
+
+def data_extent():
+    """
+    Intervallo (inizio, fine) in ns su cui posizionare le finestre delle query parametrizzate:
+    dal primo all'ultimo timestamp presente in almeno uno dei due database (una lettura per
+    database), così entrambi ricevono le stesse finestre e queste intersecano i dati anche quando
+    l'inserimento copre pochi secondi (main.TIME_SPAN_DAYS non impostato).
+    Se nessun database contiene dati, usa gli ultimi TEMPLATE_LOOKBACK_DAYS giorni con un avviso.
+    """
+    extents = [extent for extent in (influx_data_extent(bucket), timescale_data_extent()) if extent]
+    if not extents:
+        now_ns = datetime_to_ns(datetime.now(timezone.utc))
+        print(f" Attenzione: nessun dato trovato, le finestre delle query coprono gli ultimi "
+              f"{TEMPLATE_LOOKBACK_DAYS} giorni e potrebbero restituire risultati vuoti.")
+        return now_ns - TEMPLATE_LOOKBACK_DAYS * 24 * 3600 * 10**9, now_ns
+
+    extent = min(start for start, _ in extents), max(stop for _, stop in extents)
+    print(f" Intervallo dei dati per le query parametrizzate: {ns_to_rfc3339(extent[0])} - {ns_to_rfc3339(extent[1])}")
+    return extent
+
+
 def main():
-    if os.path.exists("query_results.csv"):
-        os.remove("query_results.csv")
-        print(" File 'query_results.csv' precedente rimosso.")
+    results_store = get_results_store()
+    results_store.begin_run('queries', module_config(globals()))
 
-    for name, flux_query in QUERIES_FLUX.items():
-        print(f"\n Avvio test di benchmark per la query --> '{name}'")
+    if PARAMETERIZED_QUERIES:
+        extent = data_extent()
+        queries_flux, render_influx = QUERY_TEMPLATES_FLUX, lambda template, parameters: render_flux(template, parameters, bucket)
+        queries_ts, render_timescale = QUERY_TEMPLATES_TS, render_sql
+    else:
+        queries_flux, render_influx = QUERIES_FLUX, None
+        queries_ts, render_timescale = QUERIES_TS, None
+        extent = None
 
-        for i in range(REPEAT_PER_QUERY):        
-            run_query_influx(flux_query, name)
+    for name, flux_query in queries_flux.items():
+        for result_mode in RESULT_MODES_TO_TEST:
+            if result_mode not in INFLUX_RESULT_MODES:
+                continue
+            print(f"\n Avvio test di benchmark per la query --> '{name}' ({result_mode})")
+            run_repeated_query(run_query_influx, "InfluxDB", flux_query, name, result_mode, render_influx, extent)
     
-    for name_ts, ts_query in QUERIES_TS.items() :
-        print(f"\n Avvio test di benchmark per la query sql --> '{name_ts}'")
-        for i in range(REPEAT_PER_QUERY):
-            run_query_timescale(ts_query, name_ts)
+    for name_ts, ts_query in queries_ts.items() :
+        for result_mode in RESULT_MODES_TO_TEST:
+            print(f"\n Avvio test di benchmark per la query sql --> '{name_ts}' ({result_mode})")
+            run_repeated_query(run_query_timescale, "TimescaleDB", ts_query, name_ts, result_mode, render_timescale, extent)
+
+    if EQUIVALENCE_CHECK:
+        run_equivalence_checks(queries_flux, queries_ts, render_influx, render_timescale, extent)
+
+    close_sessions()
 
 
     print("\nTutti i test riguardanti le query sono stati completati.")
 
+    if LOAD_TEST:
+        run_load_test()
+
+    results_store.flush()
+
+
+def run_load_test():
+    """
+    Esegue il test di carico concorrente su entrambi i database e salva
+    i risultati nella tabella 'query_load' dell'archivio dei risultati.
+    """
+
+    for database_name, queries in (("InfluxDB", QUERIES_FLUX), ("TimescaleDB", QUERIES_TS)):
+        results = run_query_load(
+            database_name, queries, LOAD_QUERY_MIX, LOAD_CLIENTS, LOAD_TARGET_QPS,
+            LOAD_DURATION_SECONDS, LOAD_SEED, LOAD_ARRIVALS
+        )
+        for metrics in results:
+            save_query_load_result(metrics)
+
+    print("\nTest di carico sulle query completato.")
+
 
 if __name__ == "__main__":
     main()
     analyze_and_plot_results_query()
+    if LOAD_TEST:
+        analyze_and_plot_query_load()
 
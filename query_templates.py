@@ -0,0 +1,114 @@
+import zlib
+import numpy as np
+from device import create_device_ids, ns_to_rfc3339
+
+
+# Distribuzione dei parametri delle query parametrizzate (vedi draw_query_parameters).
+# Le finestre temporali sono posizionate sull'intervallo coperto dai dati (query_runner.data_extent);
+# se i database sono vuoti o non raggiungibili, sugli ultimi TEMPLATE_LOOKBACK_DAYS giorni
+TEMPLATE_LOOKBACK_DAYS = 14
+
+# Ampiezze della finestra temporale, intervalli di aggregazione e numero di device interrogati
+# (estratti con probabilità uniforme). I device sono scelti tra sensor_1 ... sensor_<QUERY_DEVICES>.
+WINDOW_SIZES_SECONDS = (3600, 6 * 3600, 24 * 3600, 3 * 24 * 3600, 7 * 24 * 3600)
+AGGREGATION_INTERVALS_SECONDS = (60, 300, 900, 3600)
+DEVICE_SUBSET_SIZES = (1, 3, 5, 10)
+QUERY_DEVICES = 10
+
+# Costanti delle query della suite per dashboard (segnaposto {threshold} e {limit}):
+# soglia del filtro sulla temperatura (i dati generati sono uniformi tra 20 e 30 gradi)
+# e numero di device restituiti dalla classifica per temperatura massima
+HIGH_TEMPERATURE_THRESHOLD = 29.5
+TOP_DEVICES = 5
+
+
+def template_rng(seed, name):
+    """
+    Generatore dei parametri di una query: dipende solo dal seed e dal nome della query,
+    quindi entrambi i database ricevono la stessa sequenza di parametri.
+    """
+    return np.random.default_rng([seed, zlib.crc32(name.encode("utf-8"))])
+
+
+def draw_query_parameters(rng, extent):
+    """
+    Estrae i parametri di un'esecuzione: una finestra temporale di ampiezza casuale che contiene
+    un istante estratto a caso in extent (tupla (inizio, fine) in ns, es. l'intervallo coperto
+    dai dati), così ogni finestra interseca i dati anche quando durano meno della finestra,
+    un intervallo di aggregazione più piccolo della finestra e un sottoinsieme casuale di device.
+    La finestra è allineata all'intervallo di aggregazione, così i bucket di aggregateWindow e
+    di time_bucket coincidono (nessun bucket parziale ai bordi).
+
+    Ritorna un dizionario serializzabile (salvato con i tempi della query):
+    time_start e time_stop (RFC 3339), window_seconds, every_seconds, devices (separati da virgola)
+    e device_count.
+    """
+    extent_start_ns, extent_stop_ns = extent
+    window_seconds = int(rng.choice(WINDOW_SIZES_SECONDS))
+    instant_ns = extent_start_ns + int(rng.uniform(0, extent_stop_ns - extent_start_ns))
+
+    intervals = [interval for interval in AGGREGATION_INTERVALS_SECONDS if interval < window_seconds]
+    every_seconds = int(rng.choice(intervals or AGGREGATION_INTERVALS_SECONDS[:1]))
+
+    # La fine della finestra cade meno di window - every secondi dopo l'istante estratto: portata
+    # al multiplo successivo dell'intervallo di aggregazione, l'istante resta dentro la finestra
+    every_ns = every_seconds * 10**9
+    stop_ns = instant_ns + int(rng.uniform(0, window_seconds - every_seconds) * 1e9)
+    stop_ns += every_ns - stop_ns % every_ns
+    start_ns = stop_ns - (window_seconds * 10**9 // every_ns) * every_ns
+
+    device_ids = create_device_ids(QUERY_DEVICES)
+    device_count = min(int(rng.choice(DEVICE_SUBSET_SIZES)), len(device_ids))
+    indexes = np.sort(rng.choice(len(device_ids), size=device_count, replace=False))
+
+    return {
+        'time_start': ns_to_rfc3339(start_ns),
+        'time_stop': ns_to_rfc3339(stop_ns),
+        'window_seconds': window_seconds,
+        'every_seconds': every_seconds,
+        'devices': ",".join(device_ids[indexes]),
+        'device_count': device_count,
+    }
+
+
+"""  RENDERING  """
+
+# I template usano i segnaposto {start}, {stop}, {every}, {devices} e {device} (il primo device
+# del sottoinsieme, per le query su un solo device), più {bucket} per Flux, sostituiti con la
+# sintassi di ogni linguaggio, e le costanti {threshold} e {limit}.
+# Le parentesi graffe letterali vanno raddoppiate.
+
+def render_flux(template, parameters, bucket):
+    """
+    Sostituisce i parametri nel template Flux: tempi come letterali RFC 3339, intervallo come
+    durata (es. 300s) e device come array di stringhe, da usare con contains(value:, set:).
+    """
+    devices = ", ".join(f'"{device}"' for device in parameters['devices'].split(","))
+    return template.format(
+        bucket=bucket,
+        start=parameters['time_start'],
+        stop=parameters['time_stop'],
+        every=f"{parameters['every_seconds']}s",
+        devices=f"[{devices}]",
+        device=f'"{parameters["devices"].split(",")[0]}"',
+        threshold=HIGH_TEMPERATURE_THRESHOLD,
+        limit=TOP_DEVICES,
+    )
+
+
+def render_sql(template, parameters):
+    """
+    Sostituisce i parametri nel template SQL: tempi e intervallo come letterali tra apici
+    (es. '300 seconds' per time_bucket) e device come lista per IN (...).
+    I valori provengono da draw_query_parameters, non da input esterni.
+    """
+    devices = ", ".join(f"'{device}'" for device in parameters['devices'].split(","))
+    return template.format(
+        start=f"'{parameters['time_start']}'",
+        stop=f"'{parameters['time_stop']}'",
+        every=f"'{parameters['every_seconds']} seconds'",
+        devices=devices,
+        device=f"'{parameters['devices'].split(',')[0]}'",
+        threshold=HIGH_TEMPERATURE_THRESHOLD,
+        limit=TOP_DEVICES,
+    )
@@ -0,0 +1,334 @@
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from results_store import get_results_store
+
+
+# Parametri statistici condivisi dai benchmark ripetuti (main.py, query_runner.py)
+
+# Livello di confidenza e numero di ricampionamenti degli intervalli bootstrap
+CONFIDENCE_LEVEL = 0.95
+BOOTSTRAP_RESAMPLES = 10_000
+BOOTSTRAP_SEED = 0
+
+# Le ripetizioni continuano finché la semi-ampiezza dell'intervallo di confidenza della
+# mediana non scende sotto questa frazione della mediana (o si raggiunge il massimo)
+TARGET_CI_RELATIVE_WIDTH = 0.05
+
+# Valori anomali: fuori da [Q1 - k*IQR, Q3 + k*IQR] (recinti di Tukey), esclusi dalle
+# statistiche; con meno di OUTLIER_MIN_SAMPLES campioni non si scarta nulla
+OUTLIER_IQR_FACTOR = 1.5
+OUTLIER_MIN_SAMPLES = 5
+
+# Confronto con la baseline: un rallentamento è segnalato solo se l'intervallo di confidenza
+# della variazione è tutto dal lato peggiore e la variazione mediana supera la soglia
+SLOWDOWN_THRESHOLD = 0.05
+
+# Metrica confrontata per ogni tabella dei risultati e colonne che identificano una serie
+# (quelle assenti nella tabella vengono ignorate)
+COMPARISON_METRICS = {
+    'performance': {
+        'metric': 'throughput_records_per_second',
+        'higher_is_better': True,
+        'keys': ['database', 'ingest_mode', 'serializer', 'sink', 'num_records', 'workers', 'in_flight'],
+    },
+    'null_sink_check': {
+        'metric': 'throughput_records_per_second',
+        'higher_is_better': True,
+        'keys': ['database', 'ingest_mode', 'serializer', 'sink', 'num_records'],
+    },
+    'queries': {
+        'metric': 'duration_seconds',
+        'higher_is_better': False,
+        'keys': ['database', 'query', 'result_mode', 'reused_connection'],
+    },
+}
+
+
+"""  STATISTICHE  """
+
+def outlier_mask(samples, factor=OUTLIER_IQR_FACTOR):
+    """
+    Ritorna la maschera booleana dei campioni anomali secondo i recinti di Tukey.
+    """
+    samples = np.asarray(samples, dtype=float)
+    if len(samples) < OUTLIER_MIN_SAMPLES:
+        return np.zeros(len(samples), dtype=bool)
+    q1, q3 = np.percentile(samples, [25, 75])
+    iqr = q3 - q1
+    return (samples < q1 - factor * iqr) | (samples > q3 + factor * iqr)
+
+
+def bootstrap_ci(samples, statistic=np.median, confidence=CONFIDENCE_LEVEL,
+                 resamples=BOOTSTRAP_RESAMPLES, seed=BOOTSTRAP_SEED):
+    """
+    Intervallo di confidenza bootstrap (metodo dei percentili) della statistica indicata.
+    I ricampionamenti sono estratti tutti insieme come matrice di indici.
+    Ritorna (limite inferiore, limite superiore), oppure (None, None) se i campioni sono vuoti.
+    """
+    samples = np.asarray(samples, dtype=float)
+    if len(samples) == 0:
+        return None, None
+
+    rng = np.random.default_rng(seed)
+    indexes = rng.integers(0, len(samples), size=(resamples, len(samples)))
+    estimates = statistic(samples[indexes], axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(estimates, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+def summarize_samples(samples):
+    """
+    Statistiche di una serie di misure ripetute, esclusi i valori anomali: numero di campioni,
+    anomalie scartate, media, mediana, deviazione standard, coefficiente di variazione e
+    intervallo di confidenza bootstrap della mediana (anche come semi-ampiezza relativa).
+    """
+    samples = np.asarray(samples, dtype=float)
+    kept = samples[~outlier_mask(samples)]
+    median = float(np.median(kept)) if len(kept) else None
+    ci_low, ci_high = bootstrap_ci(kept) if len(kept) > 1 else (None, None)
+    std = float(np.std(kept, ddof=1)) if len(kept) > 1 else None
+
+    return {
+        'samples': len(samples),
+        'outliers': int(len(samples) - len(kept)),
+        'mean': float(np.mean(kept)) if len(kept) else None,
+        'median': median,
+        'std': std,
+        'cv': std / abs(float(np.mean(kept))) if std is not None and np.mean(kept) else None,
+        'ci_low': ci_low,
+        'ci_high': ci_high,
+        'ci_relative_width': (ci_high - ci_low) / 2 / abs(median) if ci_low is not None and median else None,
+    }
+
+
+def is_stable(samples, target=TARGET_CI_RELATIVE_WIDTH):
+    """
+    True se l'intervallo di confidenza della mediana è abbastanza stretto.
+    """
+    width = summarize_samples(samples)['ci_relative_width']
+    return width is not None and width <= target
+
+
+def repeats_complete(sample_series, repeats_done, min_repeats, max_repeats, target=TARGET_CI_RELATIVE_WIDTH):
+    """
+    Decide se fermare le ripetizioni: mai prima di min_repeats, sempre a max_repeats,
+    altrimenti quando tutte le serie di campioni sono stabili (vedi is_stable).
+    """
+    if repeats_done >= max_repeats:
+        return True
+    if repeats_done < min_repeats:
+        return False
+    return all(is_stable(samples, target) for samples in sample_series)
+
+
+def run_repeated(measure, warmup, min_repeats, max_repeats, target=TARGET_CI_RELATIVE_WIDTH):
+    """
+    Esegue `warmup` volte measure() scartandone il risultato, poi la ripete finché
+    repeats_complete lo consente. measure() ritorna la misura (es. una durata) oppure None
+    se l'esecuzione è fallita: i fallimenti contano come ripetizioni ma non come campioni.
+    Ritorna (lista dei campioni, statistiche di summarize_samples).
+    """
+    for _ in range(warmup):
+        measure()
+
+    samples = []
+    repeats = 0
+    while not repeats_complete([samples], repeats, min_repeats, max_repeats, target):
+        value = measure()
+        repeats += 1
+        if value is not None:
+            samples.append(value)
+
+    summary = summarize_samples(samples)
+    summary['converged'] = is_stable(samples, target)
+    print(f" {summary['samples']} campioni ({summary['outliers']} anomali), mediana {summary['median']}, "
+          f"IC {CONFIDENCE_LEVEL:.0%} [{summary['ci_low']}, {summary['ci_high']}]")
+    return samples, summary
+
+
+"""  CONFRONTO CON LA BASELINE  """
+
+def key_value(value):
+    """
+    Valore normalizzato di una colonna chiave, così che la stessa serie coincida tra due
+    esecuzioni anche se i tipi letti da SQLite differiscono (None/NaN, 1000 / 1000.0).
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return '-'
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def compare_samples(baseline, candidate, higher_is_better, threshold=SLOWDOWN_THRESHOLD,
+                    confidence=CONFIDENCE_LEVEL, resamples=BOOTSTRAP_RESAMPLES, seed=BOOTSTRAP_SEED):
+    """
+    Confronta due serie di campioni (valori anomali esclusi) tramite l'intervallo bootstrap
+    della variazione relativa delle mediane (candidate / baseline - 1), ricampionando le due
+    serie in modo indipendente. Lo stato è 'slower' o 'faster' se l'intervallo è tutto da un
+    lato e la variazione mediana supera la soglia, altrimenti 'unchanged'.
+    Con mediana della baseline nulla (anche in un solo ricampionamento, es. un'esecuzione fallita
+    salvata con throughput 0) la variazione relativa non è definita: lo stato è 'inconclusive'.
+    """
+    baseline = np.asarray(baseline, dtype=float)
+    candidate = np.asarray(candidate, dtype=float)
+    baseline = baseline[~outlier_mask(baseline)]
+    candidate = candidate[~outlier_mask(candidate)]
+
+    rng = np.random.default_rng(seed)
+    baseline_medians = np.median(baseline[rng.integers(0, len(baseline), size=(resamples, len(baseline)))], axis=1)
+    candidate_medians = np.median(candidate[rng.integers(0, len(candidate), size=(resamples, len(candidate)))], axis=1)
+
+    comparison = {
+        'baseline_samples': len(baseline),
+        'candidate_samples': len(candidate),
+        'baseline_median': float(np.median(baseline)),
+        'candidate_median': float(np.median(candidate)),
+    }
+    if np.any(baseline_medians == 0) or comparison['baseline_median'] == 0:
+        return {**comparison, 'change': None, 'change_ci_low': None, 'change_ci_high': None,
+                'status': 'inconclusive'}
+
+    changes = candidate_medians / baseline_medians - 1
+
+    alpha = (1 - confidence) / 2
+    change_low, change_high = np.quantile(changes, [alpha, 1 - alpha])
+    change = float(np.median(candidate) / np.median(baseline) - 1)
+
+    # Per le metriche "più alto è meglio" (throughput) il lato peggiore è quello negativo
+    worse_low, worse_high = (-change_high, -change_low) if higher_is_better else (change_low, change_high)
+    worse_change = -change if higher_is_better else change
+
+    status = 'unchanged'
+    if worse_low > 0 and worse_change >= threshold:
+        status = 'slower'
+    elif worse_high < 0 and -worse_change >= threshold:
+        status = 'faster'
+
+    return {
+        **comparison,
+        'change': change,
+        'change_ci_low': float(change_low),
+        'change_ci_high': float(change_high),
+        'status': status,
+    }
+
+
+def compare_runs(table, baseline_run_id, candidate_run_id, threshold=SLOWDOWN_THRESHOLD):
+    """
+    Confronta serie per serie (vedi COMPARISON_METRICS) due esecuzioni della stessa tabella
+    dei risultati. Le serie presenti in una sola esecuzione hanno stato 'missing', quelle con
+    mediana della baseline nulla 'inconclusive' (vedi compare_samples).
+    Ritorna il DataFrame del confronto, una riga per serie.
+    """
+    spec = COMPARISON_METRICS[table]
+    store = get_results_store()
+    baseline_df = store.read(table, baseline_run_id)
+    candidate_df = store.read(table, candidate_run_id)
+
+    keys = [key for key in spec['keys'] if key in baseline_df.columns or key in candidate_df.columns]
+
+    def series(df):
+        if df.empty:
+            return {}
+        # Le righe dei singoli worker dei test paralleli non sono serie a sé: si usa la riga aggregata
+        if 'scope' in df.columns:
+            df = df[df['scope'] != 'worker']
+        labels = pd.DataFrame({
+            key: df[key].map(key_value) if key in df.columns else '-' for key in keys
+        }, index=df.index)
+        return {
+            key if isinstance(key, tuple) else (key,): df.loc[group.index, spec['metric']].dropna().to_numpy(dtype=float)
+            for key, group in labels.groupby(keys)
+        }
+
+    baseline_series, candidate_series = series(baseline_df), series(candidate_df)
+
+    rows = []
+    for key in sorted(set(baseline_series) | set(candidate_series), key=str):
+        row = dict(zip(keys, key))
+        baseline, candidate = baseline_series.get(key), candidate_series.get(key)
+        if baseline is None or candidate is None or not len(baseline) or not len(candidate):
+            row['status'] = 'missing'
+        else:
+            row.update(compare_samples(baseline, candidate, spec['higher_is_better'], threshold))
+        rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def print_comparison(comparison, table, baseline_run_id, candidate_run_id):
+    """
+    Stampa il confronto evidenziando i rallentamenti significativi.
+    """
+    metric = COMPARISON_METRICS[table]['metric']
+    print(f"\n Confronto '{table}' ({metric}): {candidate_run_id} rispetto alla baseline {baseline_run_id}")
+    for row in comparison.to_dict('records'):
+        label = ", ".join(f"{key}={value}" for key, value in row.items()
+                          if key in COMPARISON_METRICS[table]['keys'] and value != '-')
+        if row['status'] == 'missing':
+            print(f"  [MANCANTE]  {label}")
+            continue
+        if row['status'] == 'inconclusive':
+            print(f"  [NON CONCLUSIVO] {label}: mediana della baseline nulla "
+                  f"(n={row['baseline_samples']}/{row['candidate_samples']})")
+            continue
+        marker = {'slower': '[PEGGIORE]', 'faster': '[MIGLIORE]', 'unchanged': '[INVARIATO]'}[row['status']]
+        print(f"  {marker} {label}: {row['change']:+.1%} "
+              f"(IC {CONFIDENCE_LEVEL:.0%} {row['change_ci_low']:+.1%} .. {row['change_ci_high']:+.1%}, "
+              f"n={row['baseline_samples']}/{row['candidate_samples']})")
+
+
+"""  RIGA DI COMANDO  """
+
+def main(argv=None):
+    """
+    python repeat_runner.py baseline --table performance [--run RUN_ID]
+        registra l'esecuzione indicata (di default l'ultima) come baseline della tabella
+    python repeat_runner.py compare --table performance [--baseline RUN_ID] [--run RUN_ID]
+        confronta un'esecuzione (di default l'ultima) con la baseline; termina con codice 1
+        se ci sono rallentamenti statisticamente significativi
+    """
+    parser = argparse.ArgumentParser(description="Baseline e confronto statistico dei risultati dei benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("baseline", "compare"):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument("--table", choices=sorted(COMPARISON_METRICS), default="performance")
+        subparser.add_argument("--run", help="run_id dell'esecuzione (di default l'ultima della tabella)")
+        if command == "compare":
+            subparser.add_argument("--baseline", help="run_id della baseline (di default quella registrata)")
+            subparser.add_argument("--threshold", type=float, default=SLOWDOWN_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    store = get_results_store()
+    run_id = args.run or store.latest_run_id(args.table)
+    if run_id is None:
+        print(f" Nessuna esecuzione trovata nella tabella '{args.table}'.")
+        return 2
+
+    if args.command == "baseline":
+        store.set_baseline(args.table, run_id)
+        print(f" Esecuzione {run_id} registrata come baseline di '{args.table}'.")
+        return 0
+
+    baseline_run_id = args.baseline or store.get_baseline(args.table)
+    if baseline_run_id is None:
+        print(f" Nessuna baseline registrata per '{args.table}': usa prima il comando 'baseline'.")
+        return 2
+
+    comparison = compare_runs(args.table, baseline_run_id, run_id, args.threshold)
+    print_comparison(comparison, args.table, baseline_run_id, run_id)
+
+    slower = int((comparison['status'] == 'slower').sum()) if not comparison.empty else 0
+    if slower:
+        print(f"\n {slower} serie con rallentamento statisticamente significativo.")
+        return 1
+    print("\n Nessun rallentamento statisticamente significativo.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import gc
+import os
+import threading
+import time
+import numpy as np
+from results_store import get_results_store
+
+
+# Intervallo di campionamento delle risorse del client (secondi)
+RESOURCE_SAMPLE_INTERVAL_SECONDS = 0.1
+
+# Thread con la CPU più alta riportati nei risultati e nei grafici
+TOP_THREADS = 5
+
+try:
+    CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = PAGE_SIZE = None
+
+
+def current_rss_mb():
+    """
+    RSS attuale del processo in MB (solo Linux, da /proc/self/statm), oppure None.
+    A differenza di pipeline.peak_rss_mb ritorna il valore istantaneo, non il picco.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / (1024 * 1024)
+    except (OSError, TypeError, ValueError, IndexError):
+        return None
+
+
+def thread_cpu_seconds():
+    """
+    Tempo di CPU (utente + sistema) di ogni thread del processo, da /proc/self/task (solo Linux).
+    Ritorna il dizionario id nativo del thread --> (nome, secondi); vuoto se non disponibile.
+    I nomi dei thread Python (threading.Thread.name) hanno la precedenza su quelli del kernel.
+    """
+    names = {thread.native_id: thread.name for thread in threading.enumerate()}
+    threads = {}
+    try:
+        task_ids = os.listdir("/proc/self/task")
+    except OSError:
+        return threads
+
+    for task_id in task_ids:
+        try:
+            with open(f"/proc/self/task/{task_id}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue  # thread terminato nel frattempo
+        comm, fields = stat[stat.index("(") + 1:stat.rindex(")")], stat[stat.rindex(")") + 2:].split()
+        # fields parte dal campo 3 (state): utime e stime sono i campi 14 e 15
+        cpu_ticks = int(fields[11]) + int(fields[12])
+        threads[int(task_id)] = (names.get(int(task_id), comm), cpu_ticks / CLOCK_TICKS)
+    return threads
+
+
+class ResourceSampler:
+    """
+    Campionatore in background delle risorse del client durante un test: ogni `interval`
+    secondi registra la CPU del processo (in % di un core, quindi oltre 100 con più thread
+    attivi), l'RSS e la CPU di ogni thread. Le pause del garbage collector sono registrate
+    tramite gc.callbacks, con generazione, durata e oggetti raccolti.
+
+    Da usare come context manager attorno al test; summary() riassume le misure per i
+    risultati e series() ritorna le serie temporali complete (serializzabili).
+    """
+
+    def __init__(self, interval=RESOURCE_SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples = []         # dizionari t_seconds, cpu_percent, rss_mb
+        self.thread_samples = []  # dizionari t_seconds, thread, cpu_percent, cpu_seconds, interval_seconds
+        self.gc_pauses = []       # dizionari t_seconds, generation, pause_ms, collected
+        self._stop = threading.Event()
+        self._thread = None
+        self._gc_start = None
+        self._start_time = None
+        self._start_rss = None
+        self._previous = None     # (perf_counter, CPU del processo, CPU per thread) dell'ultimo campione
+        self._sampler_id = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            now = time.perf_counter()
+            self.gc_pauses.append({
+                't_seconds': self._gc_start - self._start_time,
+                'generation': info.get("generation"),
+                'pause_ms': (now - self._gc_start) * 1000,
+                'collected': info.get("collected"),
+            })
+            self._gc_start = None
+
+    def _take_sample(self):
+        now, cpu = time.perf_counter(), time.process_time()
+        previous_time, previous_cpu, previous_threads = self._previous
+        elapsed = now - previous_time
+        if elapsed <= 0:
+            return
+        t_seconds = now - self._start_time
+        self.samples.append({
+            't_seconds': t_seconds,
+            'cpu_percent': (cpu - previous_cpu) / elapsed * 100,
+            'rss_mb': current_rss_mb(),
+        })
+
+        threads = thread_cpu_seconds()
+        for thread_id, (name, cpu_seconds) in threads.items():
+            if thread_id == self._sampler_id:
+                continue
+            thread_cpu = cpu_seconds - previous_threads.get(thread_id, (name, 0.0))[1]
+            self.thread_samples.append({
+                't_seconds': t_seconds,
+                'thread': name,
+                'cpu_percent': thread_cpu / elapsed * 100,
+                'cpu_seconds': thread_cpu,
+                'interval_seconds': elapsed,
+            })
+
+        self._previous = (now, cpu, threads)
+
+    def _sample(self):
+        self._sampler_id = threading.get_native_id()
+        while not self._stop.wait(self.interval):
+            self._take_sample()
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        self._start_rss = current_rss_mb()
+        self._previous = (self._start_time, time.process_time(), thread_cpu_seconds())
+        gc.callbacks.append(self._on_gc)
+        self._thread = threading.Thread(target=self._sample, name="resource-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        # Ultimo campione fino alla fine del test (anche se più breve di un intervallo)
+        self._take_sample()
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+
+    def summary(self, prefix='client'):
+        """
+        Ritorna le metriche riassuntive con chiavi '<prefix>_...': CPU media e massima del
+        processo, RSS iniziale, massimo e crescita, numero e durata delle pause del GC,
+        e la CPU media dei thread più carichi (il primo è il candidato collo di bottiglia:
+        vicino al 100% significa che il test è limitato dal client, non dal server).
+        """
+        cpu = np.array([s['cpu_percent'] for s in self.samples])
+        intervals = np.diff([0.0] + [s['t_seconds'] for s in self.samples])
+        rss = np.array([s['rss_mb'] for s in self.samples if s['rss_mb'] is not None])
+        pauses = np.array([p['pause_ms'] for p in self.gc_pauses])
+
+        summary = {
+            f'{prefix}_cpu_mean_percent': float(np.average(cpu, weights=intervals)) if len(cpu) else None,
+            f'{prefix}_cpu_max_percent': float(cpu.max()) if len(cpu) else None,
+            f'{prefix}_rss_start_mb': self._start_rss,
+            f'{prefix}_rss_max_mb': float(rss.max()) if len(rss) else None,
+            f'{prefix}_rss_growth_mb': float(rss[-1] - self._start_rss) if len(rss) and self._start_rss else None,
+            f'{prefix}_gc_collections': len(pauses),
+            f'{prefix}_gc_pause_total_ms': float(pauses.sum()) if len(pauses) else 0.0,
+            f'{prefix}_gc_pause_max_ms': float(pauses.max()) if len(pauses) else None,
+        }
+        for rank, (thread, cpu_percent) in enumerate(self.top_threads(), start=1):
+            summary[f'{prefix}_thread{rank}_name'] = thread
+            summary[f'{prefix}_thread{rank}_cpu_percent'] = cpu_percent
+        return summary
+
+    def top_threads(self, count=TOP_THREADS):
+        """
+        Ritorna i `count` thread con la CPU media più alta, come lista di (nome, CPU media %).
+        La media è pesata sulla durata degli intervalli: la CPU per thread di /proc ha la
+        risoluzione dei tick del kernel, quindi sul singolo intervallo breve è approssimata.
+        """
+        cpu_seconds, interval_seconds = {}, {}
+        for sample in self.thread_samples:
+            thread = sample['thread']
+            cpu_seconds[thread] = cpu_seconds.get(thread, 0.0) + sample['cpu_seconds']
+            interval_seconds[thread] = interval_seconds.get(thread, 0.0) + sample['interval_seconds']
+        means = sorted(((thread, cpu_seconds[thread] / interval_seconds[thread] * 100) for thread in cpu_seconds),
+                       key=lambda item: item[1], reverse=True)
+        return means[:count]
+
+    def series(self):
+        """
+        Serie temporali complete (liste di dizionari, serializzabili anche tra processi).
+        Per i thread vengono mantenuti solo i più carichi (vedi TOP_THREADS).
+        """
+        top = {thread for thread, _ in self.top_threads()}
+        return {
+            'resource_samples': list(self.samples),
+            'resource_thread_samples': [s for s in self.thread_samples if s['thread'] in top],
+            'gc_pauses': list(self.gc_pauses),
+        }
+
+
+def save_resource_series(series, labels):
+    """
+    Salva le serie temporali di ResourceSampler.series() nelle tabelle omonime dell'archivio
+    dei risultati, aggiungendo a ogni riga le colonne di `labels` (es. database e modalità).
+    """
+    results_store = get_results_store()
+    for table, rows in series.items():
+        for row in rows:
+            results_store.add(table, {**labels, **row})
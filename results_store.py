@@ -0,0 +1,266 @@
+import atexit
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import threading
+import uuid
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+
+# Database SQLite che raccoglie i risultati di tutti i benchmark.
+# Ogni esecuzione (run) ha un run_id, la configurazione completa, la revisione git e l'host;
+# ogni tabella di risultati (performance, queries, query_load, ...) ha la colonna run_id.
+RESULTS_DB = "benchmark_results.sqlite"
+
+# Numero di righe tenute in memoria prima di scriverle in blocco
+FLUSH_EVERY_ROWS = 10_000
+
+
+def git_revision():
+    """
+    Ritorna la revisione git corrente (con suffisso '-dirty' se ci sono modifiche) oppure None.
+    """
+    try:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        revision = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=directory, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=directory,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        return f"{revision}-dirty" if status else revision
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def module_config(module_globals):
+    """
+    Estrae la configurazione di un modulo: le costanti in maiuscolo serializzabili in JSON
+    (es. module_config(globals()) da main.py).
+    """
+    config = {}
+    for name, value in module_globals.items():
+        if not name.isupper() or name.startswith("_"):
+            continue
+        try:
+            json.dumps(value)
+        except TypeError:
+            continue
+        config[name] = value
+    return config
+
+
+def to_sql_value(value):
+    """
+    Converte un valore in un tipo supportato da SQLite (scalari NumPy, bool, oggetti generici).
+    """
+    if value is None or isinstance(value, (str, bytes)):
+        return value
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    return str(value)
+
+
+class ResultsStore:
+    """
+    Archivio dei risultati su SQLite con scrittura bufferizzata.
+
+    add() accoda le righe in memoria per tabella; flush() le scrive in blocco
+    (executemany in un'unica transazione), aggiungendo le colonne che non esistono
+    ancora. Il buffer viene svuotato automaticamente ogni FLUSH_EVERY_ROWS righe
+    e all'uscita del programma. Le scritture sono protette da un lock, così più
+    thread possono registrare campioni sullo stesso archivio.
+    """
+
+    def __init__(self, path=RESULTS_DB, flush_every=FLUSH_EVERY_ROWS):
+        self.path = path
+        self.flush_every = flush_every
+        self.run_id = None
+        self._buffers = {}
+        self._buffered_rows = 0
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs ("
+                "run_id TEXT PRIMARY KEY, started_at TEXT, name TEXT, git_revision TEXT, "
+                "host TEXT, platform TEXT, python TEXT, cpu_count INTEGER, config TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS baselines (name TEXT PRIMARY KEY, run_id TEXT, created_at TEXT)"
+            )
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def begin_run(self, name, config=None):
+        """
+        Inizia una nuova esecuzione e ne registra i metadati. Ritorna il run_id,
+        che viene aggiunto a tutte le righe salvate da qui in poi.
+        """
+        self.flush()
+        self.run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.run_id, datetime.now(timezone.utc).isoformat(), name, git_revision(),
+                 socket.gethostname(), platform.platform(), platform.python_version(),
+                 os.cpu_count(), json.dumps(config or {}, sort_keys=True, default=str))
+            )
+        conn.close()
+        print(f" Esecuzione '{name}' registrata con run_id {self.run_id}.")
+        return self.run_id
+
+    def add(self, table, row):
+        """
+        Accoda una riga (dizionario colonna --> valore) per la tabella indicata.
+        """
+        if self.run_id is None:
+            self.begin_run(table)
+
+        with self._lock:
+            self._buffers.setdefault(table, []).append({'run_id': self.run_id, **row})
+            self._buffered_rows += 1
+            should_flush = self._buffered_rows >= self.flush_every
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """
+        Scrive in blocco tutte le righe accodate.
+        """
+        with self._lock:
+            buffers, self._buffers, self._buffered_rows = self._buffers, {}, 0
+
+        if not buffers:
+            return
+
+        with self._connect() as conn:
+            for table, rows in buffers.items():
+                columns = list(dict.fromkeys(column for row in rows for column in row))
+                self._ensure_columns(conn, table, columns)
+
+                column_list = ", ".join(f'"{column}"' for column in columns)
+                placeholders = ", ".join("?" * len(columns))
+                conn.executemany(
+                    f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders})',
+                    ([to_sql_value(row.get(column)) for column in columns] for row in rows)
+                )
+        conn.close()
+
+    def _ensure_columns(self, conn, table, columns):
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (run_id TEXT)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_run_id" ON "{table}" (run_id)')
+        existing = {info[1] for info in conn.execute(f'PRAGMA table_info("{table}")')}
+        for column in columns:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}"')
+
+    def latest_run_id(self, table):
+        """
+        Ritorna il run_id dell'ultima esecuzione che ha scritto nella tabella, oppure None.
+        """
+        self.flush()
+        conn = self._connect()
+        try:
+            row = conn.execute(f'SELECT run_id FROM "{table}" ORDER BY rowid DESC LIMIT 1').fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def read(self, table, run_id=None, columns=None):
+        """
+        Legge i risultati di una tabella come DataFrame.
+        Con run_id=None vengono lette le righe dell'ultima esecuzione che ha scritto nella
+        tabella, con run_id="all" tutte le esecuzioni. Con columns si leggono solo le colonne
+        indicate tra quelle esistenti (utile con molti campioni). Ritorna un DataFrame vuoto
+        se non ci sono risultati.
+        """
+        if run_id is None:
+            run_id = self.latest_run_id(table)
+            if run_id is None:
+                return pd.DataFrame()
+        else:
+            self.flush()
+
+        conn = self._connect()
+        try:
+            if columns:
+                # Le colonne non ancora presenti (metriche aggiunte in seguito) vengono ignorate
+                existing = {info[1] for info in conn.execute(f'PRAGMA table_info("{table}")')}
+                columns = [column for column in columns if column in existing]
+            column_list = ", ".join(f'"{column}"' for column in columns) if columns else "*"
+            query = f'SELECT {column_list} FROM "{table}"'
+            params = ()
+            if run_id != "all":
+                query += " WHERE run_id = ?"
+                params = (run_id,)
+
+            return pd.read_sql_query(query, conn, params=params)
+        except (sqlite3.OperationalError, pd.errors.DatabaseError):
+            return pd.DataFrame()
+        finally:
+            conn.close()
+
+    def set_baseline(self, name, run_id):
+        """
+        Registra `run_id` come esecuzione di riferimento con il nome indicato
+        (es. la tabella dei risultati), sostituendo quella precedente.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO baselines VALUES (?, ?, ?)",
+                (name, run_id, datetime.now(timezone.utc).isoformat())
+            )
+        conn.close()
+
+    def get_baseline(self, name):
+        """
+        Ritorna il run_id dell'esecuzione di riferimento con il nome indicato, oppure None.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT run_id FROM baselines WHERE name = ?", (name,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def read_runs(self):
+        """
+        Ritorna il DataFrame delle esecuzioni registrate (metadati e configurazione).
+        """
+        conn = self._connect()
+        try:
+            return pd.read_sql_query("SELECT * FROM runs ORDER BY started_at", conn)
+        finally:
+            conn.close()
+
+
+_results_store = None
+
+
+def get_results_store():
+    """
+    Ritorna l'archivio dei risultati condiviso dal processo, creandolo al primo utilizzo.
+    Il buffer viene svuotato automaticamente all'uscita.
+    """
+    global _results_store
+    if _results_store is None:
+        _results_store = ResultsStore()
+        atexit.register(_results_store.flush)
+    return _results_store
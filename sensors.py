@@ -1,11 +1,21 @@
 import os
+import io
+import struct
+import threading
+import time
+from collections import deque
 from dotenv import load_dotenv
 import psycopg2
+import numpy as np
 from psycopg2 import extras
-from influxdb_client import InfluxDBClient, Point, WriteOptions
+from influxdb_client import InfluxDBClient, Point, WriteOptions, WritePrecision
 from influxdb_client.client.write_api import WriteType
 from influxdb_client.rest import ApiException as InfluxApiException
 from requests.exceptions import ConnectionError as RequestsConnectionError
+from device import is_columnar_batch, batch_length, records_to_columnar_batch
+from latency import LatencyHistogram
+from line_protocol import batch_to_line_protocol, MEASUREMENT
+from profiling import timed
 
 # Carica variabili d'ambiente dal file .env
 load_dotenv()
@@ -23,16 +33,144 @@ DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
 
+# Modalità di inserimento disponibili per TimescaleDB:
+# - execute_values: INSERT ... VALUES multi-riga generato da psycopg2
+# - copy_text: COPY sensors FROM STDIN in formato testo (tab-separated)
+# - copy_binary: COPY sensors FROM STDIN in formato binario di PostgreSQL
+TIMESCALE_INGEST_MODES = ("execute_values", "copy_text", "copy_binary")
+
+# Modalità di scrittura disponibili per InfluxDB:
+# - batching: i punti vengono solo accodati, il flush avviene in background
+# - acknowledged: batching con callback di conferma, si attende il flush completo
+# - synchronous: ogni write attende la risposta del server
+INFLUX_WRITE_MODES = ("batching", "acknowledged", "synchronous")
+
+# Tempo massimo (ms) che i punti restano nel buffer della write API prima del flush
+# (modalità batching e acknowledged); vedi tuning_sweep.py per la scelta del valore
+INFLUX_FLUSH_INTERVAL_MS = 1000
+
+# Batch dello stream raggruppati dal buffer della write API in una sola richiesta (modalità batching
+# e acknowledged), indipendente dalla dimensione dei batch: il buffer viene svuotato quando contiene
+# INFLUX_BUFFER_BATCHES batch oppure dopo flush_interval ms. Con 1 ogni batch viene inviato appena
+# accodato e flush_interval non ha effetto (conta solo se i batch arrivano più lentamente).
+INFLUX_BUFFER_BATCHES = 1
+
+# Serializzazione dei batch per InfluxDB:
+# - line_protocol: l'intero batch diventa un unico payload line protocol (line_protocol.py)
+# - point: un oggetto influxdb_client.Point per record
+INFLUX_SERIALIZERS = ("line_protocol", "point")
+
+
+"""  CONFERMA DELLE SCRITTURE INFLUX  """
+
+class InfluxWriteTracker:
+    """
+    Conta i punti inviati a InfluxDB e quelli confermati (o rifiutati) dal server.
+    I metodi success/error/retry hanno la firma delle callback di write_api.
+
+    Misura anche la latenza di conferma di ogni batch (dall'invio alla conferma dell'ultimo
+    suo punto) nell'istogramma ack_latency: le scritture in background vengono confermate
+    nell'ordine di invio, quindi i punti confermati vengono scalati dai batch più vecchi.
+    """
+
+    def __init__(self, synchronous=False):
+        self.synchronous = synchronous
+        self.submitted = 0
+        self.acknowledged = 0
+        self.failed = 0
+        self.last_ack_time = None  # perf_counter dell'ultima conferma ricevuta
+        self.ack_latency = LatencyHistogram()
+        self._pending = deque()  # [perf_counter dell'invio, punti non ancora confermati] per batch
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def count_points(data):
+        """
+        Numero di punti contenuti in un payload line protocol (una riga per punto).
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        data = data.strip()
+        return data.count(b"\n") + 1 if data else 0
+
+    def submit(self, num_points):
+        with self._condition:
+            self.submitted += num_points
+            if num_points:
+                self._pending.append([time.perf_counter(), num_points])
+
+    def _complete(self, num_points, now=None):
+        """
+        Scala `num_points` dai batch in attesa più vecchi; se `now` è indicato registra
+        la latenza di conferma di ogni batch completato. Da chiamare con il lock acquisito.
+        """
+        while num_points > 0 and self._pending:
+            pending = self._pending[0]
+            completed = min(num_points, pending[1])
+            pending[1] -= completed
+            num_points -= completed
+            if pending[1] == 0:
+                self._pending.popleft()
+                if now is not None:
+                    self.ack_latency.record(now - pending[0])
+
+    def acknowledge(self, num_points):
+        with self._condition:
+            self.acknowledged += num_points
+            self.last_ack_time = time.perf_counter()
+            self._complete(num_points, self.last_ack_time)
+            self._condition.notify_all()
+
+    def fail(self, num_points):
+        with self._condition:
+            self.failed += num_points
+            self._complete(num_points)
+            self._condition.notify_all()
+
+    def success(self, conf, data):
+        self.acknowledge(self.count_points(data))
+
+    def error(self, conf, data, exception):
+        print(f"Errore InfluxDB durante il flush di un batch: {exception}")
+        self.fail(self.count_points(data))
+
+    def retry(self, conf, data, exception):
+        print(f"InfluxDB: nuovo tentativo di scrittura dopo l'errore: {exception}")
+
+    def wait_until_complete(self, timeout=None):
+        """
+        Attende che ogni punto inviato sia stato confermato o rifiutato.
+        Ritorna True se è successo entro `timeout` secondi.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self.acknowledged + self.failed >= self.submitted,
+                timeout=timeout
+            )
+
 
 """  CONNESSIONI AI DATABASE  """
 
-def connect_to_influx(input_batch_size):
+def connect_to_influx(input_batch_size, write_mode="batching", tracker=None, serializer="line_protocol",
+                      flush_interval=INFLUX_FLUSH_INTERVAL_MS, buffer_batches=INFLUX_BUFFER_BATCHES):
     """
     Stabilisce la connessione a InfluxDB e ne verifica lo stato gestendone le eccezioni.
-    Ritorna il client InfluxDB e un oggetto WriteApi (che gestisce le scritture) configurato per il batching.
+    Ritorna il client InfluxDB e un oggetto WriteApi (che gestisce le scritture) configurato
+    secondo write_mode (vedi INFLUX_WRITE_MODES, di default il batching).
+    In modalità acknowledged le callback di conferma vengono registrate sul tracker
+    (InfluxWriteTracker) passato come argomento.
+    serializer deve coincidere con quello usato in send_batch_to_influxdb: con line_protocol
+    ogni elemento accodato è già un batch completo, con point un singolo punto. In entrambi i casi
+    il buffer raggruppa buffer_batches batch dello stream (vedi INFLUX_BUFFER_BATCHES) e
+    flush_interval (ms) è il tempo massimo di permanenza nel buffer (ignorati in synchronous).
     In caso di fallimento, stampa un messaggio di errore e ritorna (None, None).
     """
 
+    if write_mode not in INFLUX_WRITE_MODES:
+        raise ValueError(f"Modalità di scrittura InfluxDB sconosciuta: '{write_mode}'")
+    if serializer not in INFLUX_SERIALIZERS:
+        raise ValueError(f"Serializzazione InfluxDB sconosciuta: '{serializer}'")
+
 
     client = None
     write_api = None
@@ -41,23 +179,30 @@ def connect_to_influx(input_batch_size):
     try:
         print("Verificando lo stato di InfluxDB...")
         
-        # flush_interval: il tempo massimo (in ms) che i punti rimangono nel buffer prima di essere scritti
-        # batch_size: il numero massimo di punti da tenere nel buffer prima di scriverli
-        write_api = InfluxDBClient(
-            url=INFLUX_URL,
-            token=INFLUX_TOKEN,
-            org=INFLUX_ORG
-        ).write_api(WriteOptions(
-    write_type=WriteType.batching,
-    batch_size=input_batch_size,
-    flush_interval=1000
-))
-        
-        # Test della connessione 
         client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
 
+        # Test della connessione 
         client.ping()
 
+        if write_mode == "synchronous":
+            write_api = client.write_api(WriteOptions(write_type=WriteType.synchronous))
+        else:
+            callbacks = {}
+            if write_mode == "acknowledged" and tracker:
+                callbacks = {
+                    "success_callback": tracker.success,
+                    "error_callback": tracker.error,
+                    "retry_callback": tracker.retry
+                }
+
+            # flush_interval: il tempo massimo (in ms) che i punti rimangono nel buffer prima di essere scritti
+            # batch_size: il numero massimo di elementi (payload line protocol o Point) da tenere nel buffer
+            write_api = client.write_api(WriteOptions(
+                write_type=WriteType.batching,
+                batch_size=buffer_batches if serializer == "line_protocol" else buffer_batches * input_batch_size,
+                flush_interval=flush_interval
+            ), **callbacks)
+
         print("Connessione a InfluxDB riuscita.")
         
         return client, write_api
@@ -71,29 +216,79 @@ def connect_to_influx(input_batch_size):
         print(f" Errore durante la connessione a InfluxDB: {e}")
     return None, None
 
-def send_batch_to_influxdb(data_batch, write_api, bucket, org):
+def send_batch_to_influxdb(data_batch, write_api, bucket, org, tracker=None, serializer="line_protocol", timer=None):
     """
     Invia un singolo batch di dati a InfluxDB e ne cattura le eccezioni.
+    Il batch può essere una lista di dizionari (Device.generate_data)
+    oppure un batch colonnare (generate_columnar_batch).
+    Con serializer="line_protocol" il batch viene serializzato in un unico payload di bytes
+    passato direttamente alla write API; con "point" si costruisce un Point per record.
+    Se viene passato un tracker (InfluxWriteTracker) i punti vengono contati come inviati;
+    in modalità sincrona vengono anche contati come confermati, e in ogni modalità
+    come rifiutati se la write solleva un'eccezione.
+    Con un timer (profiling.PhaseTimer) la serializzazione e la write sono misurate come
+    fasi serialize e send; in batching e acknowledged la write si limita ad accodare.
     """
 
-    data_points = []
+    with timed(timer, "serialize"):
+        if serializer == "line_protocol":
+            num_points = batch_length(data_batch)
+            record = batch_to_line_protocol(data_batch)
+        else:
+            record = build_influx_points(data_batch)
+            num_points = len(record)
+
+    if tracker:
+        tracker.submit(num_points)
 
-    for data in data_batch:
-        data_point = Point("sensor_data") \
-            .tag("device", data["device"]) \
-            .field("temperature", data["temperature"]) \
-            .field("humidity", data["humidity"]) \
-            .time(data["timestamp"])
-        data_points.append(data_point)
-    
     try:
         
-        write_api.write(bucket=bucket, org=org, record=data_points)
+        with timed(timer, "send"):
+            write_api.write(bucket=bucket, org=org, record=record, write_precision=WritePrecision.NS)
+
+        if tracker and tracker.synchronous:
+            tracker.acknowledge(num_points)
 
     except InfluxApiException as e:
         print(f"Errore InfluxDB  durante l'invio batch dati: {e}")
+        if tracker:
+            tracker.fail(num_points)
     except Exception as e:
         print(f"Errore InfluxDB durante l'invio batch dati: {e}")
+        if tracker:
+            tracker.fail(num_points)
+
+
+def build_influx_points(data_batch):
+    """
+    Costruisce un oggetto Point per ogni record del batch (serializzazione "point").
+    """
+
+    data_points = []
+
+    if is_columnar_batch(data_batch):
+        for timestamp, device, temperature, humidity in zip(
+            data_batch["timestamp"].tolist(),
+            data_batch["device"].tolist(),
+            data_batch["temperature"].tolist(),
+            data_batch["humidity"].tolist()
+        ):
+            data_point = Point(MEASUREMENT) \
+                .tag("device", device) \
+                .field("temperature", temperature) \
+                .field("humidity", humidity) \
+                .time(timestamp, WritePrecision.NS)
+            data_points.append(data_point)
+    else:
+        for data in data_batch:
+            data_point = Point(MEASUREMENT) \
+                .tag("device", data["device"]) \
+                .field("temperature", data["temperature"]) \
+                .field("humidity", data["humidity"]) \
+                .time(data["timestamp"])
+            data_points.append(data_point)
+
+    return data_points
 
 
 def connect_to_timescale():
@@ -123,35 +318,167 @@ def connect_to_timescale():
 
 
 
-def send_batch_to_timescaledb(data_batch, conn, input_batch_size): 
+def timestamps_to_iso(timestamps_ns):
+    """
+    Converte un array di timestamp in nanosecondi (UTC) in stringhe ISO 8601
+    che PostgreSQL interpreta correttamente come timestamptz.
+    """
+    return np.datetime_as_string(timestamps_ns.astype("datetime64[ns]"), unit="us", timezone="UTC")
+
+
+def columnar_batch_to_rows(data_batch):
+    """
+    Converte un batch colonnare in una lista di tuple (time, device, temperature, humidity).
+    """
+    return list(zip(
+        timestamps_to_iso(data_batch["timestamp"]).tolist(),
+        data_batch["device"].tolist(),
+        data_batch["temperature"].tolist(),
+        data_batch["humidity"].tolist()
+    ))
+
+
+"""  COPY FROM STDIN  """
+
+COPY_SENSORS_TEXT = "COPY sensors (time, device, temperature, humidity) FROM STDIN"
+COPY_SENSORS_BINARY = "COPY sensors (time, device, temperature, humidity) FROM STDIN WITH (FORMAT binary)"
+
+# Intestazione e terminatore del formato binario di COPY (firma, flags, lunghezza estensione)
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+
+# Epoch di PostgreSQL (2000-01-01 UTC) in microsecondi dall'epoch Unix
+POSTGRES_EPOCH_US = 946_684_800_000_000
+
+# Parti a lunghezza fissa di ogni tupla binaria: numero di campi + time, e i due float8.
+# Il campo device (testo a lunghezza variabile) viene inserito tra le due parti.
+PGCOPY_ROW_HEAD = np.dtype([("fields", ">i2"), ("time_len", ">i4"), ("time", ">i8")])
+PGCOPY_ROW_TAIL = np.dtype([("temp_len", ">i4"), ("temperature", ">f8"), ("hum_len", ">i4"), ("humidity", ">f8")])
+
+
+def escape_copy_text(value):
+    """
+    Esegue l'escape di un valore testuale per il formato testo di COPY.
+    """
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def columnar_batch_to_copy_text(data_batch):
+    """
+    Serializza un batch colonnare nel formato testo di COPY (una riga per record, campi separati da tab).
+    """
+    escaped_devices = {device: escape_copy_text(device) for device in np.unique(data_batch["device"]).tolist()}
+
+    buffer = io.StringIO()
+    for timestamp, device, temperature, humidity in zip(
+        timestamps_to_iso(data_batch["timestamp"]).tolist(),
+        data_batch["device"].tolist(),
+        data_batch["temperature"].tolist(),
+        data_batch["humidity"].tolist()
+    ):
+        buffer.write(f"{timestamp}\t{escaped_devices[device]}\t{temperature!r}\t{humidity!r}\n")
+
+    buffer.seek(0)
+    return buffer
+
+
+def columnar_batch_to_copy_binary(data_batch):
+    """
+    Serializza un batch colonnare nel formato binario di COPY.
+    Assume le colonne time TIMESTAMPTZ, device TEXT e temperature/humidity DOUBLE PRECISION.
+    Le parti numeriche vengono codificate in big-endian con NumPy in un'unica passata.
+    """
+    num_records = batch_length(data_batch)
+
+    head = np.empty(num_records, dtype=PGCOPY_ROW_HEAD)
+    head["fields"] = 4
+    head["time_len"] = 8
+    head["time"] = data_batch["timestamp"] // 1_000 - POSTGRES_EPOCH_US
+
+    tail = np.empty(num_records, dtype=PGCOPY_ROW_TAIL)
+    tail["temp_len"] = 8
+    tail["temperature"] = data_batch["temperature"]
+    tail["hum_len"] = 8
+    tail["humidity"] = data_batch["humidity"]
+
+    device_fields = {}
+    for device in np.unique(data_batch["device"]).tolist():
+        encoded = device.encode("utf-8")
+        device_fields[device] = struct.pack("!i", len(encoded)) + encoded
+
+    head_bytes, tail_bytes = head.tobytes(), tail.tobytes()
+    head_size, tail_size = PGCOPY_ROW_HEAD.itemsize, PGCOPY_ROW_TAIL.itemsize
+
+    parts = [PGCOPY_HEADER]
+    for i, device in enumerate(data_batch["device"].tolist()):
+        parts.append(head_bytes[i * head_size:(i + 1) * head_size])
+        parts.append(device_fields[device])
+        parts.append(tail_bytes[i * tail_size:(i + 1) * tail_size])
+    parts.append(PGCOPY_TRAILER)
+
+    return io.BytesIO(b"".join(parts))
+
+
+def send_batch_to_timescaledb(data_batch, conn, input_batch_size, ingest_mode="execute_values", page_size=None,
+                              timer=None): 
     """
     Invia un batch di dati a TimescaleDB.
+    Il batch può essere una lista di dizionari oppure un batch colonnare.
+    ingest_mode sceglie la modalità di inserimento (vedi TIMESCALE_INGEST_MODES).
+    page_size è il numero di righe per ogni INSERT di execute_values (di default
+    input_batch_size, cioè una sola istruzione per batch); non si applica a COPY.
+    Con un timer (profiling.PhaseTimer) vengono misurate le fasi serialize (tuple o buffer
+    COPY), send (execute_values, che include la formattazione SQL di psycopg2, o copy_expert)
+    e commit.
     """
 
 
-    if not data_batch:
+    if data_batch is None or batch_length(data_batch) == 0:
         return 
 
-    
-    values = [  (  d["timestamp"], d["device"], d["temperature"], d["humidity"]  ) for d in data_batch]
+    if ingest_mode not in TIMESCALE_INGEST_MODES:
+        raise ValueError(f"Modalità di inserimento TimescaleDB sconosciuta: '{ingest_mode}'")
 
     try:
         with conn.cursor() as cursor:
             
-
-            query = """
-                INSERT INTO sensors (time, device, temperature, humidity)
-                VALUES %s
-            """
-            
-            extras.execute_values(cursor, query, values, page_size=input_batch_size)
-             # execute_values: permette di inserire più righe contemporaneamente (in batch), migliorando l'efficienza
-             # Per questo c'è un solo place holder %s
-             # execute_values accetta una lista di tuple in input ed ogni tupla contiene tutti i valori da inserire (values). 
-
-
-
-            conn.commit() 
+            if ingest_mode == "execute_values":
+
+                with timed(timer, "serialize"):
+                    if is_columnar_batch(data_batch):
+                        values = columnar_batch_to_rows(data_batch)
+                    else:
+                        values = [  (  d["timestamp"], d["device"], d["temperature"], d["humidity"]  ) for d in data_batch]
+
+                query = """
+                    INSERT INTO sensors (time, device, temperature, humidity)
+                    VALUES %s
+                """
+                
+                with timed(timer, "send"):
+                    extras.execute_values(cursor, query, values, page_size=page_size or input_batch_size)
+                 # execute_values: permette di inserire più righe contemporaneamente (in batch), migliorando l'efficienza
+                 # Per questo c'è un solo place holder %s
+                 # execute_values accetta una lista di tuple in input ed ogni tupla contiene tutti i valori da inserire (values). 
+
+            else:
+                # COPY: i dati viaggiano come stream e non vengono formattati in una stringa SQL
+                with timed(timer, "serialize"):
+                    if not is_columnar_batch(data_batch):
+                        data_batch = records_to_columnar_batch(data_batch)
+
+                    if ingest_mode == "copy_text":
+                        copy_sql, copy_buffer = COPY_SENSORS_TEXT, columnar_batch_to_copy_text(data_batch)
+                    else:
+                        copy_sql, copy_buffer = COPY_SENSORS_BINARY, columnar_batch_to_copy_binary(data_batch)
+
+                with timed(timer, "send"):
+                    cursor.copy_expert(copy_sql, copy_buffer)
+
+
+
+            with timed(timer, "commit"):
+                conn.commit() 
 
 
         
@@ -0,0 +1,263 @@
+from datetime import datetime, timezone
+import numpy as np
+from device import datetime_to_ns
+from graphs_datapoints import analyze_and_plot_tuning
+from pipeline import workload_batches
+from results_store import get_results_store, module_config
+from sensors import INFLUX_FLUSH_INTERVAL_MS, INFLUX_BUFFER_BATCHES
+from ingest_runner import run_backend_test, scalar_metrics, NUM_DEVICES, SEED
+from null_sink import NULL_SINK_MODE
+
+
+# Parametri del tuning automatico
+
+# Record inseriti in ogni prova: abbastanza da misurare un throughput sostenuto
+# (dall'avvio all'ultima conferma), non solo il riempimento dei buffer
+TUNING_RECORDS = 200_000
+
+# Modalità provate per ogni backend. In acknowledged InfluxDB usa il buffer in background
+# e la latenza di ogni batch è misurata fino alla conferma.
+# Il page size si applica solo a execute_values: con COPY la seconda fase viene saltata.
+INFLUX_WRITE_MODE = "acknowledged"
+TIMESCALE_INGEST_MODE = "execute_values"
+
+# Budget di latenza: una configurazione è ammessa solo se il percentile indicato della latenza
+# per batch (di conferma per InfluxDB in acknowledged/synchronous) resta entro il budget
+LATENCY_BUDGET_MS = 250
+LATENCY_PERCENTILE = "p99"
+
+# Intervalli di ricerca (estremi inclusi)
+BATCH_SIZE_RANGE = (100, 100_000)
+FLUSH_INTERVAL_RANGE_MS = (10, 10_000)
+PAGE_SIZE_RANGE = (100, 100_000)  # limitato in ogni caso alla dimensione del batch scelta
+
+# Batch raggruppati dal buffer della write API InfluxDB (sensors.INFLUX_BUFFER_BATCHES).
+# Nella fase della dimensione del batch ogni batch è una richiesta: con un batch per richiesta il
+# flush interval non avrebbe effetto (ogni batch verrebbe inviato appena accodato). Nella fase del
+# flush interval il buffer è dimensionato sul carico (vedi flush_stage_buffer_batches) perché ogni
+# prova comprenda circa FLUSH_STAGE_FLUSHES svuotamenti, non una o due richieste alla chiusura.
+# La fase viene saltata se il carico non basta per almeno due batch per svuotamento e, con il
+# backend nullo, perché il buffer non è simulato.
+FLUSH_STAGE_FLUSHES = 20
+
+# Ricerca adattiva: una griglia logaritmica iniziale, poi a ogni raffinamento si prova la media
+# geometrica tra il valore migliore e i suoi vicini, finché i valori da provare non si esauriscono.
+# Non si provano valori a meno di MIN_RELATIVE_STEP (relativo) da quelli già provati:
+# differenze più piccole si confondono con il rumore della misura.
+INITIAL_GRID_POINTS = 5
+REFINE_ROUNDS = 3
+MIN_RELATIVE_STEP = 0.1
+
+
+"""  RICERCA ADATTIVA  """
+
+def log_grid(low, high, points):
+    """
+    Griglia di `points` valori interi distinti, spaziati in scala logaritmica tra low e high.
+    """
+    return sorted(set(np.geomspace(low, high, points).round().astype(int).tolist()))
+
+
+def trial_rank(trial):
+    """
+    Chiave di ordinamento delle prove: prima quelle entro il budget, ordinate per throughput;
+    se nessuna lo rispetta, la migliore è quella con la latenza più bassa.
+    """
+    if trial['within_budget']:
+        return (1, trial['throughput_records_per_second'])
+    latency = trial['budget_latency_ms']
+    return (0, -latency if latency is not None else -np.inf)
+
+
+def adaptive_search(evaluate, low, high, grid_points=INITIAL_GRID_POINTS, refine_rounds=REFINE_ROUNDS):
+    """
+    Cerca il valore intero in [low, high] che massimizza trial_rank(evaluate(valore)).
+    La funzione di risposta non è misurabile senza rumore e di solito ha un solo massimo
+    (throughput che sale con la dimensione, poi latenza fuori budget o saturazione):
+    dopo la griglia iniziale si restringe la ricerca intorno al migliore invece di
+    campionare tutto l'intervallo in modo fitto.
+    Ritorna (valore migliore, dizionario valore --> prova).
+    """
+    trials = {}
+    candidates = log_grid(low, high, grid_points)
+
+    for _ in range(refine_rounds + 1):
+        for value in candidates:
+            trials[value] = evaluate(value)
+
+        values = sorted(trials)
+        best_index = max(range(len(values)), key=lambda i: trial_rank(trials[values[i]]))
+        best_value = values[best_index]
+        neighbours = [values[i] for i in (best_index - 1, best_index + 1) if 0 <= i < len(values)]
+        candidates = {
+            int(round(np.sqrt(best_value * neighbour))) for neighbour in neighbours
+            if max(best_value, neighbour) / min(best_value, neighbour) >= (1 + MIN_RELATIVE_STEP) ** 2
+        } - set(trials)
+        if not candidates:
+            break
+
+    best_value = max(trials, key=lambda value: trial_rank(trials[value]))
+    return best_value, trials
+
+
+"""  PROVE  """
+
+def budget_latency_key(database_name, mode):
+    """
+    Colonna delle metriche confrontata con il budget di latenza.
+    """
+    if database_name == 'InfluxDB' and mode != "batching":
+        return f"ack_latency_{LATENCY_PERCENTILE}_ms"
+    return f"batch_latency_{LATENCY_PERCENTILE}_ms"
+
+
+def run_tuning_trial(database_name, mode, stage, batch_size, flush_interval=INFLUX_FLUSH_INTERVAL_MS,
+                     page_size=None, null_sink=None, buffer_batches=INFLUX_BUFFER_BATCHES):
+    """
+    Esegue una prova di inserimento di TUNING_RECORDS record con la configurazione indicata.
+    Tutte le prove usano lo stesso seed, quindi ricevono la stessa sequenza di dati.
+    Ritorna la riga della curva di risposta (con 'within_budget' e 'budget_latency_ms').
+    """
+    print(f"\n------ Tuning {database_name} ({mode}), fase {stage}: batch {batch_size}, "
+          f"flush {flush_interval} ms (buffer {buffer_batches} batch), page {page_size} ------")
+
+    start_ns = datetime_to_ns(datetime.now(timezone.utc))
+    batches = workload_batches(TUNING_RECORDS, batch_size, start_ns, SEED, NUM_DEVICES)
+    metrics = run_backend_test(
+        database_name, TUNING_RECORDS, batches, mode, null_sink=null_sink,
+        batch_size=batch_size, flush_interval=flush_interval, page_size=page_size,
+        buffer_batches=buffer_batches
+    ) or {}
+
+    succeeded = bool(metrics)
+
+    # Stessi nomi di colonna della tabella 'performance'
+    metrics = scalar_metrics(metrics)
+    duration = metrics.pop('duration', None)
+    throughput = metrics.pop('throughput', 0)
+    trial = {
+        'database': database_name,
+        'ingest_mode': mode,
+        'sink': null_sink,
+        'batch_size': batch_size,
+        'flush_interval_ms': flush_interval if database_name == 'InfluxDB' else None,
+        'page_size': (page_size or batch_size) if database_name == 'TimescaleDB' else None,
+        **metrics,
+        'stage': stage,
+        'num_records': TUNING_RECORDS,
+        'duration_seconds': duration,
+        'throughput_records_per_second': throughput,
+        'latency_budget_ms': LATENCY_BUDGET_MS,
+        'budget_latency_ms': metrics.get(budget_latency_key(database_name, mode)),
+    }
+
+    trial['within_budget'] = bool(
+        succeeded
+        and not metrics.get('records_failed')
+        and trial['budget_latency_ms'] is not None
+        and trial['budget_latency_ms'] <= LATENCY_BUDGET_MS
+    )
+    print(f" --> {trial['throughput_records_per_second']:.0f} r/s, latenza {LATENCY_PERCENTILE} "
+          f"{trial['budget_latency_ms'] or float('nan'):.1f} ms "
+          f"({'entro' if trial['within_budget'] else 'fuori'} budget)")
+    return trial
+
+
+"""  TUNING PER BACKEND  """
+
+def flush_stage_buffer_batches(batch_size):
+    """
+    Batch per richiesta nella fase del flush interval: TUNING_RECORDS record in batch da
+    batch_size vengono inviati in circa FLUSH_STAGE_FLUSHES svuotamenti del buffer.
+    """
+    return max(1, TUNING_RECORDS // (batch_size * FLUSH_STAGE_FLUSHES))
+
+
+def tune_backend(database_name, null_sink=None):
+    """
+    Cerca la configurazione migliore per un backend in due fasi:
+    1. dimensione del batch (con flush interval e page size di default)
+    2. flush interval per InfluxDB (con il buffer di flush_stage_buffer_batches, solo
+       sul server reale), oppure page size (fino alla dimensione del batch) per TimescaleDB
+       con execute_values, con la dimensione del batch trovata.
+    Ritorna (prova migliore, lista di tutte le prove).
+    """
+    mode = INFLUX_WRITE_MODE if database_name == 'InfluxDB' else TIMESCALE_INGEST_MODE
+
+    best_batch_size, batch_trials = adaptive_search(
+        lambda batch_size: run_tuning_trial(database_name, mode, 'batch_size', batch_size, null_sink=null_sink),
+        *BATCH_SIZE_RANGE
+    )
+    best = batch_trials[best_batch_size]
+    trials = list(batch_trials.values())
+
+    buffer_batches = flush_stage_buffer_batches(best_batch_size)
+    if database_name == 'InfluxDB' and mode != "synchronous" and null_sink:
+        print(" Backend nullo: il buffer della write API non è simulato, fase del flush interval saltata.")
+
+    elif database_name == 'InfluxDB' and mode != "synchronous" and buffer_batches < 2:
+        print(f" {TUNING_RECORDS} record in batch da {best_batch_size} non bastano per {FLUSH_STAGE_FLUSHES} "
+              f"svuotamenti del buffer: fase del flush interval saltata.")
+
+    elif database_name == 'InfluxDB' and mode != "synchronous":
+        best_flush_interval, flush_trials = adaptive_search(
+            lambda flush_interval: run_tuning_trial(
+                database_name, mode, 'flush_interval', best_batch_size, flush_interval=flush_interval,
+                null_sink=null_sink, buffer_batches=buffer_batches
+            ),
+            *FLUSH_INTERVAL_RANGE_MS
+        )
+        trials += flush_trials.values()
+        if trial_rank(flush_trials[best_flush_interval]) > trial_rank(best):
+            best = flush_trials[best_flush_interval]
+
+    elif database_name == 'TimescaleDB' and mode == "execute_values":
+        low, high = PAGE_SIZE_RANGE[0], min(PAGE_SIZE_RANGE[1], best_batch_size)
+        if low < high:
+            best_page_size, page_trials = adaptive_search(
+                lambda page_size: run_tuning_trial(
+                    database_name, mode, 'page_size', best_batch_size, page_size=page_size,
+                    null_sink=null_sink
+                ),
+                low, high
+            )
+            trials += page_trials.values()
+            if trial_rank(page_trials[best_page_size]) > trial_rank(best):
+                best = page_trials[best_page_size]
+
+    return best, trials
+
+
+def main():
+    """
+    Esegue il tuning su entrambi i database e salva la curva di risposta completa
+    (tabella 'tuning_trials') e la configurazione migliore per backend (tabella 'tuning_best').
+    """
+    results_store = get_results_store()
+    results_store.begin_run('tuning', module_config(globals()))
+
+    best_configs = []
+    for database_name in ('InfluxDB', 'TimescaleDB'):
+        best, trials = tune_backend(database_name, NULL_SINK_MODE)
+        for trial in trials:
+            results_store.add('tuning_trials', trial)
+        results_store.add('tuning_best', best)
+        best_configs.append(best)
+
+    results_store.flush()
+
+    print(f"\n Configurazioni migliori (budget {LATENCY_PERCENTILE} {LATENCY_BUDGET_MS} ms):")
+    for best in best_configs:
+        settings = f"batch {best['batch_size']}"
+        if best['database'] == 'InfluxDB':
+            settings += f", flush interval {best['flush_interval_ms']} ms, buffer {best.get('buffer_batches')} batch"
+        elif best['page_size'] is not None:
+            settings += f", page size {best['page_size']}"
+        note = "" if best['within_budget'] else " (nessuna configurazione entro il budget: latenza minima)"
+        print(f"  {best['database']} ({best['ingest_mode']}): {settings} --> "
+              f"{best['throughput_records_per_second']:.0f} r/s{note}")
+
+
+if __name__ == "__main__":
+    main()
+    analyze_and_plot_tuning()